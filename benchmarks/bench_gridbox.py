@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark for GridBox table extraction
+
+Builds a TableForm output cell with a large GridBox (50,000 rows by
+default) and times extract_gridbox_tables against the previous
+character-by-character implementation, reporting peak memory for each.
+
+Usage:
+    python benchmarks/bench_gridbox.py --rows 50000
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mathematica_to_latex import extract_gridbox_tables  # noqa: E402
+
+
+def build_table_cell(rows):
+    """Build a TableForm output cell with the given number of rows
+
+    Most rows hold strings and numbers; every tenth row has a RowBox cell
+    so the general box parser is exercised as well.
+    """
+    lines = ['Cell[BoxData[', ' TagBox[', '  TagBox[GridBox[{']
+    row_lines = []
+    for i in range(rows):
+        if i % 10:
+            third = f'"{i * 1.5e-3}"'
+        else:
+            third = f'RowBox[{{"x", "+", SuperscriptBox["y", "{i % 7}"]}}]'
+        row_lines.append(f'     {{"\\<\\"run {i}\\"\\>", "{i * 0.5}", {third}}}')
+    lines.append(',\n'.join(row_lines))
+    lines.append('    },')
+    lines.append('    GridBoxAlignment->{"Columns" -> {{Left}}, "Rows" -> {{Baseline}}}],')
+    lines.append('   Column],')
+    lines.append('  Function[BoxForm`e$, TableForm[BoxForm`e$]]]], "Output"]')
+    return '\n'.join(lines)
+
+
+def legacy_extract_gridbox_table(text):
+    """The previous implementation, kept here for comparison"""
+    gridbox_match = re.search(r'GridBox\[\{', text, re.DOTALL)
+    if not gridbox_match:
+        return None
+
+    start_pos = gridbox_match.end()
+    bracket_count = 1
+    pos = start_pos
+
+    while pos < len(text) and bracket_count > 0:
+        if text[pos] == '{':
+            bracket_count += 1
+        elif text[pos] == '}':
+            bracket_count -= 1
+        pos += 1
+
+    if bracket_count != 0:
+        return None
+
+    grid_content = text[start_pos:pos-1]
+    grid_content = re.sub(r'\\\n\s*', '', grid_content)
+
+    rows = []
+    bracket_count = 0
+    cell_start = 0
+
+    i = 0
+    while i < len(grid_content):
+        char = grid_content[i]
+
+        if char == '{':
+            if bracket_count == 0:
+                cell_start = i + 1
+            bracket_count += 1
+        elif char == '}':
+            bracket_count -= 1
+            if bracket_count == 0:
+                row_content = grid_content[cell_start:i]
+                cell_strings = re.findall(r'\\<\\"(.*?)\\"\\>', row_content, re.DOTALL)
+                if cell_strings:
+                    cells = []
+                    for cell in cell_strings:
+                        cell = cell.replace('\\n', '\n')
+                        cell = cell.replace('\\"', '"')
+                        cell = re.sub(r'\\!\\\\?\(\\\\?\*FormBox\[.*?TraditionalForm\]\\\\?\)',
+                                      '[formula]', cell, flags=re.DOTALL)
+                        cells.append(cell)
+                    rows.append(cells)
+
+        i += 1
+
+    return rows if rows else None
+
+
+def measure(function, text, repeat):
+    """Return (best seconds, peak traced bytes, result) for function(text)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(text)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark GridBox table extraction')
+    parser.add_argument('--rows', type=int, default=50000,
+                        help='Number of table rows (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timing repetitions, best is reported (default: %(default)s)')
+    args = parser.parse_args()
+
+    text = build_table_cell(args.rows)
+    print(f"Table cell: {args.rows} rows, {len(text) / 1e6:.1f} MB")
+
+    for name, function in (('legacy', legacy_extract_gridbox_table),
+                           ('tokenized', extract_gridbox_tables)):
+        seconds, peak, result = measure(function, text, args.repeat)
+        if name == 'tokenized':
+            rows = len(result[0]) if result else 0
+            columns = len(result[0][0]) if result else 0
+        else:
+            rows = len(result) if result else 0
+            columns = len(result[0]) if result else 0
+        print(f"{name:>10}: {seconds * 1000:8.1f} ms  peak {peak / 1e6:6.1f} MB  "
+              f"{rows} rows x {columns} columns extracted")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
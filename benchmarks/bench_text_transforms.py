@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the per-cell text transforms
+
+Builds a mix of text, printed-string, input and table-value cells and
+times each transform of the LaTeX converter (symbols, sub/superscripts,
+math spacing, text cleanup, input code) in cells per second, against the
+previous implementations: one uncompiled re.sub per pattern (23 for the
+Greek letters alone) and one str.replace per named character, run
+whether or not the text holds anything they could match. The outputs of
+both are compared before timing.
+
+Usage:
+    python benchmarks/bench_text_transforms.py --cells 20000
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import mathematica_to_latex  # noqa: E402
+from mathematica_to_latex import SYMBOL_MAP, clean_formbox_expressions  # noqa: E402
+
+
+TEXT_SAMPLES = [
+    'The pendulum swings with a period that depends only on its length.',
+    'For small angles \\[Theta] the motion is harmonic with frequency \\[Omega]x = Sqrt[g/L].',
+    'The energy levels are E = \\[HBar]\\[Omega](n + 1/2) \\[PlusMinus] \\[Delta]E',
+    'Let x\\[Subscript 0] be the initial position and v\\\\\\[Subscript 0] the velocity.',
+    'Superscript[x, 2] + Power[y, 3] \\[LessEqual] 10 and Subscript[a, n] \\[Rule] 0',
+    'Results:  \\[Alpha]\\[Beta] = 0.5,\tvalue \u2265 3 \u00d7 10 \\.b2\n\n\n\\sqrtN next\\',
+    'Problem 3',
+    '1.25',
+    '-4.0e-3',
+]
+
+INPUT_CELL = ('Cell[BoxData[RowBox[{RowBox[{"f", "[", "x_", "]"}], ":=", '
+              'RowBox[{"x", "^", "2"}]}]], "Input"]')
+INPUT_CELL_LONG = ('Cell[BoxData[{RowBox[{"sol", "=", RowBox[{"NDSolve", "[", '
+                   'RowBox[{RowBox[{"{", RowBox[{RowBox[{RowBox[{"x", "\'\'"}], "[", "t", "]"}], '
+                   '"==", RowBox[{"-", RowBox[{"Sin", "[", RowBox[{"x", "[", "t", "]"}], "]"}]}]}], '
+                   '"}"}], ",", "x", ",", RowBox[{"{", RowBox[{"t", ",", "0", ",", "10"}], "}"}]}], '
+                   '"]"}]}], ";", "\\[IndentingNewLine]", RowBox[{"Plot", "[", '
+                   'RowBox[{"x", "[", "t", "]"}], "]"}]}], "Input"]')
+PRINT_CELL = ('Cell[BoxData["\\<\\"The period is \\!\\(\\*FormBox[SubscriptBox[\\"T\\", \\"0\\"], '
+              'TraditionalForm]\\) = 2.006 s\\"\\>"], "Print"]')
+
+
+def build_cells(count):
+    """Return (texts, input cells, all cells) for count cells of each kind"""
+    texts = [TEXT_SAMPLES[i % len(TEXT_SAMPLES)] for i in range(count)]
+    inputs = [(INPUT_CELL, INPUT_CELL_LONG)[i % 2] for i in range(count)]
+    cells = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            cells.append(f'Cell[TextData[{{"{texts[i]}"}}], "Text"]'.replace('\\', '\\\\'))
+        elif kind == 1:
+            cells.append(inputs[i])
+        else:
+            cells.append(PRINT_CELL)
+    return texts, inputs, cells
+
+
+# The previous implementations, kept here for comparison
+
+def legacy_convert_subscripts(text):
+    text = re.sub(mathematica_to_latex.SUBSCRIPT_DOUBLE_BACKSLASH, r'_{\1}', text)
+    text = re.sub(mathematica_to_latex.SUBSCRIPT_WITH_BASE, r'\1_{\2}', text)
+    text = re.sub(mathematica_to_latex.SUBSCRIPT_FUNCTION, r'\1_{\2}', text)
+    return text
+
+
+def legacy_convert_superscripts(text):
+    text = re.sub(r'Superscript\[([^,]+),\s*([^\]]+)\]', r'\1^{\2}', text)
+    text = re.sub(r'Power\[([^,]+),\s*([^\]]+)\]', r'\1^{\2}', text)
+    return text
+
+
+def legacy_convert_symbols(text):
+    for math_symbol, latex_symbol in SYMBOL_MAP.items():
+        if math_symbol in [r'\[PlusMinus]', r'\[MinusPlus]', r'\[Times]',
+                           r'\[LessEqual]', r'\[GreaterEqual]', r'\[NotEqual]']:
+            text = text.replace(math_symbol, latex_symbol + ' ')
+        else:
+            text = text.replace(math_symbol, latex_symbol)
+    text = re.sub(r'\\\.b(\d)', r'^{\1}', text)
+    for character, latex in (('≥', r'\geq '), ('≤', r'\leq '), ('±', r'\pm '), ('×', r'\times '),
+                             ('÷', r'\div '), ('≠', r'\neq '), ('∞', r'\infty'),
+                             ('∂', r'\partial'), ('∫', r'\int'), ('∑', r'\sum'),
+                             ('∏', r'\prod'), ('√', r'\sqrt')):
+        text = text.replace(character, latex)
+    return text
+
+
+def legacy_fix_math_spacing(text):
+    greek_letters = [
+        'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta',
+        'theta', 'iota', 'kappa', 'lambda', 'mu', 'nu', 'xi',
+        'pi', 'rho', 'sigma', 'tau', 'upsilon', 'phi', 'chi',
+        'psi', 'omega'
+    ]
+    for letter in greek_letters:
+        text = re.sub(rf'(\\{letter})([a-z])', r'\1 \2', text)
+    text = re.sub(r'\\sqrt([A-Za-z])', r'\\sqrt{\1}', text)
+    return text
+
+
+def legacy_convert_text(content):
+    content = clean_formbox_expressions(content)
+    content = legacy_convert_symbols(content)
+    content = legacy_convert_subscripts(content)
+    content = legacy_convert_superscripts(content)
+    content = legacy_fix_math_spacing(content)
+    content = re.sub(r'\\\$', '', content)
+    content = re.sub(r'\\\s*$', '', content)
+    content = re.sub(r'\\$', '', content)
+    content = re.sub(r'[ \t]+', ' ', content)
+    content = re.sub(r'\n\n+', '\n\n', content)
+    return content.strip()
+
+
+def legacy_extract_input_code(cell_text):
+    code_parts = []
+    matches = re.findall(r'"([^"\\]*(?:\\.[^"\\]*)*)"', cell_text)
+    for match in matches:
+        if match in ['Input', 'Code', 'Bold', 'Italic'] or match.startswith('FontWeight'):
+            continue
+        if not match or match.isspace():
+            continue
+        cleaned = match.replace('\\n', '\n')
+        cleaned = cleaned.replace('\\"', '"')
+        cleaned = re.sub(r'\[IndentingNewLine\]', '\n', cleaned)
+        cleaned = re.sub(r'\[?Continuation\]?', '', cleaned)
+        cleaned = cleaned.replace('\\[', '[')
+        cleaned = cleaned.replace('\\]', ']')
+        cleaned = cleaned.replace('\\(', '(')
+        cleaned = cleaned.replace('\\)', ')')
+        if cleaned.strip():
+            code_parts.append(cleaned)
+    if code_parts:
+        result = ' '.join(code_parts)
+        result = re.sub(r' +', ' ', result)
+        result = re.sub(r' *\n *', '\n', result)
+        return result
+    return ''
+
+
+LEGACY_FUNCTIONS = {
+    'convert_symbols': legacy_convert_symbols,
+    'convert_subscripts': legacy_convert_subscripts,
+    'convert_superscripts': legacy_convert_superscripts,
+    'fix_math_spacing': legacy_fix_math_spacing,
+    'convert_text': legacy_convert_text,
+    'extract_input_code': legacy_extract_input_code,
+}
+
+
+def use_legacy(enabled, saved={}):
+    """Swap the legacy functions into the module (so process_cell_content uses them)"""
+    if not saved:
+        saved.update((name, getattr(mathematica_to_latex, name)) for name in LEGACY_FUNCTIONS)
+    for name in LEGACY_FUNCTIONS:
+        setattr(mathematica_to_latex, name, (LEGACY_FUNCTIONS if enabled else saved)[name])
+
+
+def measure(function, inputs, repeat):
+    """Return (best seconds, results) for function applied to every input"""
+    best = float('inf')
+    results = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [function(text) for text in inputs]
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark the per-cell text transforms')
+    parser.add_argument('--cells', type=int, default=20000,
+                        help='Number of cells per benchmark (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timing repetitions, best is reported (default: %(default)s)')
+    args = parser.parse_args()
+
+    texts, inputs, cells = build_cells(args.cells)
+    benchmarks = [(name, inputs if name == 'extract_input_code' else texts)
+                  for name in LEGACY_FUNCTIONS]
+    benchmarks.append(('process_cell_content', cells))
+
+    print(f"{'function':>22}  {'legacy cells/s':>15}  {'current cells/s':>15}  speedup")
+    failed = False
+    for name, data in benchmarks:
+        use_legacy(True)
+        legacy_seconds, legacy_results = measure(getattr(mathematica_to_latex, name), data,
+                                                 args.repeat)
+        use_legacy(False)
+        seconds, results = measure(getattr(mathematica_to_latex, name), data, args.repeat)
+        same = results == legacy_results
+        failed = failed or not same
+        print(f"{name:>22}  {len(data) / legacy_seconds:15,.0f}  {len(data) / seconds:15,.0f}  "
+              f"{legacy_seconds / seconds:6.1f}x{'' if same else '  OUTPUT DIFFERS'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
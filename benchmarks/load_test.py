@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Load test for the web GUI
+
+Posts a notebook to the /convert endpoint of a running instance from
+several concurrent clients and reports throughput and latency.
+
+Each request uploads a slightly different copy of the notebook (a
+trailing comment with the request number), so the server converts every
+request instead of answering from its result cache; pass --same-payload
+to measure cache hits instead. Requests are spread over --clients client
+identities with X-Forwarded-For, which the server only honors when it is
+started with MTL_TRUSTED_PROXIES=1; otherwise all requests come from one
+client and the per-client admission limit rejects most of them. Requests
+rejected with 429 are reported separately from failures.
+
+Usage:
+    MTL_TRUSTED_PROXIES=1 gunicorn -c gunicorn.conf.py wsgi:app &
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 \\
+        --file examples/physics_example.nb --requests 500 --concurrency 16
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_multipart(file_data, filename, output_format):
+    """Build a multipart/form-data body for the /convert endpoint"""
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\n'.encode(),
+        b'Content-Disposition: form-data; name="format"\r\n\r\n',
+        output_format.encode(), b'\r\n',
+        f'--{boundary}\r\n'.encode(),
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode(),
+        b'Content-Type: application/octet-stream\r\n\r\n',
+        file_data, b'\r\n',
+        f'--{boundary}--\r\n'.encode(),
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def send_request(url, body, content_type, timeout, client=None):
+    """Send one conversion request and return (ok, status, seconds)"""
+    request = urllib.request.Request(url, data=body, method='POST')
+    request.add_header('Content-Type', content_type)
+    if client:
+        request.add_header('X-Forwarded-For', client)
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read())
+            ok = bool(payload.get('success'))
+            status = response.status
+    except urllib.error.HTTPError as e:
+        ok, status = False, e.code
+    except Exception:
+        ok, status = False, None
+    return ok, status, time.perf_counter() - start
+
+
+def percentile(sorted_values, fraction):
+    """Return the given percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Load test the web GUI conversion endpoint')
+    parser.add_argument('--url', default='http://127.0.0.1:8000',
+                        help='Base URL of a running instance (default: %(default)s)')
+    parser.add_argument('--file', default=os.path.join('examples', 'physics_example.nb'),
+                        help='Notebook to upload (default: %(default)s)')
+    parser.add_argument('--format', default='both', choices=['latex', 'markdown', 'both'],
+                        help='Output format to request (default: %(default)s)')
+    parser.add_argument('-n', '--requests', type=int, default=200,
+                        help='Total number of requests (default: %(default)s)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8,
+                        help='Number of concurrent clients (default: %(default)s)')
+    parser.add_argument('--clients', type=int, default=None,
+                        help='Distinct client addresses sent as X-Forwarded-For '
+                             '(default: --concurrency; 0 sends no header)')
+    parser.add_argument('--same-payload', action='store_true',
+                        help='Upload identical bytes every time (measures result cache hits)')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='Per-request timeout in seconds (default: %(default)s)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"Error: File not found: {args.file}", file=sys.stderr)
+        return 1
+
+    url = args.url.rstrip('/') + '/convert'
+    with open(args.file, 'rb') as f:
+        file_data = f.read()
+    filename = os.path.basename(args.file)
+    clients = args.concurrency if args.clients is None else args.clients
+    run_id = uuid.uuid4().hex
+
+    def request_body(index):
+        if args.same_payload:
+            return build_multipart(file_data, filename, args.format)
+        marker = f'\n(* load test {run_id} request {index} *)\n'.encode()
+        return build_multipart(file_data + marker, filename, args.format)
+
+    def client_address(index):
+        if not clients:
+            return None
+        client = index % clients
+        return f'10.{client >> 16 & 255}.{client >> 8 & 255}.{client & 255}'
+
+    # Build every body up front so request building is not timed
+    requests = [request_body(index) + (client_address(index),) for index in range(args.requests)]
+
+    # One warm-up request so connection setup and first-request work are excluded
+    send_request(url, *request_body('warm-up'), args.timeout)
+
+    print(f"Sending {args.requests} requests to {url} with {args.concurrency} concurrent "
+          f"connections from {clients or 1} client(s)...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(
+            lambda item: send_request(url, item[0], item[1], args.timeout, item[2]),
+            requests
+        ))
+    elapsed = time.perf_counter() - start
+
+    completed = [seconds for ok, _, seconds in results if ok]
+    rejected = [status for ok, status, _ in results if status == 429]
+    failures = [status for ok, status, _ in results if not ok and status != 429]
+    latencies = sorted(completed)
+
+    print(f"Completed:    {len(completed)}/{len(results)} successful")
+    print(f"Rejected:     {len(rejected)} with 429 (admission limits)")
+    print(f"Elapsed:      {elapsed:.2f} s")
+    print(f"Throughput:   {len(completed) / elapsed:.1f} conversions/sec")
+    print(f"Latency p50:  {percentile(latencies, 0.50) * 1000:.1f} ms")
+    print(f"Latency p95:  {percentile(latencies, 0.95) * 1000:.1f} ms")
+    print(f"Latency p99:  {percentile(latencies, 0.99) * 1000:.1f} ms")
+    if failures:
+        statuses = {}
+        for status in failures:
+            statuses[status] = statuses.get(status, 0) + 1
+        print(f"Failures by status: {statuses}")
+
+    return 0 if not failures else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration for the web GUI
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings can be overridden with environment variables:
+    MTL_BIND     - address to listen on (default: 127.0.0.1:8000)
+    MTL_WORKERS  - number of worker processes (default: number of CPUs)
+    MTL_THREADS  - request threads per worker process (default: 32)
+    MTL_TIMEOUT  - worker timeout in seconds (default: 120)
+    MTL_TRUSTED_PROXIES - proxies whose X-Forwarded-For is trusted (read by wsgi.py, default: 0)
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('MTL_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('MTL_WORKERS', multiprocessing.cpu_count()))
+
+# Threaded workers: each process handles many requests at once, so its
+# admission controller (MAX_CONVERSIONS_IN_FLIGHT running, up to
+# MAX_QUEUED_CONVERSIONS waiting, per-client limit) sees concurrent requests
+# and answers 429 itself. With 'sync' workers every process only ever
+# holds one request and the limits never engage. Keep threads above
+# in-flight + queued so excess requests reach the controller instead of
+# waiting unseen in the accept backlog.
+worker_class = 'gthread'
+threads = int(os.environ.get('MTL_THREADS', 32))
+timeout = int(os.environ.get('MTL_TIMEOUT', 120))
+
+# Import wsgi.py (and warm the converter) once in the master before forking
+preload_app = True
+
+# Recycle workers periodically to bound memory growth from large uploads
+max_requests = 1000
+max_requests_jitter = 100
@@ -5,7 +5,90 @@ Converts Mathematica notebook files (.nb) to LaTeX and Markdown formats
 
 import re
 import os
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
+
+from mathematica_to_latex import (CELL_STYLE_COMMANDS, TEXT_CELL_STYLES, ByteOffsets,
+                                  PayloadIndex, cell_plain_text, file_byte_offsets,
+                                  is_graphics_cell, iter_cells, notebook_cell_tree,
+                                  notebook_content_end)
+
+# Remaining \Name markers after symbol replacement
+SPECIAL_MARKER_PATTERN = re.compile(r'\\[A-Z][a-z]+')
+
+# Common Mathematica symbols and their LaTeX equivalents
+SYMBOL_REPLACEMENTS = {
+    '\\[Alpha]': '\\alpha',
+    '\\[Beta]': '\\beta',
+    '\\[Gamma]': '\\gamma',
+    '\\[Delta]': '\\delta',
+    '\\[Epsilon]': '\\epsilon',
+    '\\[Pi]': '\\pi',
+    '\\[Sigma]': '\\sigma',
+    '\\[Theta]': '\\theta',
+    '\\[Lambda]': '\\lambda',
+    '\\[Mu]': '\\mu',
+    '\\[Nu]': '\\nu',
+    '\\[Rho]': '\\rho',
+    '\\[Tau]': '\\tau',
+    '\\[Phi]': '\\phi',
+    '\\[Chi]': '\\chi',
+    '\\[Psi]': '\\psi',
+    '\\[Omega]': '\\omega',
+    '\\[Infinity]': '\\infty',
+    '\\[Integral]': '\\int',
+    '\\[LessEqual]': '\\leq',
+    '\\[GreaterEqual]': '\\geq',
+    '\\[NotEqual]': '\\neq',
+    '\\[PlusMinus]': '\\pm',
+    '\\[Rule]': '\\rightarrow',
+    '\\[HBar]': '\\hbar',
+    '\\[ExponentialE]': 'e',
+    '\\[DifferentialD]': 'd',
+    '\\[Equal]': '=',
+    '\\[IndentingNewLine]': '\n',
+}
+SYMBOL_REPLACEMENT_PATTERN = re.compile('|'.join(map(re.escape, SYMBOL_REPLACEMENTS)))
+
+# Tiny notebook used to exercise every conversion path once in warm_up()
+_WARM_UP_NOTEBOOK = '''Notebook[{
+Cell["Problem 1: Section heading", "Section"],
+Cell["The angle \\[Theta] satisfies x \\[LessEqual] \\[Pi]", "Text"]
+}]
+'''
+
+
+def warm_up():
+    """Build all lazily-initialized conversion state in the current process
+
+    Runs a tiny conversion through every output format so that all
+    patterns, symbol tables and the ``re`` module cache are populated.
+    Call this in a pre-forking server's master process (e.g. gunicorn with
+    ``preload_app = True``) so workers share the state copy-on-write
+    instead of each rebuilding it on their first request.
+    """
+    converter = MathematicaConverter()
+    converter.content = _WARM_UP_NOTEBOOK
+    converter.convert_to_latex()
+    converter.convert_to_markdown()
+
+
+def convert_notebook_content(content: str, output_format: str = 'both') -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Convert notebook text without touching the file system
+    
+    A module-level function so it can be submitted to a process pool.
+    
+    Args:
+        content: Text of a .nb file
+        output_format: 'latex', 'markdown', or 'both'
+        
+    Returns:
+        Tuple of (outputs keyed by 'latex'/'markdown', cell counts by type)
+    """
+    converter = MathematicaConverter()
+    converter.content = content
+    outputs = converter.convert(output_format)
+    return outputs, converter.cell_counts
 
 
 class MathematicaConverter:
@@ -13,40 +96,86 @@ class MathematicaConverter:
     
     def __init__(self):
         self.content = ""
+        self.file_size = None  # size in bytes of the file content was read from
         self.cells = []
+        self.cell_styles = []  # style of each cell ('Section', 'Input', ...; None if unstyled)
+        self.cell_spans = []  # (start, end) of each cell in content
+        self.cell_counts = {}  # cells rendered by the last conversion, by type
         
     def read_notebook(self, filepath: str) -> bool:
         """Read a Mathematica notebook file"""
         try:
             with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
                 self.content = f.read()
+            self.file_size = os.path.getsize(filepath)
             return True
         except Exception as e:
             print(f"Error reading file: {e}")
             return False
     
     def parse_cells(self):
-        """Extract cells from the notebook"""
-        # This is a simplified parser for Mathematica notebooks
-        # Real notebooks use a complex nested structure
+        """Extract the text of each cell with the notebook's cell walker
+
+        Only the strings in a cell's content are read, in place: style names,
+        option values, CompressedData payloads and graphics cells are skipped
+        without being copied.
+        """
         self.cells = []
+        self.cell_styles = []
+        self.cell_spans = []
         
-        # Extract string literals which contain the actual content
-        # Pattern to find quoted strings
-        string_pattern = r'"([^"\\]*(\\.[^"\\]*)*)"'
-        
-        matches = re.findall(string_pattern, self.content)
-        for match in matches:
-            text = match[0] if isinstance(match, tuple) else match
-            # Filter out short strings and metadata
-            if text and len(text.strip()) > 5 and not text.startswith('\\['):
-                # Skip if it's just formatting/metadata
-                if any(keyword in text for keyword in ['CellGroupData', 'CellFrame', 'StyleData']):
-                    continue
+        content = self.content
+        payloads = PayloadIndex(content, 0, notebook_content_end(content))
+        for cell in iter_cells(notebook_cell_tree(content, payloads)):
+            if is_graphics_cell(content, cell):
+                continue
+            text = cell_plain_text(content, cell, unicode=False, payloads=payloads)
+            if text.strip():
                 self.cells.append(text)
+                self.cell_styles.append(cell.style)
+                self.cell_spans.append((cell.start, cell.end))
+    
+    def _classified_cells(self) -> List[Tuple[str, str]]:
+        """Parse the cells once and return (cell type, cleaned text) for each non-empty cell
+
+        Also counts the cells by type in cell_counts
+        """
+        self.parse_cells()
+        self.cell_counts = {}
+        classified = []
+        for cell, style in zip(self.cells, self.cell_styles):
+            # Clean up the cell content
+            cleaned = self._clean_mathematica_syntax(cell)
+            if cleaned:
+                cell_type = self._classify_cell(style, cleaned)
+                self.cell_counts[cell_type] = self.cell_counts.get(cell_type, 0) + 1
+                classified.append((cell_type, cleaned))
+        return classified
+    
+    def convert(self, output_format: str = 'both') -> Dict[str, str]:
+        """
+        Convert parsed content to 'latex', 'markdown' or 'both'
+
+        The notebook is parsed once and every requested format is rendered
+        from the same cells.
+
+        Returns:
+            Outputs keyed by 'latex'/'markdown'
+        """
+        classified = self._classified_cells()
+        outputs = {}
+        if output_format in ['latex', 'both']:
+            outputs['latex'] = self._render_latex(classified)
+        if output_format in ['markdown', 'both']:
+            outputs['markdown'] = self._render_markdown(classified)
+        return outputs
     
     def convert_to_latex(self) -> str:
         """Convert parsed content to LaTeX format"""
+        return self._render_latex(self._classified_cells())
+    
+    def _render_latex(self, classified: List[Tuple[str, str]]) -> str:
+        """Render classified cells as a LaTeX document"""
         latex_output = []
         latex_output.append("\\documentclass{article}")
         latex_output.append("\\usepackage{amsmath}")
@@ -54,50 +183,87 @@ class MathematicaConverter:
         latex_output.append("\\begin{document}")
         latex_output.append("")
         
-        self.parse_cells()
-        
-        for cell in self.cells:
-            # Clean up the cell content
-            cleaned = self._clean_mathematica_syntax(cell)
-            if cleaned:
-                # Try to detect if it's a title/section
-                if any(keyword in cell.lower() for keyword in ['part', 'section', 'problem']):
-                    latex_output.append(f"\\section{{{cleaned}}}")
-                else:
-                    # Check if it contains math symbols
-                    if self._contains_math(cleaned):
-                        latex_output.append("\\[")
-                        latex_output.append(cleaned)
-                        latex_output.append("\\]")
-                    else:
-                        latex_output.append(cleaned)
-                latex_output.append("")
+        for cell_type, cleaned in classified:
+            latex_output.append(self._cell_latex(cell_type, cleaned))
+            latex_output.append("")
         
         latex_output.append("\\end{document}")
         return "\n".join(latex_output)
     
+    def _cell_latex(self, cell_type: str, cleaned: str) -> str:
+        """Render one classified cell as LaTeX"""
+        if cell_type == 'section':
+            return f"\\section{{{cleaned}}}"
+        if cell_type == 'math':
+            return f"\\[\n{cleaned}\n\\]"
+        return cleaned
+    
+    def iter_records(self) -> Iterator[Dict[str, object]]:
+        """
+        Yield one JSON-ready record per cell, converting cells as they are yielded
+        
+        Records have the same keys as the LaTeX converter's NDJSON output:
+        type ('section', 'math' or 'text'), style, start/end byte offsets of
+        the cell in the notebook file, text, latex, code and table (code
+        and table are always None here).
+        """
+        self.parse_cells()
+        self.cell_counts = {}
+        # Offsets in the file read_notebook read, CRLF line endings included
+        byte_offset = None
+        if self.file_size is not None:
+            byte_offset = file_byte_offsets(self.content, self.file_size)
+        if byte_offset is None:
+            byte_offset = ByteOffsets(self.content)
+        
+        for cell, style, (start, end) in zip(self.cells, self.cell_styles, self.cell_spans):
+            cleaned = self._clean_mathematica_syntax(cell)
+            if not cleaned:
+                continue
+            cell_type = self._classify_cell(style, cleaned)
+            self.cell_counts[cell_type] = self.cell_counts.get(cell_type, 0) + 1
+            yield {
+                'type': cell_type,
+                'style': style,
+                'start': byte_offset(start),
+                'end': byte_offset(end),
+                'text': cleaned,
+                'latex': self._cell_latex(cell_type, cleaned),
+                'code': None,
+                'table': None,
+            }
+    
+    def iter_ndjson(self) -> Iterator[str]:
+        """Yield newline-delimited JSON lines, one per cell, as cells are converted"""
+        import json
+        for record in self.iter_records():
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+    
+    def convert_to_ndjson(self) -> str:
+        """Convert parsed content to newline-delimited JSON, one record per cell
+
+        Holds the whole output in memory; use iter_ndjson to stream it
+        """
+        return ''.join(self.iter_ndjson())
+    
     def convert_to_markdown(self) -> str:
         """Convert parsed content to Markdown format"""
+        return self._render_markdown(self._classified_cells())
+    
+    def _render_markdown(self, classified: List[Tuple[str, str]]) -> str:
+        """Render classified cells as a Markdown document"""
         markdown_output = []
         markdown_output.append("# Mathematica Notebook Conversion")
         markdown_output.append("")
         
-        self.parse_cells()
-        
-        for cell in self.cells:
-            # Clean up the cell content
-            cleaned = self._clean_mathematica_syntax(cell)
-            if cleaned:
-                # Try to detect if it's a title/section
-                if any(keyword in cell.lower() for keyword in ['part', 'section', 'problem']):
-                    markdown_output.append(f"## {cleaned}")
-                else:
-                    # Check if it contains math symbols
-                    if self._contains_math(cleaned):
-                        markdown_output.append(f"$${cleaned}$$")
-                    else:
-                        markdown_output.append(cleaned)
-                markdown_output.append("")
+        for cell_type, cleaned in classified:
+            if cell_type == 'section':
+                markdown_output.append(f"## {cleaned}")
+            elif cell_type == 'math':
+                markdown_output.append(f"$${cleaned}$$")
+            else:
+                markdown_output.append(cleaned)
+            markdown_output.append("")
         
         return "\n".join(markdown_output)
     
@@ -108,46 +274,35 @@ class MathematicaConverter:
         text = text.replace('\\n', ' ')
         text = text.replace('\\t', ' ')
         
-        # Convert common Mathematica symbols to LaTeX
-        replacements = {
-            '\\[Alpha]': '\\alpha',
-            '\\[Beta]': '\\beta',
-            '\\[Gamma]': '\\gamma',
-            '\\[Delta]': '\\delta',
-            '\\[Epsilon]': '\\epsilon',
-            '\\[Pi]': '\\pi',
-            '\\[Sigma]': '\\sigma',
-            '\\[Theta]': '\\theta',
-            '\\[Lambda]': '\\lambda',
-            '\\[Mu]': '\\mu',
-            '\\[Nu]': '\\nu',
-            '\\[Rho]': '\\rho',
-            '\\[Tau]': '\\tau',
-            '\\[Phi]': '\\phi',
-            '\\[Chi]': '\\chi',
-            '\\[Psi]': '\\psi',
-            '\\[Omega]': '\\omega',
-            '\\[Infinity]': '\\infty',
-            '\\[Integral]': '\\int',
-            '\\[LessEqual]': '\\leq',
-            '\\[GreaterEqual]': '\\geq',
-            '\\[NotEqual]': '\\neq',
-            '\\[PlusMinus]': '\\pm',
-            '\\[Rule]': '\\rightarrow',
-            '\\[IndentingNewLine]': '\n',
-        }
-        
-        for mathematica_sym, latex_sym in replacements.items():
-            text = text.replace(mathematica_sym, latex_sym)
-        
-        # Remove remaining special markers
-        text = re.sub(r'\\[A-Z][a-z]+', '', text)
+        if '\\' in text:
+            # Convert common Mathematica symbols to LaTeX
+            if '\\[' in text:
+                text = SYMBOL_REPLACEMENT_PATTERN.sub(
+                    lambda match: SYMBOL_REPLACEMENTS[match.group()], text)
+            
+            # Remove remaining special markers
+            text = SPECIAL_MARKER_PATTERN.sub('', text)
         
         # Clean up whitespace
         text = ' '.join(text.split())
         
         return text.strip()
     
+    def _classify_cell(self, style: str, cleaned: str) -> str:
+        """Classify a cell as 'section', 'math' or 'text' from its style and text"""
+        if style in CELL_STYLE_COMMANDS:
+            return 'section'
+        if style in TEXT_CELL_STYLES:
+            return 'text'
+        # Unstyled cells: try to detect if it's a title/section
+        if style is None and any(keyword in cleaned.lower()
+                                 for keyword in ['part', 'section', 'problem']):
+            return 'section'
+        # Check if it contains math symbols
+        if self._contains_math(cleaned):
+            return 'math'
+        return 'text'
+    
     def _contains_math(self, text: str) -> bool:
         """Check if text contains mathematical symbols"""
         math_indicators = ['\\', '=', '^', '_', 'int', 'sum', 'frac', 
@@ -161,7 +316,7 @@ class MathematicaConverter:
         
         Args:
             input_path: Path to input .nb file
-            output_format: 'latex', 'markdown', or 'both'
+            output_format: 'latex', 'markdown', 'both', or 'ndjson'
             output_dir: Output directory (default: same as input)
             
         Returns:
@@ -182,9 +337,12 @@ class MathematicaConverter:
         
         results = []
         
+        # Parse once for LaTeX and Markdown
+        outputs = self.convert(output_format) if output_format in ['latex', 'markdown', 'both'] else {}
+        
         # Convert to LaTeX
-        if output_format in ['latex', 'both']:
-            latex_content = self.convert_to_latex()
+        if 'latex' in outputs:
+            latex_content = outputs['latex']
             latex_path = os.path.join(output_dir, f"{base_name}.tex")
             try:
                 with open(latex_path, 'w', encoding='utf-8') as f:
@@ -193,9 +351,19 @@ class MathematicaConverter:
             except Exception as e:
                 return False, f"Failed to write LaTeX file: {e}"
         
+        # Convert to NDJSON
+        if output_format == 'ndjson':
+            ndjson_path = os.path.join(output_dir, f"{base_name}.ndjson")
+            try:
+                with open(ndjson_path, 'w', encoding='utf-8') as f:
+                    f.writelines(self.iter_ndjson())
+                results.append(f"NDJSON: {ndjson_path}")
+            except Exception as e:
+                return False, f"Failed to write NDJSON file: {e}"
+        
         # Convert to Markdown
-        if output_format in ['markdown', 'both']:
-            markdown_content = self.convert_to_markdown()
+        if 'markdown' in outputs:
+            markdown_content = outputs['markdown']
             markdown_path = os.path.join(output_dir, f"{base_name}.md")
             try:
                 with open(markdown_path, 'w', encoding='utf-8') as f:
@@ -213,7 +381,7 @@ if __name__ == "__main__":
     
     if len(sys.argv) < 2:
         print("Usage: python mathematica_converter.py <input.nb> [output_format] [output_dir]")
-        print("  output_format: latex, markdown, or both (default: both)")
+        print("  output_format: latex, markdown, both, or ndjson (default: both)")
         print("  output_dir: output directory (default: same as input)")
         sys.exit(1)
     
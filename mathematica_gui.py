@@ -6,8 +6,10 @@ A user-friendly interface for converting Mathematica notebooks to LaTeX with adv
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
+import queue
 import sys
 import threading
+from concurrent.futures import FIRST_COMPLETED, wait
 from pathlib import Path
 
 # Check Python version
@@ -31,6 +33,149 @@ except ImportError as e:
     sys.exit(1)
 
 
+def convert_notebook_file(input_file, options):
+    """Convert one notebook in a worker process (or thread)
+
+    Args:
+        input_file: Path to the .nb file
+        options: Keyword arguments for convert_notebook_to_latex, or None
+            for a basic conversion
+
+    Returns:
+        Tuple of (latex_content, warning) where warning is None unless the
+        advanced options had to be dropped
+    """
+    if options:
+        try:
+            return mathematica_to_latex.convert_notebook_to_latex(input_file, **options), None
+        except TypeError as e:
+            # Function signature mismatch - try basic call
+            warning = f"Parameter error, using basic conversion: {e}"
+            return mathematica_to_latex.convert_notebook_to_latex(input_file), warning
+    return mathematica_to_latex.convert_notebook_to_latex(input_file), None
+
+
+class LatexPreview:
+    """Read-only LaTeX preview of one notebook that follows changes on disk
+    
+    The notebook is converted on a background thread, reusing a per-cell
+    cache so that only changed cells are reconverted when the file is saved
+    again. The result is inserted into the text widget in chunks from
+    root.after callbacks, so huge outputs never block the UI.
+    """
+    
+    CHUNK_SIZE = 64 * 1024     # characters inserted per UI tick
+    POLL_INTERVAL_MS = 250     # how often to check for results and file changes
+    
+    def __init__(self, root, parent):
+        self.root = root
+        
+        self.status = ttk.Label(parent, text="Select a notebook in the list above to preview its LaTeX")
+        self.status.grid(row=0, column=0, sticky=tk.W, pady=(5, 2))
+        
+        self.text = scrolledtext.ScrolledText(
+            parent,
+            height=15,
+            width=90,
+            wrap=tk.NONE,
+            state='disabled'
+        )
+        self.text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        self.path = None
+        self.mtime = None
+        self.cell_cache = {}
+        self.results = queue.Queue()
+        self.worker = None
+        self.render_pending = False
+        self.fill_generation = 0
+        
+        self.root.after(self.POLL_INTERVAL_MS, self.poll)
+    
+    def show(self, path):
+        """Start previewing a notebook"""
+        if path == self.path:
+            return
+        self.path = path
+        self.mtime = None
+        self.cell_cache = {}
+        self.check_file()
+    
+    def check_file(self):
+        """Re-render if the previewed notebook changed on disk"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self.status.config(text=f"File not found: {os.path.basename(self.path)}")
+            return
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.start_render()
+    
+    def start_render(self):
+        """Convert the notebook on a background thread (one render at a time)"""
+        if self.worker is not None and self.worker.is_alive():
+            self.render_pending = True
+            return
+        self.status.config(text=f"Rendering {os.path.basename(self.path)}...")
+        self.worker = threading.Thread(target=self.render, args=(self.path, self.cell_cache))
+        self.worker.daemon = True
+        self.worker.start()
+    
+    def render(self, path, cell_cache):
+        """Convert a notebook (runs in separate thread)"""
+        try:
+            latex = mathematica_to_latex.convert_notebook_to_latex(path, cell_cache=cell_cache)
+            self.results.put((path, latex, None))
+        except Exception as e:
+            self.results.put((path, None, e))
+    
+    def poll(self):
+        """Pick up finished renders and watch the file (runs on the UI thread)"""
+        try:
+            while True:
+                path, latex, error = self.results.get_nowait()
+                if path != self.path:
+                    continue  # selection changed while rendering
+                if error is not None:
+                    self.status.config(text=f"Preview failed: {error}")
+                else:
+                    self.fill(latex)
+        except queue.Empty:
+            pass
+        
+        if self.render_pending and not (self.worker and self.worker.is_alive()):
+            self.render_pending = False
+            self.start_render()
+        elif self.path:
+            self.check_file()
+        
+        self.root.after(self.POLL_INTERVAL_MS, self.poll)
+    
+    def fill(self, latex):
+        """Replace the preview text, inserting it a chunk at a time"""
+        self.fill_generation += 1
+        scroll_position = self.text.yview()[0]
+        self.text.config(state='normal')
+        self.text.delete('1.0', tk.END)
+        self.insert_chunk(latex, 0, self.fill_generation, scroll_position)
+    
+    def insert_chunk(self, latex, start, generation, scroll_position):
+        """Insert the next chunk, then reschedule until the text is complete"""
+        if generation != self.fill_generation:
+            return  # a newer render replaced this one
+        end = start + self.CHUNK_SIZE
+        self.text.insert(tk.END, latex[start:end])
+        if end < len(latex):
+            self.status.config(text=f"Loading preview... {end * 100 // len(latex)}%")
+            self.root.after(1, self.insert_chunk, latex, end, generation, scroll_position)
+        else:
+            self.text.config(state='disabled')
+            self.text.yview_moveto(scroll_position)
+            self.status.config(text=f"{os.path.basename(self.path)} - {len(latex)} characters "
+                                    "(updates automatically when the file changes)")
+
+
 class MathematicaConverterGUI:
     """GUI application for Mathematica to LaTeX conversion"""
     
@@ -46,6 +191,11 @@ class MathematicaConverterGUI:
         self.display_mode = tk.StringVar(value="both")
         self.auto_extract_graphics = tk.BooleanVar(value=False)
         
+        # Conversion state shared with the worker thread
+        self.events = queue.Queue()  # (kind, payload) messages for the UI thread
+        self.cancel_event = threading.Event()
+        self.conversion_running = False
+        
         # Check if advanced features are available
         self.supports_display_mode = self._check_function_parameters()
         
@@ -202,34 +352,61 @@ class MathematicaConverterGUI:
         )
         self.convert_button.grid(row=0, column=0, padx=5)
         
+        self.cancel_button = ttk.Button(
+            button_frame, 
+            text="Cancel", 
+            command=self.cancel_conversion,
+            state='disabled'
+        )
+        self.cancel_button.grid(row=0, column=1, padx=5)
+        
         self.clear_button = ttk.Button(
             button_frame, 
             text="Clear", 
             command=self.clear_fields
         )
-        self.clear_button.grid(row=0, column=1, padx=5)
+        self.clear_button.grid(row=0, column=2, padx=5)
+        
+        # Progress bar (one step per converted file)
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.grid(row=8, column=0, pady=10)
         
-        # Progress bar
         self.progress = ttk.Progressbar(
-            main_frame, 
-            mode='indeterminate', 
+            progress_frame, 
+            mode='determinate', 
             length=400
         )
-        self.progress.grid(row=8, column=0, pady=10)
+        self.progress.grid(row=0, column=0)
+        
+        self.progress_label = ttk.Label(progress_frame, text="")
+        self.progress_label.grid(row=0, column=1, padx=10)
         
-        # Status/Output area
-        status_label = ttk.Label(main_frame, text="Status & Output:")
-        status_label.grid(row=9, column=0, sticky=tk.W, pady=5)
+        # Status/Output and preview tabs
+        output_tabs = ttk.Notebook(main_frame)
+        output_tabs.grid(row=10, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        main_frame.rowconfigure(10, weight=1)
+        main_frame.columnconfigure(0, weight=1)
+        
+        status_tab = ttk.Frame(output_tabs)
+        status_tab.columnconfigure(0, weight=1)
+        status_tab.rowconfigure(0, weight=1)
+        output_tabs.add(status_tab, text="Status & Output")
         
         self.status_text = scrolledtext.ScrolledText(
-            main_frame, 
+            status_tab, 
             height=15, 
             width=90,
             wrap=tk.WORD
         )
-        self.status_text.grid(row=10, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
-        main_frame.rowconfigure(10, weight=1)
-        main_frame.columnconfigure(0, weight=1)
+        self.status_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        preview_tab = ttk.Frame(output_tabs)
+        preview_tab.columnconfigure(0, weight=1)
+        preview_tab.rowconfigure(1, weight=1)
+        output_tabs.add(preview_tab, text="LaTeX Preview")
+        
+        self.preview = LatexPreview(self.root, preview_tab)
+        self.files_listbox.bind('<<ListboxSelect>>', self.on_file_selected)
         
         # Footer with help text
         footer_frame = ttk.Frame(self.root, padding="10")
@@ -262,6 +439,12 @@ class MathematicaConverterGUI:
         except Exception as e:
             messagebox.showerror("Error", f"Error selecting files: {e}")
     
+    def on_file_selected(self, event=None):
+        """Preview the notebook selected in the file list"""
+        selection = self.files_listbox.curselection()
+        if selection:
+            self.preview.show(self.input_files[selection[0]])
+    
     def remove_selected(self):
         """Remove selected file(s) from the list"""
         selection = self.files_listbox.curselection()
@@ -332,81 +515,176 @@ class MathematicaConverterGUI:
     
     def convert(self):
         """Perform the conversion"""
+        if self.conversion_running:
+            return
         if not self.validate_inputs():
             return
         
         # Clear previous status
         self.clear_status()
+        for index in range(len(self.input_files)):
+            self.files_listbox.itemconfig(index, foreground='black')
         
-        # Disable button and start progress
+        # Disable button and reset progress
         self.convert_button.config(state='disabled')
-        self.progress.start()
-        
-        # Run conversion in a separate thread
-        thread = threading.Thread(target=self.perform_conversion)
+        self.cancel_button.config(state='normal')
+        self.progress.config(maximum=len(self.input_files), value=0)
+        self.progress_label.config(text=f"0/{len(self.input_files)}")
+        self.cancel_event.clear()
+        self.conversion_running = True
+        
+        # Run conversion in a separate thread; it reports back through self.events
+        thread = threading.Thread(
+            target=self.perform_conversion,
+            args=(
+                self.input_files.copy(),
+                self.output_dir.get(),
+                self.display_mode.get(),
+                self.auto_extract_graphics.get(),
+            )
+        )
         thread.daemon = True
         thread.start()
+        
+        self.root.after(100, self.process_events)
+    
+    def cancel_conversion(self):
+        """Stop pending conversions (files already converting are left to finish)"""
+        if self.conversion_running and not self.cancel_event.is_set():
+            self.cancel_event.set()
+            self.cancel_button.config(state='disabled')
+            self.log_message("Cancelling - pending files will be skipped...")
     
-    def perform_conversion(self):
-        """Perform the actual conversion (runs in separate thread)"""
+    def post(self, kind, payload=None):
+        """Send a message from the worker thread to the UI thread"""
+        self.events.put((kind, payload))
+    
+    def process_events(self):
+        """Apply queued worker messages to the widgets (runs on the UI thread)"""
         try:
-            input_files = self.input_files.copy()
-            output_dir = self.output_dir.get()
-            display_mode = self.display_mode.get()
-            auto_extract = self.auto_extract_graphics.get()
-            
-            self.log_message("=" * 70)
-            self.log_message("Starting conversion...")
-            self.log_message(f"Number of files: {len(input_files)}")
+            while True:
+                kind, payload = self.events.get_nowait()
+                if kind == 'log':
+                    self.log_message(payload)
+                elif kind == 'file':
+                    index, status = payload
+                    colors = {'done': 'dark green', 'failed': 'red', 'cancelled': 'gray'}
+                    if index < self.files_listbox.size():
+                        self.files_listbox.itemconfig(index, foreground=colors.get(status, 'black'))
+                elif kind == 'progress':
+                    done, total = payload
+                    self.progress.config(value=done)
+                    self.progress_label.config(text=f"{done}/{total}")
+                elif kind == 'finished':
+                    self.conversion_finished(*payload)
+        except queue.Empty:
+            pass
+        
+        if self.conversion_running:
+            self.root.after(100, self.process_events)
+    
+    def conversion_finished(self, title, message, is_error):
+        """Restore the controls and report the result"""
+        self.conversion_running = False
+        self.convert_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        if is_error:
+            messagebox.showerror(title, message)
+        elif title:
+            messagebox.showinfo(title, message)
+    
+    def perform_conversion(self, input_files, output_dir, display_mode, auto_extract):
+        """Perform the actual conversion (runs in separate thread)
+        
+        Files are converted concurrently in a process pool. All widget
+        updates go through self.post() so Tk is only touched by the UI thread.
+        """
+        log = lambda message: self.post('log', message)
+        executor = None
+        try:
+            log("=" * 70)
+            log("Starting conversion...")
+            log(f"Number of files: {len(input_files)}")
             for i, f in enumerate(input_files, 1):
-                self.log_message(f"  {i}. {os.path.basename(f)}")
-            self.log_message(f"Output Directory: {output_dir}")
-            self.log_message(f"Display Mode: {display_mode}")
-            self.log_message(f"Auto-extract graphics: {'Yes' if auto_extract else 'No'}")
-            self.log_message("=" * 70)
-            self.log_message("")
+                log(f"  {i}. {os.path.basename(f)}")
+            log(f"Output Directory: {output_dir}")
+            log(f"Display Mode: {display_mode}")
+            log(f"Auto-extract graphics: {'Yes' if auto_extract else 'No'}")
+            log("=" * 70)
+            log("")
+            
+            if self.supports_display_mode:
+                options = {'display_mode': display_mode, 'auto_extract_graphics': auto_extract}
+            else:
+                log("  ⚠ Using basic conversion (advanced options not available)")
+                options = None
+            
+            # Convert all files concurrently
+            # Worker processes are spawned: forking this threaded Tk process
+            # could copy held locks into the children
+            import multiprocessing
+            workers = max(1, min(len(input_files), os.cpu_count() or 1))
+            executor = mathematica_to_latex.make_executor(
+                workers, mp_context=multiprocessing.get_context('spawn'))
+            futures = {
+                executor.submit(convert_notebook_file, input_file, options): index
+                for index, input_file in enumerate(input_files)
+            }
+            kind = 'thread(s)' if mathematica_to_latex.executor_kind() == 'thread' else 'process(es)'
+            log(f"Converting with {workers} worker {kind}...")
             
-            # Convert all files
-            all_latex = []
-            for i, input_file in enumerate(input_files, 1):
-                self.log_message(f"Converting file {i}/{len(input_files)}: {os.path.basename(input_file)}...")
+            results = [None] * len(input_files)
+            failures = []
+            failed_indices = set()
+            pending = set(futures)
+            done_count = 0
+            while pending:
+                if self.cancel_event.is_set():
+                    for future in pending:
+                        future.cancel()
+                    break
                 
-                try:
-                    # Try with parameters if supported
-                    if self.supports_display_mode:
-                        latex_content = mathematica_to_latex.convert_notebook_to_latex(
-                            input_file,
-                            display_mode=display_mode,
-                            auto_extract_graphics=auto_extract
-                        )
+                finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = futures[future]
+                    name = os.path.basename(input_files[index])
+                    done_count += 1
+                    try:
+                        latex_content, warning = future.result()
+                    except Exception as e:
+                        failures.append(name)
+                        failed_indices.add(index)
+                        log(f"  ✗ {name}: {e}")
+                        self.post('file', (index, 'failed'))
                     else:
-                        # Fall back to basic conversion
-                        if i == 1:
-                            self.log_message("  ⚠ Using basic conversion (advanced options not available)")
-                        latex_content = mathematica_to_latex.convert_notebook_to_latex(input_file)
-                except TypeError as e:
-                    # Function signature mismatch - try basic call
-                    self.log_message(f"  ⚠ Parameter error, using basic conversion: {e}")
-                    latex_content = mathematica_to_latex.convert_notebook_to_latex(input_file)
-                
-                all_latex.append(latex_content)
-                self.log_message(f"  ✓ Converted ({len(latex_content)} characters)")
+                        if warning:
+                            log(f"  ⚠ {name}: {warning}")
+                        results[index] = latex_content
+                        log(f"  ✓ {name} ({len(latex_content)} characters)")
+                        self.post('file', (index, 'done'))
+                    self.post('progress', (done_count, len(input_files)))
+            
+            if self.cancel_event.is_set():
+                for index, latex in enumerate(results):
+                    if latex is None and index not in failed_indices:
+                        self.post('file', (index, 'cancelled'))
+                log("")
+                log(f"✗ Conversion cancelled ({done_count}/{len(input_files)} files finished) - no output written")
+                self.post('finished', ("", "", False))
+                return
+            
+            if failures:
+                raise RuntimeError(f"{len(failures)} file(s) failed to convert: {', '.join(failures)}")
+            
+            all_latex = results
             
             # Combine outputs if multiple files
             if len(all_latex) > 1:
-                self.log_message("")
-                self.log_message("Combining multiple notebooks...")
-                import re
-                combined = all_latex[0]
-                for latex in all_latex[1:]:
-                    content_match = re.search(r'\\begin\{document\}(.*?)\\end\{document\}', 
-                                             latex, re.DOTALL)
-                    if content_match:
-                        combined = combined.replace(r'\end{document}', 
-                                                  '\n\n' + r'\newpage' + '\n\n' + 
-                                                  content_match.group(1) + r'\end{document}')
-                final_latex = combined
-                self.log_message(f"  ✓ Combined {len(input_files)} notebooks")
+                log("")
+                log("Combining multiple notebooks...")
+                final_latex = mathematica_to_latex.merge_latex_documents(
+                    all_latex, '\n\n' + r'\newpage' + '\n\n')
+                log(f"  ✓ Combined {len(input_files)} notebooks")
             else:
                 final_latex = all_latex[0]
             
@@ -420,37 +698,36 @@ class MathematicaConverterGUI:
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(final_latex)
             
-            self.log_message("")
-            self.log_message("✓ Conversion completed successfully!")
-            self.log_message("")
-            self.log_message(f"LaTeX output written to: {output_file}")
-            self.log_message(f"File size: {len(final_latex)} characters")
-            self.log_message("")
-            self.log_message("To compile the LaTeX document:")
-            self.log_message(f"  pdflatex {os.path.basename(output_file)}")
-            self.log_message("")
-            self.log_message("=" * 70)
+            log("")
+            log("✓ Conversion completed successfully!")
+            log("")
+            log(f"LaTeX output written to: {output_file}")
+            log(f"File size: {len(final_latex)} characters")
+            log("")
+            log("To compile the LaTeX document:")
+            log(f"  pdflatex {os.path.basename(output_file)}")
+            log("")
+            log("=" * 70)
             
             result_msg = f"Conversion completed successfully!\n\n"
             result_msg += f"Files converted: {len(input_files)}\n"
             result_msg += f"Output: {output_file}"
             
-            self.root.after(0, lambda: messagebox.showinfo("Success", result_msg))
+            self.post('finished', ("Success", result_msg, False))
                 
         except Exception as e:
             error_msg = f"An error occurred during conversion:\n{str(e)}"
-            self.log_message("")
-            self.log_message(f"✗ ERROR: {error_msg}")
-            self.log_message("")
+            log("")
+            log(f"✗ ERROR: {error_msg}")
+            log("")
             import traceback
-            self.log_message("Traceback:")
-            self.log_message(traceback.format_exc())
-            self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
+            log("Traceback:")
+            log(traceback.format_exc())
+            self.post('finished', ("Error", error_msg, True))
         
         finally:
-            # Re-enable button and stop progress
-            self.root.after(0, lambda: self.convert_button.config(state='normal'))
-            self.root.after(0, self.progress.stop)
+            if executor is not None:
+                executor.shutdown(wait=False)
 
 
 def main():
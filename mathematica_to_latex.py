@@ -8,9 +8,13 @@ Converts Mathematica notebook files (.nb) to LaTeX format with proper formatting
 import re
 import argparse
 import sys
-import base64
 import os
-from pathlib import Path
+from bisect import bisect_left
+from functools import lru_cache
+
+# Modules needed only by some features (worker pools, payload decoding,
+# NDJSON output) are imported where they are used, so that starting the
+# CLI for a small notebook does not pay for them
 
 
 # Mathematica symbol to LaTeX conversion dictionary
@@ -126,6 +130,33 @@ SYMBOL_MAP = {
 SUBSCRIPT_DOUBLE_BACKSLASH = r'\\\\?\[Subscript\s+([^\]]+)\]'  # Matches \\[Subscript x] or \[Subscript x]
 SUBSCRIPT_WITH_BASE = r'(\w+)\\\\\\\\?\[Subscript\s+([^\]]+)\]'  # Matches var\\[Subscript x] or var\\\\[Subscript x]
 SUBSCRIPT_FUNCTION = r'Subscript\[([^,]+),\s*([^\]]+)\]'  # Matches Subscript[base, sub]
+SUBSCRIPT_PATTERNS = (
+    (re.compile(SUBSCRIPT_DOUBLE_BACKSLASH), r'_{\1}'),
+    (re.compile(SUBSCRIPT_WITH_BASE), r'\1_{\2}'),
+    (re.compile(SUBSCRIPT_FUNCTION), r'\1_{\2}'),
+)
+SUPERSCRIPT_PATTERN = re.compile(r'Superscript\[([^,]+),\s*([^\]]+)\]')
+POWER_PATTERN = re.compile(r'Power\[([^,]+),\s*([^\]]+)\]')
+
+# Named characters (all of the form \[Name]) in one alternation; operators
+# get a trailing space to avoid concatenation issues
+SYMBOL_PATTERN = re.compile('|'.join(map(re.escape, SYMBOL_MAP)))
+SPACED_SYMBOLS = {r'\[PlusMinus]', r'\[MinusPlus]', r'\[Times]',
+                  r'\[LessEqual]', r'\[GreaterEqual]', r'\[NotEqual]'}
+SYMBOL_LATEX = {symbol: latex + ' ' if symbol in SPACED_SYMBOLS else latex
+                for symbol, latex in SYMBOL_MAP.items()}
+DIGIT_SUPERSCRIPT_PATTERN = re.compile(r'\\\.b(\d)')  # \.b2
+UNICODE_LATEX = str.maketrans({
+    '≥': r'\geq ', '≤': r'\leq ', '±': r'\pm ', '×': r'\times ', '÷': r'\div ', '≠': r'\neq ',
+    '∞': r'\infty', '∂': r'\partial', '∫': r'\int', '∑': r'\sum', '∏': r'\prod', '√': r'\sqrt',
+})
+
+# A Greek letter command run together with a variable name (\alphax)
+GREEK_SPACING_PATTERN = re.compile(
+    r'(\\(?:alpha|beta|gamma|delta|epsilon|zeta|eta|theta|iota|kappa|lambda|mu|nu|xi'
+    r'|pi|rho|sigma|tau|upsilon|phi|chi|psi|omega))([a-z])'
+)
+SQRT_ARGUMENT_PATTERN = re.compile(r'\\sqrt([A-Za-z])')
 
 
 def convert_subscripts(text):
@@ -136,9 +167,10 @@ def convert_subscripts(text):
     - var\\\\[Subscript x] -> var_{x}
     - Subscript[base, sub] -> base_{sub}
     """
-    text = re.sub(SUBSCRIPT_DOUBLE_BACKSLASH, r'_{\1}', text)
-    text = re.sub(SUBSCRIPT_WITH_BASE, r'\1_{\2}', text)
-    text = re.sub(SUBSCRIPT_FUNCTION, r'\1_{\2}', text)
+    if 'Subscript' not in text:
+        return text
+    for pattern, replacement in SUBSCRIPT_PATTERNS:
+        text = pattern.sub(replacement, text)
     
     return text
 
@@ -146,146 +178,670 @@ def convert_subscripts(text):
 def convert_superscripts(text):
     """Convert Mathematica superscript notation to LaTeX superscripts."""
     # Pattern for Superscript[base, super]
-    text = re.sub(r'Superscript\[([^,]+),\s*([^\]]+)\]', r'\1^{\2}', text)
+    if 'Superscript[' in text:
+        text = SUPERSCRIPT_PATTERN.sub(r'\1^{\2}', text)
     
     # Pattern for Power[base, exponent]
-    text = re.sub(r'Power\[([^,]+),\s*([^\]]+)\]', r'\1^{\2}', text)
+    if 'Power[' in text:
+        text = POWER_PATTERN.sub(r'\1^{\2}', text)
     
     return text
 
 
+def _symbol_latex(match):
+    return SYMBOL_LATEX[match.group()]
+
+
 def convert_symbols(text):
     """Convert Mathematica special symbols to LaTeX."""
-    for math_symbol, latex_symbol in SYMBOL_MAP.items():
-        # Add space after operator symbols to avoid concatenation issues
-        if math_symbol in [r'\[PlusMinus]', r'\[MinusPlus]', r'\[Times]', 
-                          r'\[LessEqual]', r'\[GreaterEqual]', r'\[NotEqual]']:
-            text = text.replace(math_symbol, latex_symbol + ' ')
-        else:
-            text = text.replace(math_symbol, latex_symbol)
-    
-    # Handle \.b2 (subscript 2 notation)
-    text = re.sub(r'\\\.b(\d)', r'^{\1}', text)
+    if '\\' in text:
+        if '\\[' in text:
+            text = SYMBOL_PATTERN.sub(_symbol_latex, text)
+        
+        # Handle \.b2 (subscript 2 notation)
+        if '\\.b' in text:
+            text = DIGIT_SUPERSCRIPT_PATTERN.sub(r'^{\1}', text)
     
     # Handle special Unicode characters
-    text = text.replace('≥', r'\geq ')
-    text = text.replace('≤', r'\leq ')
-    text = text.replace('±', r'\pm ')
-    text = text.replace('×', r'\times ')
-    text = text.replace('÷', r'\div ')
-    text = text.replace('≠', r'\neq ')
-    text = text.replace('∞', r'\infty')
-    text = text.replace('∂', r'\partial')
-    text = text.replace('∫', r'\int')
-    text = text.replace('∑', r'\sum')
-    text = text.replace('∏', r'\prod')
-    text = text.replace('√', r'\sqrt')
+    if not text.isascii():
+        text = text.translate(UNICODE_LATEX)
     
     return text
 
 
+# Markers counted by extract_graphics
+GRAPHICS_MARKER_PATTERN = re.compile(r'Cell\[GraphicsData\[|Cell\[|GraphicsBox\[')
+
+
 def extract_graphics(text, output_dir):
     """Detect graphics from GraphicsBox structures."""
-    graphics = []
+    # Count Cell[GraphicsData[...] cells and each Cell[ ... GraphicsBox[
+    # run for placeholders, in one pass over the markers. GraphicsData
+    # cells inside a run only count if the run never reaches a GraphicsBox.
+    graphic_count = 0
+    in_cell = False
+    deferred = 0
+    for match in GRAPHICS_MARKER_PATTERN.finditer(text):
+        marker = match.group()
+        if marker == 'GraphicsBox[':
+            if in_cell:
+                in_cell = False
+                deferred = 0
+                graphic_count += 1
+        elif marker == 'Cell[':
+            in_cell = True
+        elif in_cell:
+            deferred += 1
+        else:
+            graphic_count += 1
+    graphic_count += deferred
     
-    # Look for GraphicsBox structures - count them for placeholders
-    graphics_pattern = r'Cell\[GraphicsData\[|Cell\[.*?GraphicsBox\['
-    matches = re.finditer(graphics_pattern, text, re.DOTALL)
+    # Add placeholders - actual graphics need to be exported from Mathematica
+    return [f"figure_{i}" for i in range(1, graphic_count + 1)]
+
+
+# Tokens of the box language used in .nb files. Strings are matched whole
+# (escapes included) so brackets inside them never affect nesting; anything
+# not listed (whitespace) is skipped by finditer. An unclosed comment runs
+# to the end, so it is not searched for again at every following (*.
+BOX_TOKEN_PATTERN = re.compile(r'''
+    (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+  | (?P<open>\[)
+  | (?P<close>\])
+  | (?P<lbrace>\{)
+  | (?P<rbrace>\})
+  | (?P<comma>,)
+  | (?P<rule>->|:>)
+  | (?P<comment>\(\*.*?(?:\*\)|\Z))
+  | (?P<symbol>[A-Za-z$][\w$`]*)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:`[\d.]*)?(?:\*\^-?\d+)?)
+  | (?P<other>\S)
+''', re.VERBOSE | re.DOTALL)
+
+# Steps from one bracket to the next in a cell, skipping text, comments
+# and strings in one match (strings with brackets are consumed whole).
+# Each step starts with a different character, so a gap without a closing
+# bracket or quote is never rescanned: the match runs to its end instead
+CELL_SCAN_PATTERN = re.compile(r"""
+    [^"\[\]{}(]*
+    (?: (?: "[^"\\]*(?:\\(?:.|\Z)[^"\\]*)*(?:"|\Z)
+          | \(\*.*?(?:\*\)|\Z)
+          | \((?!\*)
+        ) [^"\[\]{}(]* )*
+    (?:[\[\]{}]|\Z)
+""", re.VERBOSE | re.DOTALL)
+CELL_CONTENT_STRING_PATTERN = re.compile(r'\s*"[^"\\]*(?:\\.[^"\\]*)*"')
+CELL_STYLE_PATTERN = re.compile(r'\s*,\s*"([^"\\]*(?:\\.[^"\\]*)*)"')
+
+# Escape sequences inside box strings: line continuations and \x pairs
+STRING_ESCAPE_PATTERN = re.compile(r'\\(\r?\n[ \t]*|.)', re.DOTALL)
+STRING_ESCAPES = {'n': '\n', 't': '\t', '"': '"', '\\': '\\', '<': '', '>': ''}
+
+# Head of a list expression {a, b, ...}
+LIST_HEAD = 'List'
+
+
+class BoxNode:
+    """A parsed box expression: head[args...], {args...} or a bare symbol.
     
-    graphic_count = 0
-    for match in matches:
-        graphic_count += 1
-        # Add placeholder - actual graphics need to be exported from Mathematica
-        graphics.append(f"figure_{graphic_count}")
+    Strings are kept as plain str objects holding the raw (still escaped)
+    text between the quotes. Bare symbols and numbers are nodes with
+    args set to None.
+    """
+    
+    __slots__ = ('head', 'args', '_hash')
+    
+    def __init__(self, head, args=None):
+        self.head = head
+        self.args = args
+        self._hash = hash((head, args))
+    
+    def __hash__(self):
+        return self._hash
     
-    return graphics
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return (isinstance(other, BoxNode) and self._hash == other._hash
+                and self.head == other.head and self.args == other.args)
+    
+    def __repr__(self):
+        if self.args is None:
+            return self.head
+        return f'{self.head}[{", ".join(map(repr, self.args))}]'
+    
+    @property
+    def is_symbol(self):
+        return self.args is None
 
 
-def extract_gridbox_table(text):
-    """Extract table data from a GridBox structure."""
-    # Look for GridBox[{ rows }]
-    gridbox_match = re.search(r'GridBox\[\{', text, re.DOTALL)
-    if not gridbox_match:
-        return None
+def _collapse_items(items):
+    """Turn the tokens between two commas into a single argument."""
+    if len(items) == 1:
+        return items[0]
+    for i, item in enumerate(items):
+        if item is _RULE or item is _RULE_DELAYED:
+            head = 'Rule' if item is _RULE else 'RuleDelayed'
+            return BoxNode(head, (_collapse_items(items[:i]), _collapse_items(items[i + 1:])))
+    if not items:
+        return BoxNode('Null')
+    return BoxNode('Sequence', tuple(items))
+
+
+_RULE = BoxNode('->')
+_RULE_DELAYED = BoxNode(':>')
+
+
+def _parse_tokens(tokens, head=None):
+    """Build box expressions from a token iterator.
+    
+    With a head, the opening bracket has already been consumed: parsing
+    stops at the matching closing bracket and the head[...] node is
+    returned. Without one, all tokens are consumed and the list of
+    top-level expressions is returned. Unbalanced input is closed leniently.
+    Returns (result, end) with end the offset just past the last token used.
+    """
+    stack = []
+    items = []
+    args = []
+    end = None
+    if head is not None:
+        stack.append((head, [], []))
+    
+    for match in tokens:
+        kind = match.lastgroup
+        if kind == 'string':
+            items.append(match.group()[1:-1])
+        elif kind == 'symbol' or kind == 'number' or kind == 'other':
+            items.append(BoxNode(match.group()))
+        elif kind == 'comma':
+            # Top-level commas just separate expressions
+            if stack:
+                args.append(_collapse_items(items))
+                items = []
+        elif kind == 'open':
+            # f[...] - the head is the previous item
+            node_head = items.pop() if items else BoxNode('Null')
+            if isinstance(node_head, BoxNode) and node_head.is_symbol:
+                node_head = node_head.head
+            stack.append((node_head, items, args))
+            items, args = [], []
+        elif kind == 'lbrace':
+            stack.append((LIST_HEAD, items, args))
+            items, args = [], []
+        elif kind == 'close' or kind == 'rbrace':
+            if not stack:
+                continue
+            if items or args:
+                args.append(_collapse_items(items))
+            node_head, items, outer_args = stack.pop()
+            node = BoxNode(node_head, tuple(args))
+            args = outer_args
+            if head is not None and not stack:
+                return node, match.end()
+            items.append(node)
+        elif kind == 'rule':
+            items.append(_RULE if match.group() == '->' else _RULE_DELAYED)
+        # comments are skipped
+        end = match.end()
+    
+    # Close anything left open (truncated input)
+    while stack:
+        if items or args:
+            args.append(_collapse_items(items))
+        node_head, items, outer_args = stack.pop()
+        node = BoxNode(node_head, tuple(args))
+        args = outer_args
+        if head is not None and not stack:
+            return node, end
+        items.append(node)
+    
+    return items, end
+
+
+def parse_boxes(text):
+    """Parse box-language text into a list of top-level BoxNode/str values."""
+    return _parse_tokens(BOX_TOKEN_PATTERN.finditer(text))[0]
+
+
+def find_box_start(text, heads, pos=0):
+    """Find the next head[ in text (outside strings) with head in heads.
+    
+    Returns (head, start, body) with body the offset just past the bracket,
+    or None.
+    """
+    previous = None
+    for match in BOX_TOKEN_PATTERN.finditer(text, pos):
+        if (match.lastgroup == 'open' and previous is not None
+                and previous.lastgroup == 'symbol' and previous.group() in heads):
+            return previous.group(), previous.start(), match.end()
+        previous = match
+    return None
+
+
+def find_boxes(text, heads):
+    """Yield (node, start, end) for every outermost head[...] expression in text.
+    
+    Only the matching expressions are built into trees; everything else is
+    just tokenized and skipped, so memory stays proportional to the matches.
+    """
+    pos = 0
+    while True:
+        found = find_box_start(text, heads, pos)
+        if found is None:
+            return
+        head, start, body = found
+        node, pos = _parse_tokens(BOX_TOKEN_PATTERN.finditer(text, body), head)
+        yield node, start, pos if pos is not None else len(text)
+
+
+def decode_box_string(raw):
+    """Resolve the escape sequences of a raw box string.
+    
+    Quotes, backslashes, newlines and tabs are unescaped, line continuations
+    and the \\< \\> string delimiters are dropped. Named characters
+    (\\[Alpha]) and linear syntax (\\!\\(...\\)) are left for later stages.
+    """
+    if '\\' not in raw:
+        return raw
     
-    # Find the matching closing bracket using stack-based parsing
-    start_pos = gridbox_match.end()
-    bracket_count = 1
-    pos = start_pos
+    def replace(match):
+        escaped = match.group(1)
+        if escaped[0] in '\r\n':
+            return ''
+        return STRING_ESCAPES.get(escaped, match.group(0))
     
-    while pos < len(text) and bracket_count > 0:
-        if text[pos] == '{':
-            bracket_count += 1
-        elif text[pos] == '}':
-            bracket_count -= 1
-        pos += 1
+    return STRING_ESCAPE_PATTERN.sub(replace, raw)
+
+
+def find_linear_syntax(text, start=0):
+    """Find the next embedded box expression \\!\\(...\\) in text.
     
-    if bracket_count != 0:
+    Returns (start, end, inner) with inner the text between \\( and \\),
+    or None. Nested \\( \\) pairs are matched with a linear scan.
+    """
+    begin = text.find('\\!\\(', start)
+    if begin < 0:
         return None
+    pos = begin + 4
+    depth = 1
+    while depth:
+        open_pos = text.find('\\(', pos)
+        close_pos = text.find('\\)', pos)
+        if close_pos < 0:
+            return None
+        if 0 <= open_pos < close_pos:
+            depth += 1
+            pos = open_pos + 2
+        else:
+            depth -= 1
+            pos = close_pos + 2
+    return begin, pos, text[begin + 4:pos - 2]
+
+
+def render_linear_syntax(text):
+    """Render embedded box expressions \\!\\(...\\) in text as inline math.
+    
+    Each expression is parsed and rendered with box_to_latex, giving
+    $...$; the surrounding text is left unchanged.
+    """
+    if '\\!\\(' not in text:
+        return text
+    parts = []
+    pos = 0
+    while True:
+        found = find_linear_syntax(text, pos)
+        if found is None:
+            break
+        begin, end, inner = found
+        parts.append(text[pos:begin])
+        latex = linear_syntax_to_latex(inner).strip()
+        if latex:
+            parts.append(f'${latex}$')
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+
+def linear_syntax_to_latex(inner):
+    """Render the inside of a \\!\\(...\\) expression as LaTeX math."""
+    # \* introduces box expressions; linear operators (\^, \_, \/) are
+    # read as their plain counterparts
+    inner = inner.replace('\\*', ' ')
+    for escaped, plain in (('\\^', '^'), ('\\_', '_'), ('\\/', '/'), ('\\(', ''), ('\\)', '')):
+        inner = inner.replace(escaped, plain)
+    return ''.join(box_to_latex(box) for box in parse_boxes(inner))
+
+
+def box_string_text(raw):
+    """Displayed text of a box string (string-of-string quotes removed)."""
+    if '\\' not in raw:
+        return raw
+    if raw.startswith('\\<\\"') and raw.endswith('\\"\\>'):
+        # "\<\"text\"\>" - the common TableForm string, escaped twice
+        inner = raw[4:-4]
+        if '\\' not in inner:
+            return inner
+        return render_linear_syntax(decode_box_string(decode_box_string(inner)))
+    text = decode_box_string(raw)
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        text = decode_box_string(text[1:-1])
+    return render_linear_syntax(text)
+
+
+# Fast path for GridBox rows made only of strings: {"a", "b", ...}
+BOX_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+STRING_ROW_PATTERN = re.compile(r'\s*\{(\s*%s\s*(?:,\s*%s\s*)*)\}' % (BOX_STRING, BOX_STRING))
+STRING_CONTENT_PATTERN = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)"')
+GRID_OPEN_PATTERN = re.compile(r'\s*\{')
+GRID_SEPARATOR_PATTERN = re.compile(r'\s*([,}])')
+
+
+# Heads whose first argument is the displayed content
+WRAPPER_BOX_HEADS = {
+    'BoxData', 'StyleBox', 'TagBox', 'FormBox', 'InterpretationBox', 'TooltipBox',
+    'ItemBox', 'PaneBox', 'PanelBox', 'FrameBox', 'AdjustmentBox', 'ButtonBox',
+    'Cell', 'TextData', 'DynamicBox', 'DynamicWrapperBox', 'PaneSelectorBox', 'Item',
+}
+
+
+def box_to_text(box):
+    """Flatten a box expression to the text it displays.
     
-    grid_content = text[start_pos:pos-1]
+    Scripts become x^{y}/x_{y} so the usual symbol and spacing conversions
+    can be applied afterwards; nested grids become a nested tabular.
+    """
+    if isinstance(box, str):
+        return box_string_text(box)
+    if box.args is None:
+        return box.head
+    
+    head = box.head
+    args = box.args
+    if head == 'RowBox' and args and isinstance(args[0], BoxNode) and args[0].head == LIST_HEAD:
+        return ''.join(box_to_text(arg) for arg in args[0].args)
+    if head == LIST_HEAD:
+        return ''.join(box_to_text(arg) for arg in args)
+    if head in ('Rule', 'RuleDelayed'):
+        return ''  # options
+    if head == 'SuperscriptBox' and len(args) >= 2:
+        return f'{box_to_text(args[0])}^{{{box_to_text(args[1])}}}'
+    if head == 'SubscriptBox' and len(args) >= 2:
+        return f'{box_to_text(args[0])}_{{{box_to_text(args[1])}}}'
+    if head == 'SubsuperscriptBox' and len(args) >= 3:
+        return f'{box_to_text(args[0])}_{{{box_to_text(args[1])}}}^{{{box_to_text(args[2])}}}'
+    if head == 'FractionBox' and len(args) >= 2:
+        return f'{box_to_text(args[0])}/{box_to_text(args[1])}'
+    if head == 'SqrtBox' and args:
+        return f'\\sqrt{{{box_to_text(args[0])}}}'
+    if head == 'GridBox' and args:
+        rows = gridbox_rows(box)
+        if not rows:
+            return ''
+        return ('\\begin{tabular}{@{}l@{}}' +
+                r' \\ '.join(' '.join(cell for cell in row if cell) for row in rows) +
+                r'\end{tabular}')
+    if head == 'TemplateBox' and args and isinstance(args[0], BoxNode) and args[0].head == LIST_HEAD:
+        return ' '.join(box_to_text(arg) for arg in args[0].args)
+    if head in WRAPPER_BOX_HEADS or args:
+        return box_to_text(args[0]) if args else ''
+    return ''
+
+
+# Operators and named characters inside rendered math
+MATH_ATOMS = {
+    '->': r'\to ', '\\[Rule]': r'\to ', ':>': r'\mapsto ', '==': '=', '!=': r'\neq ',
+    '<=': r'\leq ', '>=': r'\geq ', '*': ' ', '\\[InvisibleTimes]': '',
+    '\\[NoBreak]': '', '\\[InvisibleSpace]': '', '\\[DifferentialD]': r'\,d',
+    '\\[ExponentialE]': 'e', '\\[ImaginaryI]': 'i', '\\[Minus]': '-',
+    '[': '(', ']': ')', '{': r'\{', '}': r'\}', 'Pi': r'\pi ', 'Infinity': r'\infty ',
+}
+
+# Function names typeset upright
+MATH_FUNCTIONS = {
+    'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'sinh', 'cosh', 'tanh', 'coth',
+    'arcsin', 'arccos', 'arctan', 'log', 'ln', 'exp', 'det', 'max', 'min',
+    'lim', 'sup', 'inf', 'arg', 'deg', 'dim', 'gcd',
+}
+
+# Bases of Under/Over/UnderoverscriptBox that take limits as sub/superscripts
+BIG_OPERATORS = {r'\sum', r'\prod', r'\int', r'\lim', r'\max', r'\min', r'\cup', r'\cap'}
+
+# Overscripts that are accents
+MATH_ACCENTS = {
+    '^': r'\hat', '~': r'\tilde', '_': r'\bar', '\\[HorizontalLine]': r'\bar',
+    '.': r'\dot', '..': r'\ddot', '\\[RightVector]': r'\vec', '\\[RightArrow]': r'\vec',
+}
+
+# Heads rendered as their first argument
+MATH_WRAPPER_HEADS = WRAPPER_BOX_HEADS | {'TemplateBox', 'Cell'}
+
+# Characters with a special meaning in LaTeX text and their escaped forms;
+# named characters inside text become inline math
+TEXT_SPECIAL_PATTERN = re.compile(r'\\\[[A-Za-z]+\]|[#$%&_{}~^\\]')
+TEXT_SPECIALS = {
+    '#': r'\#', '$': r'\$', '%': r'\%', '&': r'\&', '_': r'\_', '{': r'\{', '}': r'\}',
+    '~': r'\textasciitilde{}', '^': r'\textasciicircum{}', '\\': r'\textbackslash{}',
+}
+
+
+def _escape_text_special(match):
+    text = match.group()
+    if len(text) == 1:
+        return TEXT_SPECIALS[text]
+    symbol = SYMBOL_MAP.get(text)
+    if symbol is not None:
+        return '$' + symbol.strip() + '$'
+    return r'\textbackslash{}' + text[1:]
+
+
+def escape_latex_text(text):
+    """Escape plain text for LaTeX text mode (e.g. the contents of \\text{})."""
+    return TEXT_SPECIAL_PATTERN.sub(_escape_text_special, text)
+
+
+def _math_atom(raw):
+    """Render a string atom of a box expression in math mode."""
+    text = decode_box_string(raw)
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return r'\text{' + escape_latex_text(text[1:-1]) + '}'
+    atom = MATH_ATOMS.get(text)
+    if atom is not None:
+        return atom
+    if text.isalpha():
+        if text in MATH_FUNCTIONS or text.lower() in MATH_FUNCTIONS and text[0].isupper():
+            return '\\' + text.lower() + ' '
+        if len(text) > 1:
+            return r'\mathrm{' + text + '}'
+        return text
+    if '\\[' in text or not text.isascii():
+        text = convert_symbols(text)
+        if text.startswith('\\') and text[-1].isalpha():
+            text += ' '
+    return text
+
+
+def _script_base(latex):
+    """Brace a sub/superscript base unless it is a single symbol."""
+    if len(latex) == 1 or (latex.startswith('\\') and latex[1:].strip().isalpha()):
+        return latex.strip()
+    if latex.startswith('(') and latex.endswith(')'):
+        return latex
+    return '{' + latex + '}'
+
+
+# Distinct box subexpressions whose LaTeX is kept for reuse
+LATEX_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=LATEX_CACHE_SIZE)
+def box_to_latex(box):
+    """Render a box expression (e.g. the contents of a FormBox) as LaTeX math.
     
-    # Remove line continuation characters (backslash followed by newline)
-    # These are part of the file format, not the content
-    grid_content = re.sub(r'\\\n\s*', '', grid_content)
+    Results are memoized by box tree, so subexpressions that repeat across
+    cells (BoxNode compares and hashes structurally) are rendered once.
+    """
+    if isinstance(box, str):
+        return _math_atom(box)
+    if box.args is None:
+        return MATH_ATOMS.get(box.head, box.head if box.head not in ('TraditionalForm', 'StandardForm') else '')
+    
+    head = box.head
+    args = box.args
+    if head == 'RowBox' and args and isinstance(args[0], BoxNode) and args[0].head == LIST_HEAD:
+        return ''.join(box_to_latex(arg) for arg in args[0].args)
+    if head == LIST_HEAD:
+        return ''.join(box_to_latex(arg) for arg in args)
+    if head in ('Rule', 'RuleDelayed', 'Sequence'):
+        return ''
+    if head == 'SuperscriptBox' and len(args) >= 2:
+        return f'{_script_base(box_to_latex(args[0]))}^{{{box_to_latex(args[1])}}}'
+    if head == 'SubscriptBox' and len(args) >= 2:
+        return f'{_script_base(box_to_latex(args[0]))}_{{{box_to_latex(args[1])}}}'
+    if head == 'SubsuperscriptBox' and len(args) >= 3:
+        return (f'{_script_base(box_to_latex(args[0]))}_{{{box_to_latex(args[1])}}}'
+                f'^{{{box_to_latex(args[2])}}}')
+    if head == 'FractionBox' and len(args) >= 2:
+        return f'\\frac{{{box_to_latex(args[0])}}}{{{box_to_latex(args[1])}}}'
+    if head == 'SqrtBox' and args:
+        return f'\\sqrt{{{box_to_latex(args[0])}}}'
+    if head == 'RadicalBox' and len(args) >= 2:
+        return f'\\sqrt[{box_to_latex(args[1])}]{{{box_to_latex(args[0])}}}'
+    if head in ('UnderscriptBox', 'OverscriptBox', 'UnderoverscriptBox') and len(args) >= 2:
+        base = box_to_latex(args[0])
+        if head == 'OverscriptBox':
+            script = decode_box_string(args[1]) if isinstance(args[1], str) else None
+            if script in MATH_ACCENTS:
+                return f'{MATH_ACCENTS[script]}{{{base}}}'
+            return f'\\overset{{{box_to_latex(args[1])}}}{{{base}}}'
+        under = box_to_latex(args[1])
+        over = box_to_latex(args[2]) if head == 'UnderoverscriptBox' and len(args) >= 3 else None
+        if base.strip() in BIG_OPERATORS:
+            base = base.strip()
+            if head == 'OverscriptBox':
+                return f'{base}^{{{under}}}'
+            return f'{base}_{{{under}}}' + (f'^{{{over}}}' if over is not None else '')
+        latex = f'\\underset{{{under}}}{{{base}}}'
+        return f'\\overset{{{over}}}{{{latex}}}' if over is not None else latex
+    if head == 'GridBox' and args:
+        grid = args[0]
+        if isinstance(grid, BoxNode) and grid.head == LIST_HEAD:
+            rows = [' & '.join(box_to_latex(cell) for cell in row.args)
+                    if isinstance(row, BoxNode) and row.head == LIST_HEAD else box_to_latex(row)
+                    for row in grid.args]
+            return r'\begin{matrix}' + r' \\ '.join(rows) + r'\end{matrix}'
+        return ''
+    if head == 'TemplateBox' and args and isinstance(args[0], BoxNode) and args[0].head == LIST_HEAD:
+        return ' '.join(box_to_latex(arg) for arg in args[0].args)
+    if head in MATH_WRAPPER_HEADS or args:
+        return box_to_latex(args[0]) if args else ''
+    return ''
+
+
+def gridbox_rows(gridbox):
+    """Return the rows of a GridBox node as lists of cell text."""
+    if not gridbox.args:
+        return []
+    grid = gridbox.args[0]
+    if not isinstance(grid, BoxNode) or grid.head != LIST_HEAD:
+        return []
     
-    # Now extract rows - split by comma at top level
     rows = []
-    current_row = []
-    bracket_count = 0
-    cell_start = 0
+    for row in grid.args:
+        if isinstance(row, BoxNode) and row.head == LIST_HEAD:
+            cells = [box_to_text(cell).strip() for cell in row.args]
+        else:
+            cells = [box_to_text(row).strip()]
+        if any(cells):
+            rows.append(cells)
+    return rows
+
+
+def _parse_grid(text, pos):
+    """Parse the rows of a GridBox whose opening bracket ends at pos.
     
-    i = 0
-    while i < len(grid_content):
-        char = grid_content[i]
-        
-        if char == '{':
-            if bracket_count == 0:
-                cell_start = i + 1
-            bracket_count += 1
-        elif char == '}':
-            bracket_count -= 1
-            if bracket_count == 0:
-                # End of a row
-                row_content = grid_content[cell_start:i]
-                
-                # Extract all string literals from this row
-                cell_strings = re.findall(r'\\<\\"(.*?)\\"\\>', row_content, re.DOTALL)
-                if cell_strings:
-                    cells = []
-                    for cell in cell_strings:
-                        cell = cell.replace('\\n', '\n')
-                        cell = cell.replace('\\"', '"')
-                        # Remove FormBox expressions
-                        cell = re.sub(r'\\!\\\\?\(\\\\?\*FormBox\[.*?TraditionalForm\]\\\\?\)', '[formula]', cell, flags=re.DOTALL)
-                        cells.append(cell)
-                    rows.append(cells)
+    Rows are converted to text as they are read, so no tree is built for
+    the grid as a whole. Rows holding only strings (the bulk of TableForm
+    output) are matched with a single regex; other rows go through the
+    box parser. Returns (rows, end) with end just past the GridBox.
+    """
+    rows = []
+    match = GRID_OPEN_PATTERN.match(text, pos)
+    if not match:
+        node, end = _parse_tokens(BOX_TOKEN_PATTERN.finditer(text, pos), 'GridBox')
+        return gridbox_rows(node), end
+    pos = match.end()
+    
+    while True:
+        match = STRING_ROW_PATTERN.match(text, pos)
+        if match:
+            cells = [box_string_text(raw).strip()
+                     for raw in STRING_CONTENT_PATTERN.findall(match.group(1))]
+            pos = match.end()
+        else:
+            tokens = BOX_TOKEN_PATTERN.finditer(text, pos)
+            first = next(tokens, None)
+            if first is None or first.lastgroup != 'lbrace':
+                break
+            row, pos = _parse_tokens(tokens, LIST_HEAD)
+            cells = [box_to_text(cell).strip() for cell in row.args]
+        if any(cells):
+            rows.append(cells)
         
-        i += 1
+        match = GRID_SEPARATOR_PATTERN.match(text, pos)
+        if not match or match.group(1) != ',':
+            break
+        pos = match.end()
+    
+    # Skip the grid options up to the GridBox's closing bracket
+    _, end = _parse_tokens(BOX_TOKEN_PATTERN.finditer(text, pos), 'GridBox')
+    return rows, end if end is not None else len(text)
+
+
+def extract_gridbox_tables(text):
+    """Extract every table (GridBox) in a cell.
     
-    return rows if rows else None
+    Returns a list of tables, each a list of rows of cell text. The cell is
+    scanned once and rows are converted as they are read, so large tables
+    take linear time and no memory beyond the result. GridBoxes nested
+    inside a table cell are rendered as part of that cell.
+    """
+    if 'GridBox[' not in text:
+        return []
+    tables = []
+    pos = 0
+    while True:
+        found = find_box_start(text, ('GridBox',), pos)
+        if found is None:
+            return tables
+        rows, pos = _parse_grid(text, found[2])
+        if rows:
+            tables.append(rows)
+
+
+def extract_gridbox_table(text):
+    """Extract table data from the first GridBox structure in a cell."""
+    tables = extract_gridbox_tables(text)
+    return tables[0] if tables else None
+
+
+# String literals, matched whole so escaped quotes never end them
+BOX_STRING_PATTERN = re.compile(BOX_STRING)
 
 
 def extract_string_content(text):
     """Extract content from string literals in Mathematica cells."""
     results = []
     
-    # Extract content between Mathematica string delimiters "\<\"...\"\>"
+    # Extract content of Mathematica string delimiters "\<\"...\"\>"
     # This is the format used in Print statements and output cells
-    # In raw file: \<\"...\"\> but when read, becomes: \\<\\"...\\">\\>
-    matches = re.findall(r'\\<\\"(.*?)\\"\\>', text, re.DOTALL)
-    for match in matches:
-        # Clean up escaped characters
-        content = match.replace('\\n', '\n')
-        content = content.replace('\\"', '"')
-        content = content.replace('\\\\', '\\')
-        
-        # Remove line continuation backslashes (backslash followed by newline)
-        content = re.sub(r'\\\n\s*', '', content)
+    for match in BOX_STRING_PATTERN.finditer(text):
+        raw = match.group()[1:-1]
+        if not raw.startswith('\\<\\"'):
+            continue
         
-        # Remove FormBox expressions early (they can span lines)
-        # These are complex formatted expressions that we can't convert properly
-        content = re.sub(r'\\!\\\\?\(\\\\?\*FormBox\[.*?TraditionalForm\]\\\\?\)', '[formula]', content, flags=re.DOTALL)
+        # Unescape and render embedded formulas (\!\(\*FormBox[...]\))
+        content = box_string_text(raw)
         
         # Skip if it's just whitespace or newlines
         if content.strip() and content.strip() not in ['\\', '\n']:
@@ -297,56 +853,44 @@ def extract_string_content(text):
     return ''
 
 
+# LaTeX math commands and script markers that make text math (one scan)
+MATH_INDICATOR_PATTERN = re.compile(
+    r'[_^]|\\(?:alpha|beta|gamma|delta|epsilon|zeta|eta|theta|iota|kappa|lambda|mu|nu|xi'
+    r'|pi|rho|sigma|tau|upsilon|phi|chi|psi|omega|hbar|times|pm|geq|leq'
+    r'|bullet|checkmark|ddot|dot)'
+)
+
+
 def is_math_content(text):
     """Determine if text contains mathematical content that should be in math mode."""
-    # Check for LaTeX math symbols
-    math_indicators = [
-        r'\alpha', r'\beta', r'\gamma', r'\delta', r'\epsilon', r'\zeta', r'\eta', 
-        r'\theta', r'\iota', r'\kappa', r'\lambda', r'\mu', r'\nu', r'\xi',
-        r'\pi', r'\rho', r'\sigma', r'\tau', r'\upsilon', r'\phi', r'\chi', 
-        r'\psi', r'\omega', r'\hbar', r'\times', r'\pm', r'\geq', r'\leq',
-        r'\bullet', r'\checkmark', r'\ddot', r'\dot',
-        '_', '^'
-    ]
-    
-    return any(indicator in text for indicator in math_indicators)
+    return MATH_INDICATOR_PATTERN.search(text) is not None
 
 
 def fix_math_spacing(text):
     """Fix spacing issues in mathematical expressions."""
+    if '\\' not in text:
+        return text
+    
     # Add space after Greek letters when followed by a letter (not a special char)
     # Example: \alphax -> \alpha x
-    greek_letters = [
-        'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 
-        'theta', 'iota', 'kappa', 'lambda', 'mu', 'nu', 'xi',
-        'pi', 'rho', 'sigma', 'tau', 'upsilon', 'phi', 'chi', 
-        'psi', 'omega'
-    ]
-    
-    for letter in greek_letters:
-        # Match \letter followed by a lowercase letter (variable name)
-        text = re.sub(rf'(\\{letter})([a-z])', r'\1 \2', text)
+    text = GREEK_SPACING_PATTERN.sub(r'\1 \2', text)
     
     # Fix common patterns like \sqrtN -> \sqrt{N}
-    text = re.sub(r'\\sqrt([A-Za-z])', r'\\sqrt{\1}', text)
+    if '\\sqrt' in text:
+        text = SQRT_ARGUMENT_PATTERN.sub(r'\\sqrt{\1}', text)
     
     return text
 
 
 def clean_formbox_expressions(text):
-    """Remove or simplify Mathematica FormBox expressions."""
-    # Remove FormBox wrapper - these are complex formatted expressions
-    # The pattern can appear with different levels of escaping:
-    # 1. \\!\\(\\*FormBox[...]\\) - in tables/StyleBox
-    # 2. \!\(\*FormBox[...]\) - in simple cells
-    
-    # Handle heavily escaped version (in tables)
-    text = re.sub(r'\\\\!\\\\\\(\\\\\\*FormBox\[.*?TraditionalForm\]\\\\\\)', '[formula]', text, flags=re.DOTALL)
-    
-    # Handle lightly escaped version (in regular cells)
-    text = re.sub(r'\\!\\\\?\(\\\\?\*FormBox\[.*?TraditionalForm\]\\\\?\)', '[formula]', text, flags=re.DOTALL)
-    
-    return text
+    """Render any remaining embedded FormBox expressions as inline math."""
+    return render_linear_syntax(text)
+
+
+# Cleanup patterns of extract_input_code
+CONTINUATION_PATTERN = re.compile(r'\[?Continuation\]?')
+SPACES_PATTERN = re.compile(r' +')
+NEWLINE_SPACING_PATTERN = re.compile(r' *\n *')
 
 
 def extract_input_code(cell_text):
@@ -356,8 +900,7 @@ def extract_input_code(cell_text):
     code_parts = []
     
     # Find all string literals in RowBox
-    matches = re.findall(r'"([^"\\]*(?:\\.[^"\\]*)*)"', cell_text)
-    for match in matches:
+    for match in STRING_CONTENT_PATTERN.findall(cell_text):
         # Skip style markers and metadata
         if match in ['Input', 'Code', 'Bold', 'Italic'] or match.startswith('FontWeight'):
             continue
@@ -369,14 +912,17 @@ def extract_input_code(cell_text):
         cleaned = cleaned.replace('\\"', '"')
         
         # Replace Mathematica formatting codes with spaces
-        cleaned = re.sub(r'\[IndentingNewLine\]', '\n', cleaned)
-        cleaned = re.sub(r'\[?Continuation\]?', '', cleaned)
+        if 'IndentingNewLine' in cleaned:
+            cleaned = cleaned.replace('[IndentingNewLine]', '\n')
+        if 'Continuation' in cleaned:
+            cleaned = CONTINUATION_PATTERN.sub('', cleaned)
         
         # Convert bracket notations to actual brackets
-        cleaned = cleaned.replace('\\[', '[')
-        cleaned = cleaned.replace('\\]', ']')
-        cleaned = cleaned.replace('\\(', '(')
-        cleaned = cleaned.replace('\\)', ')')
+        if '\\' in cleaned:
+            cleaned = cleaned.replace('\\[', '[')
+            cleaned = cleaned.replace('\\]', ']')
+            cleaned = cleaned.replace('\\(', '(')
+            cleaned = cleaned.replace('\\)', ')')
         
         if cleaned.strip():
             code_parts.append(cleaned)
@@ -385,38 +931,151 @@ def extract_input_code(cell_text):
         # Join with spaces, but preserve newlines
         result = ' '.join(code_parts)
         # Clean up multiple spaces
-        result = re.sub(r' +', ' ', result)
+        if '  ' in result:
+            result = SPACES_PATTERN.sub(' ', result)
         # Clean up spacing around newlines
-        result = re.sub(r' *\n *', '\n', result)
+        if '\n' in result:
+            result = NEWLINE_SPACING_PATTERN.sub('\n', result)
         return result
     return ''
 
 
-def process_cell_content(cell_text):
-    """Process a single cell's content."""
-    # Check if this is a code cell (Input) - now we include these
-    if '"Input"' in cell_text:
-        code = extract_input_code(cell_text)
-        if code:
-            return ('INPUT', code)
-        return ''
-    
-    # Check if this cell contains a GraphicsBox (but not inside GridBox for legends)
-    # Only treat as graphic if it's a primary GraphicsBox with plot data
-    if ('TagBox[' in cell_text and 'GraphicsBox[{' in cell_text and 'CompressedData[' in cell_text):
-        return ('GRAPHIC', cell_text)
-    
-    # Check if this cell contains a GridBox (table)
-    table_data = extract_gridbox_table(cell_text)
-    if table_data:
-        return ('TABLE', table_data)
+# Where an align* row is aligned: the first relation
+ALIGN_POINT_PATTERN = re.compile(r'=|\\to |\\leq |\\geq |\\neq ')
+
+
+def _output_list_items(box):
+    """Return the elements of a box displaying a list {a, b, ...}, or None."""
+    while box.args and box.head in WRAPPER_BOX_HEADS:
+        box = box.args[0]
+        if isinstance(box, str):
+            return None
+    if box.head != 'RowBox' or not box.args or not isinstance(box.args[0], BoxNode) \
+            or box.args[0].head != LIST_HEAD:
+        return None
+    parts = box.args[0].args
+    if len(parts) != 3 or parts[0] != '{' or parts[2] != '}':
+        return None
+    inner = parts[1]
+    if isinstance(inner, BoxNode) and inner.head == 'RowBox' and inner.args \
+            and isinstance(inner.args[0], BoxNode) and inner.args[0].head == LIST_HEAD:
+        return [part for part in inner.args[0].args if part != ',']
+    return [inner]
+
+
+def render_output(box):
+    """Render the BoxData of an Output cell.
     
-    # Extract string content from Print cells and TextData cells
-    content = extract_string_content(cell_text)
+    Returns (environment, latex): a list whose elements are all equations
+    or rules goes in an align* with one element per line, anything else
+    in an equation*.
+    """
+    items = _output_list_items(box)
+    if items and len(items) > 1:
+        rows = [box_to_latex(item) for item in items]
+        if all(ALIGN_POINT_PATTERN.search(row) for row in rows):
+            return 'align*', ' \\\\\n'.join(
+                ALIGN_POINT_PATTERN.sub(r'&\g<0>', row, count=1) for row in rows
+            )
+    latex = box_to_latex(box)
+    latex = latex.replace(r'(\begin{matrix}', r'\begin{pmatrix}')
+    latex = latex.replace(r'\end{matrix})', r'\end{pmatrix}')
+    return 'equation*', latex
+
+
+def extract_output_math(cell_text):
+    """Render an Output cell's BoxData as display math, or return None."""
+    for box, _, _ in find_boxes(cell_text, ('BoxData',)):
+        environment, latex = render_output(box)
+        if latex.strip():
+            return environment, latex.strip()
+        return None
+    return None
+
+
+# Cell styles that are headings, and the LaTeX command for each. The
+# first Title cell becomes the document title.
+CELL_STYLE_COMMANDS = {
+    'Title': r'\title',
+    'Subtitle': r'\subsection*',
+    'Chapter': r'\section*',
+    'Section': r'\section*',
+    'Subsection': r'\subsection*',
+    'Subsubsection': r'\subsubsection*',
+    'Subsubsubsection': r'\paragraph*',
+}
+
+# Cell styles rendered as paragraphs
+TEXT_CELL_STYLES = {
+    'Text', 'SmallText', 'Item', 'ItemParagraph', 'ItemNumbered', 'Subitem',
+    'SubitemParagraph', 'SubitemNumbered', 'Caption', 'Author', 'Affiliation', 'Abstract',
+}
+
+# Cell styles rendered as display math, and their environment
+DISPLAY_CELL_STYLES = {
+    'DisplayFormula': 'equation*',
+    'DisplayFormulaNumbered': 'equation',
+}
+
+# Cell styles holding code
+CODE_CELL_STYLES = {'Input', 'Code'}
+
+
+def cell_style(cell_text):
+    """Return the style of a Cell[...] expression (e.g. "Section"), or None.
     
-    if not content or len(content) < 3:
+    The style is the first string among the cell's own arguments after
+    its content.
+    """
+    depth = 0
+    after_content = False
+    for match in BOX_TOKEN_PATTERN.finditer(cell_text):
+        kind = match.lastgroup
+        if kind == 'open' or kind == 'lbrace':
+            depth += 1
+        elif kind == 'close' or kind == 'rbrace':
+            depth -= 1
+            if depth <= 0:
+                return None
+        elif depth == 1:
+            if kind == 'comma':
+                after_content = True
+            elif after_content:
+                if kind == 'string':
+                    return decode_box_string(match.group()[1:-1])
+                if kind == 'rule':
+                    return None
+    return None
+
+
+def cell_text_content(box):
+    """Text of a Text-style cell's content, with inline formulas as $...$."""
+    if isinstance(box, str):
+        return box_string_text(box)
+    if box.args is None:
         return ''
-    
+    head = box.head
+    if head == LIST_HEAD:
+        return ''.join(cell_text_content(arg) for arg in box.args)
+    if head == 'BoxData' and box.args:
+        latex = box_to_latex(box.args[0]).strip()
+        return f'${latex}$' if latex else ''
+    if head in ('Rule', 'RuleDelayed'):
+        return ''
+    if head in ('TextData', 'Cell', 'StyleBox', 'ButtonBox', 'TagBox', 'Item') and box.args:
+        return cell_text_content(box.args[0])
+    return box_to_text(box)
+
+
+# Cleanup patterns of convert_text
+TRAILING_BACKSLASH_PATTERN = re.compile(r'\\\s*$')
+FINAL_BACKSLASH_PATTERN = re.compile(r'\\$')
+SPACE_RUN_PATTERN = re.compile(r'[ \t]+')
+BLANK_LINES_PATTERN = re.compile(r'\n\n+')
+
+
+def convert_text(content):
+    """Convert extracted cell text to LaTeX (symbols, scripts, spacing)."""
     # Clean up FormBox expressions before other conversions
     content = clean_formbox_expressions(content)
     
@@ -431,121 +1090,1155 @@ def process_cell_content(cell_text):
     content = fix_math_spacing(content)
     
     # Clean up trailing backslashes and dollar signs
-    content = re.sub(r'\\\$', '', content)
-    content = re.sub(r'\\\s*$', '', content)  # Remove trailing backslash
-    content = re.sub(r'\\$', '', content)
+    if '\\' in content:
+        content = content.replace('\\$', '')
+        content = TRAILING_BACKSLASH_PATTERN.sub('', content)  # Remove trailing backslash
+        content = FINAL_BACKSLASH_PATTERN.sub('', content)
     
     # Clean up whitespace
-    content = re.sub(r'[ \t]+', ' ', content)
-    content = re.sub(r'\n\n+', '\n\n', content)
+    if '  ' in content or '\t' in content:
+        content = SPACE_RUN_PATTERN.sub(' ', content)
+    if '\n\n\n' in content:
+        content = BLANK_LINES_PATTERN.sub('\n\n', content)
     
     return content.strip()
 
 
-def extract_cells_from_notebook(notebook_content):
-    """Extract cells from a Mathematica notebook."""
-    cells = []
-    
-    # Split by Cell[ markers - handle nested structures
-    # Look for Cell[BoxData[...]] or Cell[TextData[...]] or Cell["string", ...]
-    lines = notebook_content.split('\n')
-    in_cell = False
-    cell_lines = []
-    bracket_count = 0
+def process_styled_cell(cell_text, style):
+    """Process a heading, text or display formula cell."""
+    cells = [box for box in parse_boxes(cell_text)
+             if isinstance(box, BoxNode) and box.head == 'Cell' and box.args]
+    if not cells:
+        return ''
+    content = cells[0].args[0]
     
-    for line in lines:
-        if line.startswith('Cell['):
-            in_cell = True
-            cell_lines = [line]
-            bracket_count = line.count('[') - line.count(']')
-        elif in_cell:
-            cell_lines.append(line)
-            bracket_count += line.count('[') - line.count(']')
-            
-            if bracket_count <= 0:
-                # End of cell
-                cell_content = '\n'.join(cell_lines)
-                
-                # Process the cell content
-                processed = process_cell_content(cell_content)
-                if processed:
-                    # Could be a string or a tuple ('TABLE', data) or ('INPUT', code) or ('GRAPHIC', data)
-                    if isinstance(processed, tuple):
-                        cells.append(processed)
-                    elif isinstance(processed, str) and len(processed) > 3:
-                        cells.append(processed)
-                
-                in_cell = False
-                cell_lines = []
-                bracket_count = 0
+    if style in DISPLAY_CELL_STYLES:
+        if isinstance(content, BoxNode) and content.head == 'BoxData' and content.args:
+            content = content.args[0]
+        latex = box_to_latex(content).strip()
+        return ('OUTPUT', DISPLAY_CELL_STYLES[style], latex) if latex else ''
     
-    return cells
+    text = convert_text(cell_text_content(content))
+    if not text:
+        return ''
+    if style in CELL_STYLE_COMMANDS:
+        return ('HEADING', style, text)
+    return ('TEXT', text)
 
 
-def convert_notebook_to_latex(input_file):
-    """Convert a Mathematica notebook to LaTeX."""
-    with open(input_file, 'r', encoding='utf-8', errors='ignore') as f:
-        content = f.read()
+# A cell whose content is a graphic (possibly wrapped in TagBox etc.)
+GRAPHICS_CELL_PATTERN = re.compile(
+    r'Cell\[\s*(?:BoxData\[\s*)?(?:(?:TagBox|InterpretationBox|StyleBox)\[\s*)*'
+    r'(?:GraphicsBox|Graphics3DBox|GraphicsData)\['
+)
+
+
+def process_cell_content(cell_text, style=None):
+    """Process a single cell's content.
     
-    # Create output directory for figures
-    output_base = Path(input_file).stem
-    figures_dir = f"{output_base}_figures"
+    style is the cell's style (e.g. "Section"); it is read from the cell
+    when not given. Headings, text and display formulas are recognized by
+    style; unstyled cells fall back to looking at their content.
+    """
+    if style is None:
+        style = cell_style(cell_text)
     
-    # Extract graphics
-    graphics_list = extract_graphics(content, figures_dir)
+    if style in CELL_STYLE_COMMANDS or style in TEXT_CELL_STYLES or style in DISPLAY_CELL_STYLES:
+        return process_styled_cell(cell_text, style)
     
-    # Extract cells
-    cells = extract_cells_from_notebook(content)
+    # Check if this is a code cell (Input) - now we include these
+    if style in CODE_CELL_STYLES or (style is None and '"Input"' in cell_text):
+        code = extract_input_code(cell_text)
+        if code:
+            return ('INPUT', code)
+        return ''
     
-    # Build LaTeX document
-    latex_output = []
+    # Check if this cell contains a GraphicsBox (but not inside GridBox for legends)
+    # Only treat as graphic if it's a primary GraphicsBox with plot data
+    if ('TagBox[' in cell_text and 'GraphicsBox[{' in cell_text and 'CompressedData[' in cell_text):
+        return ('GRAPHIC', cell_text)
+    if GRAPHICS_CELL_PATTERN.match(cell_text):
+        return ('GRAPHIC', cell_text)
     
-    latex_output.append(r'\documentclass{article}')
-    latex_output.append(r'\usepackage{amsmath}')
-    latex_output.append(r'\usepackage{amssymb}')
-    latex_output.append(r'\usepackage{graphicx}')
-    latex_output.append(r'\usepackage{array}')
-    latex_output.append(r'\usepackage{booktabs}')
-    latex_output.append(r'\usepackage{float}')
-    latex_output.append(r'\usepackage{listings}')
-    latex_output.append(r'\usepackage{xcolor}')
-    latex_output.append(r'')
-    latex_output.append(r'% Configure listings for Mathematica code')
-    latex_output.append(r'\lstset{')
-    latex_output.append(r'  language=Mathematica,')
-    latex_output.append(r'  basicstyle=\small\ttfamily,')
-    latex_output.append(r'  keywordstyle=\color{blue},')
-    latex_output.append(r'  commentstyle=\color{green!60!black},')
-    latex_output.append(r'  stringstyle=\color{red},')
-    latex_output.append(r'  numbers=none,')
-    latex_output.append(r'  frame=single,')
-    latex_output.append(r'  breaklines=true,')
-    latex_output.append(r'  backgroundcolor=\color{gray!10},')
-    latex_output.append(r'  captionpos=b')
-    latex_output.append(r'}')
-    latex_output.append(r'')
-    latex_output.append(r'\begin{document}')
-    latex_output.append(r'')
+    # Output cells holding math become display math; grids are tables
+    # unless they are matrices, and printed strings are text
+    if (style == 'Output' and '\\<\\"' not in cell_text
+            and ('GridBox[' not in cell_text or 'MatrixForm' in cell_text)):
+        output = extract_output_math(cell_text)
+        if output:
+            return ('OUTPUT',) + output
+    
+    # Check if this cell contains GridBoxes (tables); a cell with several
+    # tables gives a list of them
+    tables = extract_gridbox_tables(cell_text)
+    if len(tables) == 1:
+        return ('TABLE', tables[0])
+    if tables:
+        return [('TABLE', table) for table in tables]
+    
+    # Extract string content from Print cells
+    content = extract_string_content(cell_text)
     
-    # Add title
-    filename = Path(input_file).stem
-    latex_output.append(r'\title{' + filename + '}')
-    latex_output.append(r'\maketitle')
-    latex_output.append(r'')
+    if not content or len(content) < 3:
+        return ''
     
-    # Track graphics index
-    graphic_idx = 0
+    return convert_text(content)
+
+
+# The front end writes the notebook expression between these comments;
+# what follows is its cache (CellTagsOutline, NotebookFileOutline, ...)
+NOTEBOOK_CONTENT_END = '(* End of Notebook Content *)'
+
+# Heads of binary payload strings: Head["data"] or Head["Format", "data"]
+PAYLOAD_HEADS = {
+    'CompressedData': None,
+    'GraphicsData': ('CompressedBitmap', 'PostScript'),
+}
+
+# Leading whitespace and opening quote of a payload string
+PAYLOAD_OPEN_PATTERN = re.compile(r'\s*"')
+
+# Line continuations, string delimiters and whitespace inside base64 data
+PAYLOAD_NOISE_PATTERN = re.compile(r'\\\r?\n|\\[<>]|\s')
+
+
+def notebook_content_end(text):
+    """Offset where the notebook expression ends and the front end's cache begins."""
+    end = text.rfind(NOTEBOOK_CONTENT_END)
+    return end if end >= 0 else len(text)
+
+
+class Payload:
+    """A binary payload string (CompressedData, an ImageCache bitmap, ...).
     
-    # Group content for better flow
-    current_paragraph = []
+    Only the kind and the offsets of the string's content in the notebook
+    text are recorded; the data is sliced and decoded on request.
+    """
     
-    # Add cells
-    for cell in cells:
-        # Handle input code cells
-        if isinstance(cell, tuple) and cell[0] == 'INPUT':
-            # Flush current paragraph
-            if current_paragraph:
-                latex_output.append(' '.join(current_paragraph))
+    __slots__ = ('text', 'kind', 'start', 'end')
+    
+    def __init__(self, text, kind, start, end):
+        self.text = text
+        self.kind = kind
+        self.start = start
+        self.end = end
+    
+    def __repr__(self):
+        return f'Payload({self.kind!r}, {self.start}:{self.end})'
+    
+    def __len__(self):
+        return self.end - self.start
+    
+    @property
+    def raw(self):
+        """The payload string as written in the notebook."""
+        return self.text[self.start:self.end]
+    
+    def decode(self):
+        """The payload's bytes: zlib-inflated base64 data, or the PostScript text."""
+        if self.kind == 'PostScript':
+            return decode_box_string(self.raw).encode('utf-8')
+        data = PAYLOAD_NOISE_PATTERN.sub('', self.raw)
+        if self.kind == 'CompressedData' and data[:2] == '1:':
+            data = data[2:]
+        import base64
+        import zlib
+        return zlib.decompress(base64.b64decode(data))
+
+
+def _string_end(text, pos, end):
+    """Offset of the quote closing the string whose content starts at pos, or -1."""
+    quote = text.find('"', pos, end)
+    while quote > 0:
+        backslashes = 0
+        while text[quote - 1 - backslashes] == '\\':
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return quote
+        quote = text.find('"', quote + 1, end)
+    return quote
+
+
+def find_payloads(text, start=0, end=None):
+    """Find the binary payloads in text[start:end], in order.
+    
+    Payloads are located with str.find on their heads and their closing
+    quotes, so their bytes are only looked at by that search.
+    """
+    if end is None:
+        end = len(text)
+    payloads = []
+    pos = text.find('Data[', start, end)
+    while pos >= 0:
+        head_start = pos
+        while head_start > start and text[head_start - 1].isalpha():
+            head_start -= 1
+        head = text[head_start:pos + 4]
+        body = pos + 5
+        if head in PAYLOAD_HEADS:
+            opening = PAYLOAD_OPEN_PATTERN.match(text, body, end)
+            kind = head
+            if opening is not None and PAYLOAD_HEADS[head] is not None:
+                # GraphicsData["Format", "data"]: the format names the payload
+                closing = _string_end(text, opening.end(), end)
+                kind = text[opening.end():closing]
+                opening = (PAYLOAD_OPEN_PATTERN.match(text, closing + 2, end)
+                           if kind in PAYLOAD_HEADS[head] and text.startswith(',', closing + 1)
+                           else None)
+            if opening is not None:
+                closing = _string_end(text, opening.end(), end)
+                if closing >= 0:
+                    payloads.append(Payload(text, kind, opening.end(), closing))
+                    body = closing + 1
+        pos = text.find('Data[', body, end)
+    return payloads
+
+
+class PayloadIndex:
+    """The payloads of a notebook text, for masking them out of spans of it."""
+    
+    def __init__(self, text, start=0, end=None):
+        self.text = text
+        self.payloads = find_payloads(text, start, end)
+        self.starts = [payload.start for payload in self.payloads]
+    
+    def __len__(self):
+        return len(self.payloads)
+    
+    def __iter__(self):
+        return iter(self.payloads)
+    
+    def gaps(self, start, end):
+        """Yield (start, end) spans of text[start:end] between payload strings.
+        
+        The spans leave out each payload string including its quotes. They
+        are produced lazily, so a caller can stop early.
+        """
+        payloads = self.payloads
+        i = bisect_left(self.starts, start)
+        pos = start
+        while i < len(payloads) and payloads[i].end <= end:
+            yield pos, payloads[i].start - 1
+            pos = payloads[i].end + 1
+            i += 1
+        yield pos, end
+    
+    def within(self, start, end):
+        """The payloads inside text[start:end]."""
+        i = bisect_left(self.starts, start)
+        j = bisect_left(self.starts, end, i)
+        return [payload for payload in self.payloads[i:j] if payload.end <= end]
+    
+    def mask(self, start, end):
+        """text[start:end] with the contents of payload strings left out.
+        
+        The strings stay in place but empty (CompressedData[""]), so the
+        cell structure and heads are unchanged.
+        """
+        text = self.text
+        return '""'.join([text[a:b] for a, b in self.gaps(start, end)])
+
+
+class NotebookCell:
+    """A cell of a notebook: its source span and its style."""
+    
+    __slots__ = ('start', 'end', 'style', 'content_end')
+    
+    is_group = False
+    
+    def __init__(self, start, end, style, content_end=None):
+        self.start = start
+        self.end = end
+        self.style = style
+        # End of the cell's first argument (its content), before the style
+        self.content_end = content_end if content_end is not None else end
+    
+    def __repr__(self):
+        return f'NotebookCell({self.style!r}, {self.start}:{self.end})'
+
+
+class CellGroup:
+    """A Cell[CellGroupData[{...}, Open|Closed]] group of cells.
+    
+    cells holds NotebookCell and nested CellGroup items in notebook order;
+    the first cell is the group's header (e.g. its Section cell).
+    """
+    
+    __slots__ = ('start', 'end', 'closed', 'cells')
+    
+    is_group = True
+    
+    def __init__(self, start):
+        self.start = start
+        self.end = None
+        self.closed = False
+        self.cells = []
+    
+    @property
+    def header(self):
+        """The cell that opens the group, or None for an empty group."""
+        first = self.cells[0] if self.cells else None
+        while first is not None and first.is_group:
+            first = first.cells[0] if first.cells else None
+        return first
+    
+    def __repr__(self):
+        state = 'Closed' if self.closed else 'Open'
+        return f'CellGroup({self.header!r}, {len(self.cells)} items, {state})'
+
+
+def _scan_cell(text, pos, cell_depth, limit, payloads):
+    """Scan a content cell from pos (just after Cell[); return (style, content_end, end).
+    
+    Only brackets matter for the cell's extent, so the scan uses
+    CELL_SCAN_PATTERN, which steps from bracket to bracket, and jumps
+    over binary payloads (a PayloadIndex) without reading them. The content
+    (a string or Head[...]) ends when the depth first falls back to the
+    cell's own level; the style is the string after it. Scanning stops at
+    the bracket that closes the cell (at cell_depth).
+    """
+    depth = cell_depth + 1
+    content_end = None
+    string = CELL_CONTENT_STRING_PATTERN.match(text, pos)
+    if string is not None:
+        content_end = string.end()
+        pos = content_end
+    end = None
+    for gap_start, gap_end in payloads.gaps(pos, limit):
+        for match in CELL_SCAN_PATTERN.finditer(text, gap_start, gap_end):
+            char = match.group()[-1:]
+            if char == '[' or char == '{':
+                depth += 1
+            elif char == ']' or char == '}':
+                depth -= 1
+                if depth == cell_depth:
+                    end = match.end()
+                    break
+                if content_end is None and depth == cell_depth + 1:
+                    content_end = match.end()
+        if end is not None:
+            break
+    if content_end is None:
+        return None, end and end - 1, end
+    style = CELL_STYLE_PATTERN.match(text, content_end)
+    if style is not None:
+        style = decode_box_string(style.group(1))
+    return style, content_end, end
+
+
+def parse_cell_tree(text, payloads=None):
+    """Parse the cell structure of a notebook into a list of cells and groups.
+    
+    Only the structure is read: content cells are tokenized to find their
+    end and style but not parsed, and nothing inside them (inline cells,
+    boxes) is treated as a cell. Text without a Notebook[...] wrapper (e.g.
+    a list of cells) is accepted too. The front end's cache after the
+    notebook content is not read, and binary payloads (payloads, a
+    PayloadIndex, found when not given) are skipped.
+    """
+    root = []
+    # (list depth, items, group) for each list that holds cells
+    containers = [(0, root, None)]
+    depth = 0
+    previous = None
+    limit = notebook_content_end(text)
+    if payloads is None:
+        payloads = PayloadIndex(text, 0, limit)
+    tokens = BOX_TOKEN_PATTERN.finditer(text, 0, limit)
+    
+    while True:
+        match = next(tokens, None)
+        if match is None:
+            break
+        kind = match.lastgroup
+        if kind == 'symbol':
+            previous = match
+            continue
+        
+        if kind == 'open' and previous is not None and depth == containers[-1][0]:
+            name = previous.group()
+            if name == 'Cell':
+                start = previous.start()
+                first = next(tokens, None)
+                second = next(tokens, None) if first is not None else None
+                if (first is not None and first.lastgroup == 'symbol'
+                        and first.group() == 'CellGroupData'
+                        and second is not None and second.lastgroup == 'open'):
+                    third = next(tokens, None)
+                    group = CellGroup(start)
+                    containers[-1][1].append(group)
+                    if third is not None and third.lastgroup == 'lbrace':
+                        depth += 3
+                        containers.append((depth, group.cells, group))
+                    else:
+                        depth += 2
+                    previous = None
+                    continue
+                # A content cell: scan it and resume tokenizing after it
+                style, content_end, end = _scan_cell(text, match.end(), depth, limit, payloads)
+                end = end or limit
+                containers[-1][1].append(NotebookCell(start, end, style, content_end))
+                tokens = BOX_TOKEN_PATTERN.finditer(text, end, limit)
+                previous = None
+                continue
+            if name == 'Notebook':
+                first = next(tokens, None)
+                depth += 1
+                if first is not None and first.lastgroup == 'lbrace':
+                    depth += 1
+                    containers.append((depth, root, None))
+                previous = None
+                continue
+        
+        previous = None
+        if kind == 'open' or kind == 'lbrace':
+            depth += 1
+        elif kind == 'close' or kind == 'rbrace':
+            depth -= 1
+            if depth < containers[-1][0]:
+                _, _, group = containers.pop()
+                if group is not None:
+                    group.closed, group.end = _finish_group(tokens, depth - 2)
+                    depth -= 2
+                    if group.end is None:
+                        group.end = limit
+    
+    # Close groups left open by truncated input
+    while len(containers) > 1:
+        _, _, group = containers.pop()
+        if group is not None and group.end is None:
+            group.end = limit
+    return root
+
+
+def _finish_group(tokens, cell_depth):
+    """Consume the rest of a group cell after its list; return (closed, end).
+    
+    The list has just been closed, so the scan starts inside
+    CellGroupData[ (two levels above cell_depth).
+    """
+    depth = cell_depth + 2
+    closed = False
+    for match in tokens:
+        kind = match.lastgroup
+        if kind == 'open' or kind == 'lbrace':
+            depth += 1
+        elif kind == 'close' or kind == 'rbrace':
+            depth -= 1
+            if depth == cell_depth:
+                return closed, match.end()
+        elif kind == 'symbol' and depth == cell_depth + 2 and match.group() == 'Closed':
+            closed = True
+    return closed, None
+
+
+def iter_cells(items, skip_closed=False):
+    """Yield the NotebookCell items of a cell tree in notebook order.
+    
+    With skip_closed, closed groups contribute only their header cell.
+    """
+    stack = [iter(items)]
+    while stack:
+        for item in stack[-1]:
+            if item.is_group:
+                if skip_closed and item.closed:
+                    header = item.header
+                    if header is not None:
+                        yield header
+                    continue
+                stack.append(iter(item.cells))
+                break
+            yield item
+        else:
+            stack.pop()
+
+
+def iter_groups(items):
+    """Yield every CellGroup of a cell tree, outer groups first."""
+    for item in items:
+        if item.is_group:
+            yield item
+            yield from iter_groups(item.cells)
+
+
+def cell_title(text, cell):
+    """Plain text of a (heading) cell, used to look sections up by name."""
+    cells = [box for box in parse_boxes(text[cell.start:cell.end])
+             if isinstance(box, BoxNode) and box.head == 'Cell' and box.args]
+    if not cells:
+        return ''
+    return ' '.join(cell_text_content(cells[0].args[0]).split())
+
+
+def find_section(text, tree, title):
+    """Return the first cell group whose header cell's text is title.
+    
+    Matching ignores case and surrounding whitespace; only group headers
+    are read. Returns None if there is no such group.
+    """
+    wanted = ' '.join(title.split()).casefold()
+    for group in iter_groups(tree):
+        header = group.header
+        if header is not None and cell_title(text, header).casefold() == wanted:
+            return group
+    return None
+
+
+# Cell styles skipped by the --skip-output, --skip-messages and
+# --skip-input options
+SKIP_OUTPUT_STYLES = ('Output', 'Print', 'Echo')
+SKIP_MESSAGE_STYLES = ('Message', 'MSG')
+SKIP_INPUT_STYLES = ('Input', 'Code')
+
+
+# The front end's index of the notebook's cells, written in a comment after
+# the notebook content: (*NotebookFileOutline Notebook[{Cell[offset, line,
+# length, lines, height, "Style", ...], ...}] *). Its position is given in
+# the file header as NotebookOutlinePosition[offset, line].
+OUTLINE_START = '(*NotebookFileOutline'
+OUTLINE_POSITION_PATTERN = re.compile(r'NotebookOutlinePosition\[\s*(\d+),\s*\d+\]')
+OUTLINE_TOKEN_PATTERN = re.compile(r"""
+    (?P<group>Cell\[\s*CellGroupData\[\s*\{)
+  | (?P<cell>Cell\[\s*(?P<offset>\d+),\s*\d+,\s*(?P<length>\d+),[^"\]]*
+        (?:"(?P<style>[^"\\]*(?:\\.[^"\\]*)*)")?[^\]]*\])
+  | (?P<close>\}\s*,\s*(?P<state>Open|Closed)\s*\]\s*\])
+""", re.VERBOSE)
+
+# Bytes read from the start of a file to find NotebookOutlinePosition
+OUTLINE_HEADER_SIZE = 2048
+
+
+def parse_outline(outline_text):
+    """Parse the text of a NotebookFileOutline into a cell tree (None if unreadable).
+    
+    Cell offsets in the tree are those recorded by the front end (byte
+    offsets in the file); they are not checked here. Groups get the span
+    of their first and last cell.
+    """
+    if not outline_text.lstrip().startswith('Notebook['):
+        return None
+    root = []
+    stack = [(root, None)]
+    for match in OUTLINE_TOKEN_PATTERN.finditer(outline_text):
+        kind = match.lastgroup
+        if kind == 'cell':
+            start = int(match.group('offset'))
+            style = match.group('style')
+            if style is not None:
+                style = decode_box_string(style)
+            stack[-1][0].append(NotebookCell(start, start + int(match.group('length')), style))
+        elif kind == 'group':
+            group = CellGroup(None)
+            stack[-1][0].append(group)
+            stack.append((group.cells, group))
+        elif len(stack) > 1:
+            _, group = stack.pop()
+            if not group.cells:
+                return None
+            group.closed = match.group('state') == 'Closed'
+            group.start = group.cells[0].start
+            group.end = group.cells[-1].end
+        else:
+            return None
+    if len(stack) > 1 or not root:
+        return None
+    return root
+
+
+def _valid_outline_cells(text, items, previous_end=0):
+    """Check outline cells against text and fill in where their content ends.
+    
+    Returns the end of the last cell, or None if a cell does not sit at
+    its recorded offsets (the outline is stale).
+    """
+    for item in items:
+        if item.is_group:
+            previous_end = _valid_outline_cells(text, item.cells, previous_end)
+            if previous_end is None:
+                return None
+            continue
+        start, end = item.start, item.end
+        if start < previous_end or not text.startswith('Cell[', start) or text[end - 1:end] != ']':
+            return None
+        # The content ends at the comma before the style string
+        item.content_end = end - 1
+        if item.style is not None:
+            style_pos = text.rfind('"' + item.style + '"', start, end)
+            if style_pos > start:
+                item.content_end = text.rindex(',', start, style_pos)
+        previous_end = end
+    return previous_end
+
+
+def outline_cell_tree(text):
+    """Build the cell tree from the notebook's own outline, if it is usable.
+    
+    Returns None when text has no NotebookFileOutline, when it holds
+    non-ASCII characters (outline offsets are in bytes) or when any cell
+    is not at its recorded offsets, e.g. because the file was edited
+    outside the front end.
+    """
+    begin = text.rfind(OUTLINE_START)
+    if begin < 0 or not text.isascii():
+        return None
+    end = text.find('*)', begin)
+    tree = parse_outline(text[begin + len(OUTLINE_START):end if end >= 0 else len(text)])
+    if tree is None or _valid_outline_cells(text, tree) is None:
+        return None
+    return tree
+
+
+def notebook_cell_tree(text, payloads=None):
+    """The notebook's cell tree: from its outline when valid, else by parse_cell_tree."""
+    tree = outline_cell_tree(text)
+    if tree is None:
+        tree = parse_cell_tree(text, payloads)
+    return tree
+
+
+class NotebookOutline:
+    """The cell outline of a notebook file, for reading cells at their offsets.
+    
+    Only the file header and the outline are read to build it; read_cell
+    then seeks to a single cell, so cells can be converted in any order
+    or in parallel without reading the whole file.
+    """
+    
+    def __init__(self, path, tree):
+        self.path = path
+        self.tree = tree
+    
+    def __repr__(self):
+        return f'NotebookOutline({self.path!r})'
+    
+    def cells(self, skip_closed=False):
+        """Iterate over the outline's cells (see iter_cells)."""
+        return iter_cells(self.tree, skip_closed)
+    
+    def read_cell(self, cell, f=None):
+        """Read one cell's source from the file (ValueError if the outline is stale)."""
+        if f is None:
+            with open(self.path, 'rb') as f:
+                return self.read_cell(cell, f)
+        f.seek(cell.start)
+        source = f.read(cell.end - cell.start).decode('utf-8', errors='ignore')
+        if not source.startswith('Cell[') or not source.endswith(']'):
+            raise ValueError(f"Stale notebook outline: no cell at byte {cell.start}")
+        return source
+
+
+def read_outline(path):
+    """Read a notebook file's outline without reading its content.
+    
+    Returns a NotebookOutline, or None if the file has no outline (or
+    its header does not point at one); callers then fall back to a full
+    read and parse_cell_tree.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(OUTLINE_HEADER_SIZE).decode('ascii', errors='ignore')
+        position = OUTLINE_POSITION_PATTERN.search(header)
+        if position is None:
+            return None
+        f.seek(int(position.group(1)))
+        data = f.read().decode('utf-8', errors='ignore')
+    if not data.startswith(OUTLINE_START):
+        return None
+    end = data.find('*)')
+    tree = parse_outline(data[len(OUTLINE_START):end if end >= 0 else len(data)])
+    return NotebookOutline(path, tree) if tree is not None else None
+
+
+def select_cells(notebook_content, section=None, skip_closed=False, skip_styles=(),
+                 payloads=None):
+    """Return the NotebookCell records to convert.
+    
+    section limits the cells to the group headed by that title (ValueError
+    if there is none), skip_closed keeps only the header of closed groups
+    and cells whose style is in skip_styles are left out. Skipped cells
+    are only tokenized by the walker, never sliced or processed.
+    The cell tree comes from the notebook's outline when it has a valid
+    one (see notebook_cell_tree); payloads is passed on to parse_cell_tree.
+    """
+    tree = notebook_cell_tree(notebook_content, payloads)
+    if section is not None:
+        group = find_section(notebook_content, tree, section)
+        if group is None:
+            raise ValueError(f"Section not found: {section}")
+        tree = group.cells
+    return [cell for cell in iter_cells(tree, skip_closed) if cell.style not in skip_styles]
+
+
+def extract_cells_from_notebook(notebook_content, cell_cache=None, section=None, cells=None,
+                                payloads=None, jobs=1, path=None, executor='auto'):
+    """Extract cells from a Mathematica notebook.
+    
+    If cell_cache (a dict) is given, processed results are looked up by the
+    cell's source text so unchanged cells are not converted again. On return
+    the cache holds exactly the cells of this notebook.
+    If section is given, only the cells of the group headed by that
+    section title are processed (ValueError if there is none). cells
+    (from select_cells) gives the exact cells to process instead.
+    Binary payloads (payloads, a PayloadIndex, found when not given) are
+    left out of the cell text that is processed.
+    With jobs > 1, the cells to convert are processed in a pool of that
+    many workers (see process_cells_parallel); process pools need the
+    notebook's file path.
+    """
+    if payloads is None:
+        payloads = PayloadIndex(notebook_content, 0, notebook_content_end(notebook_content))
+    if cells is None:
+        cells = select_cells(notebook_content, section, payloads=payloads)
+    results = []
+    seen = {} if cell_cache is not None else None
+    
+    sources = None
+    if cell_cache is not None:
+        sources = [payloads.mask(cell.start, cell.end) for cell in cells]
+    
+    # Convert the cells that are not cached in worker processes
+    converted = {}
+    if jobs > 1 and (path is not None or executor_kind(executor) == 'thread'):
+        if sources is None:
+            pending = cells
+        else:
+            pending = [cell for cell, source in zip(cells, sources) if source not in cell_cache]
+        if len(pending) >= PARALLEL_MIN_CELLS:
+            parallel = process_cells_parallel(path, notebook_content, pending, jobs,
+                                              executor, payloads)
+            converted = {cell.start: processed for cell, processed in zip(pending, parallel)}
+    
+    for i, cell in enumerate(cells):
+        # Process the cell content (reusing the cached result if unchanged)
+        processed = converted.get(cell.start, _NOT_PROCESSED)
+        if cell_cache is None:
+            if processed is _NOT_PROCESSED:
+                processed = process_cell_content(payloads.mask(cell.start, cell.end), cell.style)
+        else:
+            cell_content = sources[i]
+            if processed is _NOT_PROCESSED:
+                processed = cell_cache.get(cell_content)
+            if processed is None:
+                processed = process_cell_content(cell_content, cell.style)
+            seen[cell_content] = processed
+        if processed:
+            # Could be a string or a tuple ('TABLE', data) or ('INPUT', code) or ('GRAPHIC', data)
+            # or ('OUTPUT', environment, latex) or ('HEADING', style, text) or ('TEXT', text),
+            # or a list of ('TABLE', data) tuples
+            if isinstance(processed, tuple):
+                results.append(processed)
+            elif isinstance(processed, list):
+                results.extend(processed)
+            elif isinstance(processed, str) and len(processed) > 3:
+                results.append(processed)
+    
+    if cell_cache is not None:
+        cell_cache.clear()
+        cell_cache.update(seen)
+    
+    return results
+
+
+# Fewest cells worth sending to a worker pool, and chunks per worker
+# (more chunks than workers evens out cells of very different sizes)
+PARALLEL_MIN_CELLS = 64
+PARALLEL_CHUNKS_PER_JOB = 4
+
+# Worker pools: 'auto' uses threads when the interpreter runs without the
+# GIL (free-threaded builds) and processes otherwise
+EXECUTOR_KINDS = ('auto', 'process', 'thread')
+
+
+def gil_disabled():
+    """Return True on a free-threaded interpreter running without the GIL."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def executor_kind(kind='auto'):
+    """Resolve an EXECUTOR_KINDS value to 'process' or 'thread'."""
+    if kind not in EXECUTOR_KINDS:
+        raise ValueError(f"Unknown executor: {kind}")
+    if kind == 'auto':
+        return 'thread' if gil_disabled() else 'process'
+    return kind
+
+
+def make_executor(max_workers, kind='auto', mp_context=None):
+    """Return a pool of max_workers threads or processes (see EXECUTOR_KINDS).
+    
+    The conversion functions keep no module-level mutable state (compiled
+    patterns and tables are read-only, box_to_latex's cache is locked), so
+    they can run in threads; without the GIL that avoids pickling inputs
+    and results. mp_context only applies to process pools.
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    if executor_kind(kind) == 'thread':
+        return ThreadPoolExecutor(max_workers=max_workers)
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+
+def _chunk_spans(spans, count):
+    """Split (start, end, style) spans into about count runs of similar byte size."""
+    total = sum(end - start for start, end, _ in spans)
+    target = max(1, total // max(1, count))
+    chunks = []
+    chunk = []
+    size = 0
+    for span in spans:
+        chunk.append(span)
+        size += span[1] - span[0]
+        if size >= target:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _process_cell_chunk(path, spans):
+    """Process a run of cells of a notebook file, read at their byte offsets.
+    
+    Runs in a worker process: the file is memory-mapped, so only the
+    (start, end, style) spans are sent to the worker and only the
+    processed cells come back.
+    """
+    import mmap
+    results = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for start, end, style in spans:
+            source = data[start:end].decode('utf-8', errors='ignore')
+            if '\r' in source:
+                # Translate line endings as reading the file in text mode does
+                source = source.replace('\r\n', '\n').replace('\r', '\n')
+            payloads = PayloadIndex(source)
+            results.append(process_cell_content(payloads.mask(0, len(source)), style))
+    return results
+
+
+def _file_cell_spans(path, notebook_content, cells):
+    """Return the (start, end, style) byte spans of cells in the file at path.
+    
+    notebook_content was read from the file in text mode (see
+    file_byte_offsets). Returns None unless every span starts with Cell[
+    in the file, e.g. for mixed line endings or invalid UTF-8 dropped on
+    reading.
+    """
+    import mmap
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        byte_offset = file_byte_offsets(notebook_content, len(data))
+        if byte_offset is None:
+            return None
+        spans = [(byte_offset(cell.start), byte_offset(cell.end), cell.style) for cell in cells]
+        for start, _, _ in spans:
+            if data[start:start + 5] != b'Cell[':
+                return None
+    return spans
+
+
+def _process_text_chunk(notebook_content, payloads, spans):
+    """Process a run of cells of notebook_content (in a worker thread)."""
+    return [process_cell_content(payloads.mask(start, end), style) for start, end, style in spans]
+
+
+def process_cells_parallel(path, notebook_content, cells, jobs, executor='auto', payloads=None):
+    """Run process_cell_content for cells of the notebook file at path in jobs workers.
+    
+    cells (NotebookCell records of notebook_content, the file's text) are
+    split into contiguous chunks. In worker processes each worker maps the
+    file and reads its cells by byte offset; worker threads (executor, see
+    EXECUTOR_KINDS) share notebook_content and payloads, and need no path.
+    When the file's bytes do not line up with notebook_content (mixed line
+    endings, invalid UTF-8 dropped on reading), the cells are converted
+    serially instead. Results are returned in the order of cells.
+    """
+    if payloads is None:
+        payloads = PayloadIndex(notebook_content, 0, notebook_content_end(notebook_content))
+    text_spans = [(cell.start, cell.end, cell.style) for cell in cells]
+    kind = executor_kind(executor)
+    if kind == 'thread':
+        chunks = _chunk_spans(text_spans, jobs * PARALLEL_CHUNKS_PER_JOB)
+        arguments = ([notebook_content] * len(chunks), [payloads] * len(chunks), chunks)
+        process_chunk = _process_text_chunk
+    else:
+        spans = _file_cell_spans(path, notebook_content, cells)
+        if spans is None:
+            return _process_text_chunk(notebook_content, payloads, text_spans)
+        chunks = _chunk_spans(spans, jobs * PARALLEL_CHUNKS_PER_JOB)
+        arguments = ([path] * len(chunks), chunks)
+        process_chunk = _process_cell_chunk
+    
+    results = []
+    with make_executor(min(jobs, len(chunks)), kind) as pool:
+        for chunk_results in pool.map(process_chunk, *arguments):
+            results.extend(chunk_results)
+    return results
+
+
+# Table output modes: 'auto' uses longtable for tables longer than
+# LONGTABLE_MIN_ROWS, 'csv' also writes those tables to CSV files that are
+# loaded with csvsimple
+TABLE_FORMATS = ('auto', 'tabular', 'longtable', 'csv')
+LONGTABLE_MIN_ROWS = 40
+
+# Rows converted per batch when rendering a table
+TABLE_CHUNK_ROWS = 1000
+
+# Joins the cells of a column so per-cell conversions run once per column
+CELL_SEPARATOR = '\x00'
+
+
+# A number in a table cell, after exponents have been normalized (each
+# digit run can only be matched one way, so a failed match never backtracks)
+TABLE_NUMBER_PATTERN = re.compile(r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?')
+
+# Mathematica exponents: 1.5*^-3, 1.5\[Times]10^-3, 1.5\times 10^{-3}
+EXPONENT_PATTERN = re.compile(
+    r'(\d\.?)\s*(?:\*\^|(?:\\\[Times\]|\\times|×|\*)\s*10\^)\{?([+-]?\d+)\}?'
+)
+
+
+def normalize_numbers(text):
+    """Rewrite Mathematica exponent notation as e-notation (1.5*^-3 -> 1.5e-3)."""
+    if '^' not in text:
+        return text
+    return EXPONENT_PATTERN.sub(r'\1e\2', text)
+
+
+def infer_column_types(table_data):
+    """Return a list with True for each column that holds only numbers.
+    
+    The first row is the header and is not classified. Empty cells are
+    allowed, but a column needs at least one number. Exponents are
+    normalized once per joined column; each cell is then matched on its
+    own, stopping at the first one that is not a number.
+    """
+    max_cols = max(len(row) for row in table_data)
+    body = table_data[1:]
+    numeric = []
+    for col in range(max_cols):
+        joined = normalize_numbers(
+            CELL_SEPARATOR.join(row[col] if col < len(row) else '' for row in body)
+        )
+        numeric.append(bool(body) and len(joined) > len(body) - 1
+                       and all(not value or TABLE_NUMBER_PATTERN.fullmatch(value)
+                               for value in joined.split(CELL_SEPARATOR)))
+    return numeric
+
+
+def column_spec(numeric):
+    """LaTeX column spec: S (siunitx) for numeric columns, l otherwise."""
+    return ''.join('S' if is_numeric else 'l' for is_numeric in numeric)
+
+
+def convert_table_cells(rows, max_cols, numeric=None):
+    """Convert a batch of table rows to LaTeX cell values.
+    
+    Symbol conversion and math spacing run once over each whole column;
+    sub/superscript conversion only runs on the cells that need it.
+    Columns flagged in numeric only get their exponents normalized.
+    Rows are padded to max_cols.
+    """
+    columns = []
+    for col in range(max_cols):
+        column = CELL_SEPARATOR.join(row[col] if col < len(row) else '' for row in rows)
+        if numeric and numeric[col]:
+            columns.append(normalize_numbers(column).split(CELL_SEPARATOR))
+            continue
+        values = convert_symbols(column).split(CELL_SEPARATOR)
+        for i, value in enumerate(values):
+            if 'script' in value or 'Power[' in value:
+                values[i] = convert_superscripts(convert_subscripts(value))
+        column = fix_math_spacing(CELL_SEPARATOR.join(values))
+        values = column.split(CELL_SEPARATOR)
+        # Classify values one by one only when the column has any math
+        if is_math_content(column):
+            for i, value in enumerate(values):
+                if '$' not in value and is_math_content(value):
+                    values[i] = f'${value}$'
+        columns.append(values)
+    return zip(*columns)
+
+
+def iter_converted_rows(table_data, numeric):
+    """Yield converted table rows, converting TABLE_CHUNK_ROWS rows at a time.
+    
+    Header cells of numeric columns are braced so siunitx treats them as text.
+    """
+    max_cols = len(numeric)
+    header = list(next(iter(convert_table_cells(table_data[:1], max_cols))))
+    for col, is_numeric in enumerate(numeric):
+        if is_numeric and header[col]:
+            header[col] = '{' + header[col] + '}'
+    yield header
+    for start in range(1, len(table_data), TABLE_CHUNK_ROWS):
+        yield from convert_table_cells(table_data[start:start + TABLE_CHUNK_ROWS], max_cols, numeric)
+
+
+def render_tabular(table_data, numeric):
+    """Yield the lines of a centered tabular for a table."""
+    yield r'\begin{center}'
+    yield r'\begin{tabular}{' + column_spec(numeric) + '}'
+    yield r'\hline'
+    for i, row in enumerate(iter_converted_rows(table_data, numeric)):
+        yield ' & '.join(row) + r' \\'
+        # Add hline after header row
+        if i == 0:
+            yield r'\hline'
+    yield r'\hline'
+    yield r'\end{tabular}'
+    yield r'\end{center}'
+
+
+def render_longtable(table_data, numeric):
+    """Yield the lines of a longtable, which LaTeX breaks across pages.
+    
+    The header row is repeated at the top of every page.
+    """
+    rows = iter_converted_rows(table_data, numeric)
+    header = ' & '.join(next(rows)) + r' \\'
+    yield r'\begin{longtable}{' + column_spec(numeric) + '}'
+    yield r'\hline'
+    yield header
+    yield r'\hline'
+    yield r'\endfirsthead'
+    yield r'\hline'
+    yield header
+    yield r'\hline'
+    yield r'\endhead'
+    yield r'\hline'
+    yield r'\endfoot'
+    for row in rows:
+        yield ' & '.join(row) + r' \\'
+    yield r'\end{longtable}'
+
+
+def write_table_csv(table_data, numeric, csv_path):
+    """Write a table to a CSV file for csvsimple.
+    
+    Values containing commas are wrapped in braces, which csvsimple
+    reads as a single value.
+    """
+    os.makedirs(os.path.dirname(csv_path) or '.', exist_ok=True)
+    with open(csv_path, 'w', encoding='utf-8') as f:
+        for row in iter_converted_rows(table_data, numeric):
+            f.write(','.join('{' + value + '}' if ',' in value else value
+                             for value in row) + '\n')
+
+
+def render_table(table_data, table_format='auto', csv_file=None, csv_path=None):
+    """Render a table in the given table format.
+    
+    Returns (lines, packages): an iterator over the LaTeX lines and the
+    packages they need. In 'csv' mode, long tables are written to csv_path
+    and the lines load csv_file (the same file, relative to the .tex output).
+    """
+    long_table = len(table_data) > LONGTABLE_MIN_ROWS
+    numeric = infer_column_types(table_data)
+    if table_format == 'csv' and long_table and csv_path:
+        write_table_csv(table_data, numeric, csv_path)
+        return iter([r'\csvautobooklongtable{' + csv_file + '}']), ('longtable', 'csvsimple')
+    
+    packages = ('siunitx',) if any(numeric) else ()
+    if table_format == 'longtable' or (table_format != 'tabular' and long_table):
+        return render_longtable(table_data, numeric), ('longtable',) + packages
+    return render_tabular(table_data, numeric), packages
+
+
+def convert_notebook_to_latex(input_file, cell_cache=None, table_format='auto', output_dir=None,
+                              section=None, skip_closed=False, skip_styles=(), jobs=1,
+                              executor='auto'):
+    """Convert a Mathematica notebook to LaTeX.
+    
+    Pass the same cell_cache dict on repeated conversions of a notebook
+    (e.g. a live preview) to reconvert only the cells that changed.
+    table_format is one of TABLE_FORMATS; in 'csv' mode long tables are
+    written to <output_dir>/<notebook>_tables/, next to the .tex file
+    (output_dir defaults to the notebook's directory).
+    With section, only the cell group headed by that title is converted;
+    skip_closed and skip_styles leave out closed groups (except their
+    header) and cells of the given styles (see select_cells).
+    jobs > 1 converts the cells of a large notebook in that many workers,
+    processes or threads as chosen by executor (see EXECUTOR_KINDS).
+    """
+    with open(input_file, 'r', encoding='utf-8', errors='ignore') as f:
+        content = f.read()
+    
+    # Pick the cells to convert (a section, without skipped groups/styles);
+    # binary payloads are found once and kept out of all text processing
+    payloads = PayloadIndex(content, 0, notebook_content_end(content))
+    selected = select_cells(content, section, skip_closed, skip_styles, payloads)
+    
+    # Create output directory for figures
+    output_base = os.path.splitext(os.path.basename(input_file))[0]
+    figures_dir = f"{output_base}_figures"
+    tables_dir = f"{output_base}_tables"
+    table_idx = 0
+    packages = set()
+    
+    # Extract graphics (only from the selected cells when some are left out)
+    if section is not None or skip_closed or skip_styles:
+        graphics_list = extract_graphics(
+            ''.join(payloads.mask(cell.start, cell.end) for cell in selected), figures_dir)
+    else:
+        graphics_list = extract_graphics(payloads.mask(0, len(content)), figures_dir)
+    
+    # Extract cells
+    cells = extract_cells_from_notebook(content, cell_cache, cells=selected, payloads=payloads,
+                                        jobs=jobs, path=input_file, executor=executor)
+    
+    # Build LaTeX document
+    latex_output = []
+    
+    latex_output.append(r'\documentclass{article}')
+    latex_output.append(r'\usepackage{amsmath}')
+    latex_output.append(r'\usepackage{amssymb}')
+    latex_output.append(r'\usepackage{graphicx}')
+    latex_output.append(r'\usepackage{array}')
+    latex_output.append(r'\usepackage{booktabs}')
+    # Table packages are inserted here once the body is known
+    packages_index = len(latex_output)
+    latex_output.append(r'\usepackage{float}')
+    latex_output.append(r'\usepackage{listings}')
+    latex_output.append(r'\usepackage{xcolor}')
+    latex_output.append(r'')
+    latex_output.append(r'% Configure listings for Mathematica code')
+    latex_output.append(r'\lstset{')
+    latex_output.append(r'  language=Mathematica,')
+    latex_output.append(r'  basicstyle=\small\ttfamily,')
+    latex_output.append(r'  keywordstyle=\color{blue},')
+    latex_output.append(r'  commentstyle=\color{green!60!black},')
+    latex_output.append(r'  stringstyle=\color{red},')
+    latex_output.append(r'  numbers=none,')
+    latex_output.append(r'  frame=single,')
+    latex_output.append(r'  breaklines=true,')
+    latex_output.append(r'  backgroundcolor=\color{gray!10},')
+    latex_output.append(r'  captionpos=b')
+    latex_output.append(r'}')
+    latex_output.append(r'')
+    latex_output.append(r'\begin{document}')
+    latex_output.append(r'')
+    
+    # Add title (replaced by the notebook's first Title cell, if any)
+    filename = os.path.splitext(os.path.basename(input_file))[0]
+    title_index = len(latex_output)
+    latex_output.append(r'\title{' + filename + '}')
+    latex_output.append(r'\maketitle')
+    latex_output.append(r'')
+    
+    # Track graphics index
+    graphic_idx = 0
+    
+    # Group content for better flow
+    current_paragraph = []
+    
+    # Add cells
+    for cell in cells:
+        # Handle input code cells
+        if isinstance(cell, tuple) and cell[0] == 'INPUT':
+            # Flush current paragraph
+            if current_paragraph:
+                latex_output.append(' '.join(current_paragraph))
                 latex_output.append(r'')
                 current_paragraph = []
             
@@ -557,6 +2250,43 @@ def convert_notebook_to_latex(input_file):
             latex_output.append(r'')
             continue
         
+        # Handle heading and text cells, identified by their cell style
+        if isinstance(cell, tuple) and cell[0] in ('HEADING', 'TEXT'):
+            # Flush current paragraph
+            if current_paragraph:
+                latex_output.append(' '.join(current_paragraph))
+                latex_output.append(r'')
+                current_paragraph = []
+            
+            if cell[0] == 'TEXT':
+                latex_output.append(cell[1])
+            elif cell[1] == 'Title' and title_index is not None:
+                latex_output[title_index] = r'\title{' + cell[2] + '}'
+                title_index = None
+                continue
+            else:
+                command = CELL_STYLE_COMMANDS[cell[1]]
+                if command == r'\title':
+                    command = r'\section*'
+                latex_output.append(command + '{' + cell[2] + '}')
+            latex_output.append(r'')
+            continue
+        
+        # Handle output cells (display math)
+        if isinstance(cell, tuple) and cell[0] == 'OUTPUT':
+            # Flush current paragraph
+            if current_paragraph:
+                latex_output.append(' '.join(current_paragraph))
+                latex_output.append(r'')
+                current_paragraph = []
+            
+            environment, math = cell[1], cell[2]
+            latex_output.append(r'\begin{' + environment + '}')
+            latex_output.append(math)
+            latex_output.append(r'\end{' + environment + '}')
+            latex_output.append(r'')
+            continue
+        
         # Handle graphic cells
         if isinstance(cell, tuple) and cell[0] == 'GRAPHIC':
             # Flush current paragraph
@@ -588,40 +2318,14 @@ def convert_notebook_to_latex(input_file):
             
             table_data = cell[1]
             if table_data:
-                # Determine number of columns
-                max_cols = max(len(row) for row in table_data)
-                col_format = 'l' * max_cols
-                
-                latex_output.append(r'\begin{center}')
-                latex_output.append(r'\begin{tabular}{' + col_format + '}')
-                latex_output.append(r'\hline')
-                
-                for i, row in enumerate(table_data):
-                    # Convert symbols in cells
-                    converted_row = []
-                    for cell_val in row:
-                        cell_val = convert_symbols(cell_val)
-                        cell_val = convert_subscripts(cell_val)
-                        cell_val = convert_superscripts(cell_val)
-                        cell_val = fix_math_spacing(cell_val)
-                        if is_math_content(cell_val):
-                            cell_val = f'${cell_val}$'
-                        converted_row.append(cell_val)
-                    
-                    # Pad row if needed
-                    while len(converted_row) < max_cols:
-                        converted_row.append('')
-                    
-                    latex_output.append(' & '.join(converted_row) + r' \\')
-                    
-                    # Add hline after header row
-                    if i == 0:
-                        latex_output.append(r'\hline')
-                
-                latex_output.append(r'\hline')
-                latex_output.append(r'\end{tabular}')
-                latex_output.append(r'\end{center}')
+                table_idx += 1
+                csv_file = f"{tables_dir}/table_{table_idx}.csv"
+                csv_path = os.path.join(
+                    output_dir if output_dir is not None else os.path.dirname(input_file), csv_file)
+                lines, table_packages = render_table(table_data, table_format, csv_file, csv_path)
+                latex_output.extend(lines)
                 latex_output.append(r'')
+                packages.update(table_packages)
             continue
         
         # Skip cells that are just a single backslash or newline or empty
@@ -632,11 +2336,12 @@ def convert_notebook_to_latex(input_file):
         if cell.startswith('\\') and len(cell) <= 2:
             continue
         
-        # Check if this is a heading/title (short, possibly bold text)
+        # Unstyled (Print) text: check if this is a heading/title (short, possibly bold text)
         is_heading = len(cell) < 80 and not any(word in cell.lower() for word in ['equation', 'where', 'using', 'for', 'with'])
         
         # Regular text or math content
-        if is_heading and not is_math_content(cell):
+        is_math = is_math_content(cell)
+        if is_heading and not is_math:
             # Flush current paragraph
             if current_paragraph:
                 latex_output.append(' '.join(current_paragraph))
@@ -651,7 +2356,7 @@ def convert_notebook_to_latex(input_file):
             latex_output.append(r'')
         else:
             # Regular content - add to paragraph
-            if is_math_content(cell):
+            if is_math:
                 # Wrap in math mode if not already and contains inline math
                 if not (cell.startswith('$') or cell.startswith(r'\[') or '$' in cell):
                     cell = f'${cell}$'
@@ -686,9 +2391,473 @@ def convert_notebook_to_latex(input_file):
     
     latex_output.append(r'\end{document}')
     
+    latex_output[packages_index:packages_index] = [
+        r'\usepackage{' + package + '}' for package in sorted(packages)
+    ]
+    
     return '\n'.join(latex_output)
 
 
+USEPACKAGE_LINE = re.compile(r'^\\usepackage(?:\[[^\]\n]*\])?\{[^}\n]*\}[ \t]*$', re.MULTILINE)
+DOCUMENT_BODY = re.compile(r'\\begin\{document\}(.*?)\\end\{document\}', re.DOTALL)
+
+
+def merge_latex_documents(documents, separator=''):
+    """Merge LaTeX documents into the first one.
+    
+    The bodies of the other documents are appended to the first body,
+    each preceded by separator, and every \\usepackage line they need
+    (e.g. longtable or siunitx for their tables) is added to the first
+    document's preamble after its own packages.
+    """
+    combined = documents[0]
+    preamble_end = combined.find(r'\begin{document}')
+    if preamble_end < 0:
+        return combined
+    package_lines = list(USEPACKAGE_LINE.finditer(combined, 0, preamble_end))
+    packages = {line.group() for line in package_lines}
+    new_packages = []
+    bodies = []
+    for latex in documents[1:]:
+        content_match = DOCUMENT_BODY.search(latex)
+        if not content_match:
+            continue
+        bodies.append(separator + content_match.group(1))
+        for package in USEPACKAGE_LINE.findall(latex, 0, content_match.start()):
+            if package not in packages:
+                packages.add(package)
+                new_packages.append(package + '\n')
+    
+    end = combined.rfind(r'\end{document}')
+    combined = combined[:end] + ''.join(bodies) + combined[end:]
+    insert_at = package_lines[-1].end() + 1 if package_lines else preamble_end
+    return combined[:insert_at] + ''.join(new_packages) + combined[insert_at:]
+
+
+# Kind of a cell, by cell style; other styles are 'other'
+CELL_KINDS = {
+    **{style: 'heading' for style in CELL_STYLE_COMMANDS},
+    **{style: 'text' for style in TEXT_CELL_STYLES},
+    **{style: 'formula' for style in DISPLAY_CELL_STYLES},
+    **{style: 'input' for style in CODE_CELL_STYLES},
+    'Output': 'output',
+    'Print': 'print',
+    'Echo': 'print',
+    'Message': 'message',
+    'MSG': 'message',
+}
+
+
+def render_cell_latex(processed, is_math=None):
+    """Render one processed cell (from process_cell_content) as LaTeX.
+    
+    is_math is is_math_content(processed) for text results, when already known.
+    """
+    if not processed:
+        return ''
+    if isinstance(processed, list):
+        return '\n\n'.join(render_cell_latex(item) for item in processed)
+    if isinstance(processed, str):
+        if is_math is None:
+            is_math = is_math_content(processed)
+        if is_math and '$' not in processed:
+            return f'${processed}$'
+        return processed
+    
+    kind = processed[0]
+    if kind == 'INPUT':
+        return '\n'.join([r'\begin{lstlisting}', processed[1], r'\end{lstlisting}'])
+    if kind == 'OUTPUT':
+        environment, math = processed[1], processed[2]
+        return '\n'.join([r'\begin{' + environment + '}', math, r'\end{' + environment + '}'])
+    if kind == 'HEADING':
+        command = CELL_STYLE_COMMANDS[processed[1]]
+        if command == r'\title':
+            command = r'\section*'
+        return command + '{' + processed[2] + '}'
+    if kind == 'TEXT':
+        return processed[1]
+    if kind == 'TABLE':
+        lines, _ = render_table(processed[1], 'tabular')
+        return '\n'.join(lines)
+    if kind == 'GRAPHIC':
+        return '% Graphic: export it from Mathematica to include it'
+    return ''
+
+
+# Marks a Cell whose result has not been computed yet
+_NOT_PROCESSED = object()
+
+
+class Cell:
+    """A typed notebook cell whose conversion happens on first use.
+    
+    style and kind come from the cell walker and cost nothing; source,
+    result (process_cell_content), code and latex are computed lazily,
+    and the result and its math classification (is_math) are cached on
+    the cell.
+    """
+    
+    __slots__ = ('notebook', 'record', '_result', '_is_math')
+    
+    def __init__(self, notebook, record):
+        self.notebook = notebook
+        self.record = record
+        self._result = _NOT_PROCESSED
+        self._is_math = None
+    
+    def __repr__(self):
+        return f'Cell({self.style!r}, {self.start}:{self.end})'
+    
+    @property
+    def style(self):
+        return self.record.style
+    
+    @property
+    def kind(self):
+        """'heading', 'text', 'formula', 'input', 'output', 'print', 'message' or 'other'."""
+        return CELL_KINDS.get(self.record.style, 'other')
+    
+    @property
+    def start(self):
+        return self.record.start
+    
+    @property
+    def end(self):
+        return self.record.end
+    
+    @property
+    def source(self):
+        """The cell's notebook source text."""
+        return self.notebook.text[self.record.start:self.record.end]
+    
+    @property
+    def payloads(self):
+        """The cell's binary payloads (Payload records, decoded on request)."""
+        return self.notebook.payloads.within(self.record.start, self.record.end)
+    
+    @property
+    def result(self):
+        """The processed cell, as returned by process_cell_content."""
+        if self._result is _NOT_PROCESSED:
+            masked = self.notebook.payloads.mask(self.record.start, self.record.end)
+            self._result = process_cell_content(masked, self.record.style)
+        return self._result
+    
+    @property
+    def code(self):
+        """Source code of an input cell, or None for other cells."""
+        if self.kind != 'input':
+            return None
+        return extract_input_code(self.notebook.payloads.mask(self.record.start, self.record.end))
+    
+    @property
+    def is_math(self):
+        """Whether the cell's text result is math (is_math_content), classified once."""
+        if self._is_math is None:
+            result = self.result
+            self._is_math = isinstance(result, str) and is_math_content(result)
+        return self._is_math
+    
+    @property
+    def latex(self):
+        """The cell rendered as LaTeX on its own."""
+        return render_cell_latex(self.result, self.is_math)
+    
+    @property
+    def text(self):
+        """The cell's plain text, without LaTeX conversion (see cell_plain_text)."""
+        return cell_plain_text(self.notebook.text, self.record,
+                               payloads=self.notebook.payloads).strip()
+    
+    @property
+    def table(self):
+        """Rows of the cell's first table, or None."""
+        result = self.result
+        for item in (result if isinstance(result, list) else [result]):
+            if isinstance(item, tuple) and item[0] == 'TABLE':
+                return item[1]
+        return None
+
+
+class Notebook:
+    """A notebook's cell structure, with cells converted on demand.
+    
+    Loading only walks the cell tree; no cell is converted until its
+    result or latex is requested.
+    """
+    
+    def __init__(self, text, path=None):
+        self.text = text
+        self.path = path
+        self.payloads = PayloadIndex(text, 0, notebook_content_end(text))
+        self.tree = notebook_cell_tree(text, self.payloads)
+    
+    def __repr__(self):
+        return f'Notebook({self.path!r})'
+    
+    def cells(self, kinds=None, skip_closed=False):
+        """Iterate over the cells, optionally only those of the given kinds."""
+        for record in iter_cells(self.tree, skip_closed):
+            cell = Cell(self, record)
+            if kinds is None or cell.kind in kinds:
+                yield cell
+    
+    def __iter__(self):
+        return self.cells()
+    
+    def groups(self):
+        """Iterate over the notebook's cell groups, outer groups first."""
+        return iter_groups(self.tree)
+    
+    def section(self, title):
+        """Return the cells of the group headed by title (ValueError if none)."""
+        group = find_section(self.text, self.tree, title)
+        if group is None:
+            raise ValueError(f"Section not found: {title}")
+        return [Cell(self, record) for record in iter_cells(group.cells)]
+    
+    def code_cells(self):
+        """Iterate over the input (code) cells."""
+        return self.cells(kinds=('input',))
+    
+    def to_latex(self, **options):
+        """Convert the whole notebook file (see convert_notebook_to_latex)."""
+        if self.path is None:
+            raise ValueError("to_latex needs a notebook loaded from a file")
+        return convert_notebook_to_latex(self.path, **options)
+
+
+class ByteOffsets:
+    """Maps character positions in a text to byte offsets in its UTF-8 encoding.
+    
+    Notebook files are normally ASCII, where positions map to themselves;
+    otherwise the encoded length is counted from the last position
+    asked for, so increasing positions cost one pass over the text.
+    With crlf, the text was read from a file with CRLF line endings
+    (translated on reading), and each newline counts two bytes.
+    """
+    
+    __slots__ = ('text', 'identity', 'crlf', 'pos', 'offset')
+    
+    def __init__(self, text, crlf=False):
+        self.text = text
+        self.identity = text.isascii() and not crlf
+        self.crlf = crlf
+        self.pos = 0
+        self.offset = 0
+    
+    def __call__(self, pos):
+        if self.identity:
+            return pos
+        if pos < self.pos:
+            self.pos = self.offset = 0
+        chunk = self.text[self.pos:pos]
+        self.offset += len(chunk.encode('utf-8'))
+        if self.crlf:
+            self.offset += chunk.count('\n')
+        self.pos = pos
+        return self.offset
+
+
+def file_byte_offsets(text, size):
+    """ByteOffsets for text read in text mode from a file of size bytes.
+    
+    Text mode translates CRLF line endings, so newlines count two bytes
+    when every line of the file ends in CRLF. Returns None when the size
+    matches neither (mixed line endings, invalid UTF-8 dropped on reading).
+    """
+    encoded = len(text) if text.isascii() else len(text.encode('utf-8'))
+    if size == encoded:
+        return ByteOffsets(text)
+    if size == encoded + text.count('\n'):
+        return ByteOffsets(text, crlf=True)
+    return None
+
+
+def iter_cell_records(notebook, section=None, skip_closed=False, skip_styles=()):
+    """Yield one JSON-ready dict per cell of a Notebook, in notebook order.
+    
+    Each record has the cell's type (Cell.kind), style, start/end byte
+    offsets in the notebook file, plain text, LaTeX, code (input cells)
+    and table rows (table cells). Cells are converted as they are
+    yielded.
+    """
+    byte_offset = None
+    if notebook.path is not None and os.path.exists(notebook.path):
+        byte_offset = file_byte_offsets(notebook.text, os.path.getsize(notebook.path))
+    if byte_offset is None:
+        byte_offset = ByteOffsets(notebook.text)
+    for record in select_cells(notebook.text, section, skip_closed, skip_styles,
+                                 notebook.payloads):
+        cell = Cell(notebook, record)
+        yield {
+            'file': notebook.path,
+            'type': cell.kind,
+            'style': cell.style,
+            'start': byte_offset(record.start),
+            'end': byte_offset(record.end),
+            'text': cell.text,
+            'latex': cell.latex,
+            'code': cell.code,
+            'table': cell.table,
+        }
+
+
+def write_ndjson(records, f):
+    """Write records to the open file f as newline-delimited JSON, one per line."""
+    import json
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False))
+        f.write('\n')
+
+
+def load_notebook(path):
+    """Read a notebook file and return its Notebook."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return Notebook(f.read(), path)
+
+
+# Named characters (\[Name]) as Unicode for plain-text output
+UNICODE_CHARACTERS = {
+    'HBar': 'ħ', 'Bullet': '•', 'Checkmark': '✓', 'Times': '×', 'Divide': '÷',
+    'PlusMinus': '±', 'MinusPlus': '∓', 'Minus': '−', 'LessEqual': '≤', 'GreaterEqual': '≥',
+    'NotEqual': '≠', 'Equal': '==', 'LongEqual': '=', 'Infinity': '∞', 'PartialD': '∂',
+    'Integral': '∫', 'Sum': '∑', 'Product': '∏', 'Element': '∈', 'NotElement': '∉',
+    'Subset': '⊂', 'Superset': '⊃', 'Union': '∪', 'Intersection': '∩', 'ForAll': '∀',
+    'Exists': '∃', 'RightArrow': '→', 'LeftArrow': '←', 'LeftRightArrow': '↔',
+    'Rule': '→', 'RuleDelayed': '⧴', 'Implies': '⇒', 'DoubleRightArrow': '⇒',
+    'DoubleLeftRightArrow': '⇔', 'Proportional': '∝', 'Proportion': '∷', 'EmptySet': '∅',
+    'Perpendicular': '⊥', 'Parallel': '∥', 'Angle': '∠', 'Degree': '°', 'Sqrt': '√',
+    'ODoubleDot': 'ö', 'UDoubleDot': 'ü', 'ADoubleDot': 'ä', 'IndentingNewLine': '\n',
+    'NewLine': '\n', 'InvisibleSpace': '', 'InvisibleTimes': '', 'NoBreak': '',
+    'NonBreakingSpace': ' ', 'ThinSpace': ' ', 'MediumSpace': ' ',
+    'ThickSpace': ' ', 'VeryThinSpace': ' ', 'DifferentialD': 'd',
+    'ExponentialE': 'e', 'ImaginaryI': 'i', 'Placeholder': '□', 'Ellipsis': '…',
+    'CenterDot': '·', 'Cross': '⨯', 'Transpose': 'ᵀ', 'Nabla': '∇', 'Del': '∇',
+    'Epsilon': 'ε', 'CurlyEpsilon': 'ε', 'CurlyPhi': 'φ', 'Phi': 'ϕ', 'CurlyTheta': 'ϑ',
+    'Omicron': 'ο', 'Micro': 'µ', 'Angstrom': 'Å', 'Prime': '′', 'DoublePrime': '″',
+}
+GREEK_LETTERS = dict(zip(
+    ('Alpha', 'Beta', 'Gamma', 'Delta', 'Zeta', 'Eta', 'Theta', 'Iota', 'Kappa', 'Lambda',
+     'Mu', 'Nu', 'Xi', 'Pi', 'Rho', 'Sigma', 'Tau', 'Upsilon', 'Chi', 'Psi', 'Omega'),
+    'αβγδζηθικλμνξπρστυχψω'
+))
+UNICODE_CHARACTERS = {
+    **GREEK_LETTERS,
+    **{'Capital' + name: letter.upper() for name, letter in GREEK_LETTERS.items()},
+    'CapitalEpsilon': 'Ε', 'CapitalPhi': 'Φ', 'CapitalOmicron': 'Ο',
+    **UNICODE_CHARACTERS,
+}
+
+# \[Name], \:xxxx and \|xxxxxx character escapes
+CHARACTER_ESCAPE_PATTERN = re.compile(r'\\\[(\w+)\]|\\:([0-9a-fA-F]{4})|\\\|([0-9a-fA-F]{6})')
+
+# Strings in a cell's content; option values (->"Bold") and CompressedData
+# payloads match the first branch and are dropped
+TEXT_STRING_PATTERN = re.compile(
+    r'(?:->|:>|CompressedData\[)\s*' + BOX_STRING + '|"([^"\\\\]*(?:\\\\.[^"\\\\]*)*)"'
+)
+
+
+def _unicode_character(match):
+    name, hex4, hex6 = match.groups()
+    if name is not None:
+        return UNICODE_CHARACTERS.get(name, match.group())
+    return chr(int(hex4 or hex6, 16))
+
+
+def plain_string(raw, unicode=True):
+    """Plain text of a raw box string.
+    
+    Escapes are resolved and embedded boxes reduced to their strings;
+    named characters become Unicode unless unicode is False, in which
+    case they are left as \\[Name] for a later symbol conversion.
+    """
+    if '\\' not in raw:
+        return raw
+    text = decode_box_string(raw)
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        text = decode_box_string(text[1:-1])
+    if '\\!\\(' in text:
+        # Embedded boxes: keep the text of their strings
+        parts = []
+        pos = 0
+        found = find_linear_syntax(text)
+        while found is not None:
+            begin, end, inner = found
+            parts.append(text[pos:begin])
+            parts.extend(plain_string(string, unicode)
+                         for string in TEXT_STRING_PATTERN.findall(inner) if string)
+            pos = end
+            found = find_linear_syntax(text, pos)
+        parts.append(text[pos:])
+        text = ''.join(parts)
+    if unicode and '\\' in text:
+        text = CHARACTER_ESCAPE_PATTERN.sub(_unicode_character, text)
+    return text
+
+
+def cell_strings(text, cell, payloads=None):
+    """The raw strings of a cell's content, without option values or payloads.
+    
+    The notebook text is searched in place between the cell's start and
+    the end of its content, so nothing (in particular not large
+    CompressedData strings) is copied except the strings returned. With
+    payloads (a PayloadIndex) the payload strings are not searched either.
+    """
+    if payloads is None:
+        spans = ((cell.start, cell.content_end),)
+    else:
+        spans = payloads.gaps(cell.start, cell.content_end)
+    return [raw for start, end in spans
+            for raw in TEXT_STRING_PATTERN.findall(text, start, end) if raw]
+
+
+def cell_plain_text(text, cell, unicode=True, payloads=None):
+    """Plain text of a cell: the strings of its content, joined (see plain_string)."""
+    return ''.join(plain_string(raw, unicode) for raw in cell_strings(text, cell, payloads))
+
+
+# Box heads of graphics content, whose strings are labels rather than text
+GRAPHICS_CONTENT_PATTERN = re.compile(r'\b(?:GraphicsBox|Graphics3DBox|GraphicsData)\[')
+
+
+def is_graphics_cell(text, cell):
+    """Whether a cell's content holds graphics (searched in place)."""
+    return GRAPHICS_CONTENT_PATTERN.search(text, cell.start, cell.content_end) is not None
+
+
+def iter_text_cells(notebook_content, section=None, skip_closed=False, skip_styles=()):
+    """Yield (start, end, style, text) for each cell with text.
+    
+    start and end are the cell's offsets in notebook_content. No LaTeX
+    conversion is done: strings are unescaped and named characters
+    mapped to Unicode.
+    """
+    payloads = PayloadIndex(notebook_content, 0, notebook_content_end(notebook_content))
+    for cell in select_cells(notebook_content, section, skip_closed, skip_styles, payloads):
+        cell_text = cell_plain_text(notebook_content, cell, payloads=payloads).strip()
+        if cell_text:
+            yield cell.start, cell.end, cell.style, cell_text
+
+
+def extract_text(path, **options):
+    """Yield (start, end, style, text) for the cells of a notebook file.
+    
+    Options are those of iter_text_cells (section, skip_closed,
+    skip_styles).
+    """
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        content = f.read()
+    yield from iter_text_cells(content, **options)
+
+
+# CLI output formats and their default file suffixes
+OUTPUT_FORMATS = ('latex', 'text', 'ndjson')
+OUTPUT_SUFFIXES = {'latex': '.tex', 'text': '.txt', 'ndjson': '.ndjson'}
+
+
 def main():
     """Main function."""
     parser = argparse.ArgumentParser(
@@ -703,42 +2872,138 @@ def main():
         '-o', '--output',
         help='Output LaTeX file (default: derived from first input file)'
     )
+    parser.add_argument(
+        '--tables',
+        choices=TABLE_FORMATS,
+        default='auto',
+        help='Table output: auto (longtable for long tables), tabular, longtable, '
+             'or csv (long tables written to CSV files loaded with csvsimple)'
+    )
+    parser.add_argument(
+        '--section',
+        help='Convert only the cell group with this section title (e.g. "Problem 3")'
+    )
+    parser.add_argument(
+        '--skip-closed',
+        action='store_true',
+        help='Skip the contents of closed cell groups (their header is kept)'
+    )
+    parser.add_argument(
+        '--skip-output',
+        action='store_true',
+        help='Skip Output and Print cells (including graphics)'
+    )
+    parser.add_argument(
+        '--skip-messages',
+        action='store_true',
+        help='Skip Message cells'
+    )
+    parser.add_argument(
+        '--skip-input',
+        action='store_true',
+        help='Skip Input and Code cells'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='Convert the cells of large notebooks in this many workers '
+             '(0: one per CPU; default: 1)'
+    )
+    parser.add_argument(
+        '--executor',
+        choices=EXECUTOR_KINDS,
+        default='auto',
+        help='Workers for -j: process, thread, or auto (threads when Python '
+             'runs without the GIL, processes otherwise)'
+    )
+    parser.add_argument(
+        '--format',
+        choices=OUTPUT_FORMATS,
+        default='latex',
+        help='Output format: latex (default), text (plain text per cell, '
+             'no LaTeX conversion; for search indexing) or ndjson (one JSON '
+             'record per cell with its text, LaTeX, code, table and byte offsets)'
+    )
     
     args = parser.parse_args()
     
-    # Process each input file
-    all_latex = []
+    # Determine output filename
+    if args.output:
+        output_file = args.output
+    else:
+        output_file = (os.path.splitext(os.path.basename(args.input_files[0]))[0]
+                       + OUTPUT_SUFFIXES[args.format])
+    output_dir = os.path.dirname(output_file) or '.'
+    
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    
+    skip_styles = ()
+    if args.skip_output:
+        skip_styles += SKIP_OUTPUT_STYLES
+    if args.skip_messages:
+        skip_styles += SKIP_MESSAGE_STYLES
+    if args.skip_input:
+        skip_styles += SKIP_INPUT_STYLES
     
     for input_file in args.input_files:
-        if not Path(input_file).exists():
+        if not os.path.exists(input_file):
             print(f"Error: File not found: {input_file}", file=sys.stderr)
             sys.exit(1)
-        
+    
+    if args.format == 'text':
+        # Stream cell text straight to the output file
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for input_file in args.input_files:
+                print(f"Extracting text from {input_file}...")
+                try:
+                    for _, _, _, cell_text in extract_text(input_file, section=args.section,
+                                                           skip_closed=args.skip_closed,
+                                                           skip_styles=skip_styles):
+                        f.write(cell_text)
+                        f.write('\n\n')
+                except ValueError as e:
+                    print(f"Error: {input_file}: {e}", file=sys.stderr)
+                    sys.exit(1)
+        print(f"Text output written to {output_file}")
+        return
+    
+    if args.format == 'ndjson':
+        # One record per cell, written as each cell is converted
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for input_file in args.input_files:
+                print(f"Converting {input_file}...")
+                try:
+                    write_ndjson(iter_cell_records(load_notebook(input_file), args.section,
+                                                   args.skip_closed, skip_styles), f)
+                except ValueError as e:
+                    print(f"Error: {input_file}: {e}", file=sys.stderr)
+                    sys.exit(1)
+        print(f"NDJSON output written to {output_file}")
+        return
+    
+    # Process each input file
+    all_latex = []
+    
+    for input_file in args.input_files:
         print(f"Converting {input_file}...")
-        latex_content = convert_notebook_to_latex(input_file)
+        try:
+            latex_content = convert_notebook_to_latex(input_file, table_format=args.tables,
+                                                      output_dir=output_dir, section=args.section,
+                                                      skip_closed=args.skip_closed,
+                                                      skip_styles=skip_styles, jobs=jobs,
+                                                      executor=args.executor)
+        except ValueError as e:
+            print(f"Error: {input_file}: {e}", file=sys.stderr)
+            sys.exit(1)
         all_latex.append(latex_content)
     
     # Combine outputs
     if len(all_latex) > 1:
-        # Merge multiple documents
-        combined = all_latex[0]
-        for latex in all_latex[1:]:
-            # Extract content between \begin{document} and \end{document}
-            content_match = re.search(r'\\begin\{document\}(.*?)\\end\{document\}', 
-                                     latex, re.DOTALL)
-            if content_match:
-                combined = combined.replace(r'\end{document}', 
-                                          content_match.group(1) + r'\end{document}')
-        final_latex = combined
+        final_latex = merge_latex_documents(all_latex)
     else:
         final_latex = all_latex[0]
     
-    # Determine output filename
-    if args.output:
-        output_file = args.output
-    else:
-        output_file = Path(args.input_files[0]).stem + '.tex'
-    
     # Write output
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(final_latex)
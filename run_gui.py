@@ -25,7 +25,8 @@ def main():
             print("Starting web GUI server...")
             print("Open your browser to: http://localhost:5000")
             import web_gui
-            web_gui.app.run(debug=False, host='0.0.0.0', port=5000)
+            # Development server, local only - see wsgi.py for production deployments
+            web_gui.app.run(debug=False, host='127.0.0.1', port=5000)
             return 0
         except ImportError:
             print("\nError: Neither tkinter nor Flask is available.")
@@ -3,11 +3,27 @@
 Simple test script for the Mathematica converter
 """
 
+import base64
+import io
+import json
 import os
+import subprocess
+import sys
 import tempfile
+import time
+import zlib
+import mathematica_to_latex
 from mathematica_converter import MathematicaConverter
 
 
+def write_notebook(content):
+    """Write notebook text to a temporary .nb file and return its path"""
+    fd, path = tempfile.mkstemp(suffix='.nb')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return path
+
+
 def test_converter():
     """Test the converter with example files"""
     print("Testing Mathematica to LaTeX/Markdown Converter")
@@ -78,6 +94,745 @@ def test_converter():
         return False
 
 
+def test_cell_cache_reconverts_only_changed_cells():
+    """Repeated conversions with a cell cache only process new cells"""
+    cells = [f'Cell[BoxData[\n RowBox[{{"x", "+", "{i}"}}]], "Input"]' for i in range(3)]
+    path = write_notebook('Notebook[{\n' + ',\n'.join(cells) + '\n}]\n')
+    
+    calls = []
+    original = mathematica_to_latex.process_cell_content
+    mathematica_to_latex.process_cell_content = lambda text, style=None: calls.append(text) or original(text, style)
+    try:
+        cache = {}
+        first = mathematica_to_latex.convert_notebook_to_latex(path, cell_cache=cache)
+        assert len(calls) == 3
+        
+        # Edit one cell on disk
+        cells[1] = 'Cell[BoxData[\n RowBox[{"y", "+", "1"}]], "Input"]'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('Notebook[{\n' + ',\n'.join(cells) + '\n}]\n')
+        second = mathematica_to_latex.convert_notebook_to_latex(path, cell_cache=cache)
+        assert len(calls) == 4
+        assert len(cache) == 3
+    finally:
+        mathematica_to_latex.process_cell_content = original
+        os.remove(path)
+    
+    assert 'x + 1' in first and 'y + 1' in second
+
+
+def test_gridbox_tables_with_nested_and_non_string_cells():
+    """Every GridBox in a cell is extracted, including non-string cells"""
+    cell = (
+        'Cell[BoxData[RowBox[{TagBox[GridBox[{\n'
+        '  {"\\<\\"Name\\"\\>", "\\<\\"Value\\"\\>"},\n'
+        '  {"1", RowBox[{"x", "+", SuperscriptBox["y", "2"]}]},\n'
+        '  {"2", GridBox[{{"a"}, {"b"}}]}\n'
+        ' }, GridBoxAlignment->{"Columns" -> {{Left}}}], TableForm], ",",\n'
+        ' GridBox[{{"p", "q"}}]}]], "Output"]'
+    )
+    tables = mathematica_to_latex.extract_gridbox_tables(cell)
+    
+    assert len(tables) == 2
+    assert tables[0][0] == ['Name', 'Value']
+    assert tables[0][1] == ['1', 'x+y^{2}']
+    assert 'a \\\\ b' in tables[0][2][1]
+    assert tables[1] == [['p', 'q']]
+    assert mathematica_to_latex.extract_gridbox_table(cell) == tables[0]
+
+
+def test_long_tables_use_longtable_or_csv():
+    """Long tables become a longtable, or a CSV file in csv mode"""
+    rows = ',\n'.join(f'  {{"{i}", "\\[Alpha]{i}"}}' for i in range(60))
+    path = write_notebook('Notebook[{\nCell[BoxData[\n GridBox[{\n' + rows + '\n }]], "Output"]\n}]\n')
+    output_dir = tempfile.mkdtemp()
+    try:
+        latex = mathematica_to_latex.convert_notebook_to_latex(path)
+        assert r'\usepackage{longtable}' in latex
+        assert r'\begin{longtable}{Sl}' in latex and r'\endhead' in latex
+        assert r'59 & $\alpha59$ \\' in latex
+        
+        latex = mathematica_to_latex.convert_notebook_to_latex(path, table_format='tabular')
+        assert 'longtable' not in latex
+        
+        latex = mathematica_to_latex.convert_notebook_to_latex(
+            path, table_format='csv', output_dir=output_dir)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        assert r'\csvautobooklongtable{' + stem + '_tables/table_1.csv}' in latex
+        with open(os.path.join(output_dir, stem + '_tables', 'table_1.csv'), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 60 and lines[1] == '1,$\\alpha1$'
+        
+        # Without output_dir the CSV goes next to the notebook
+        mathematica_to_latex.convert_notebook_to_latex(path, table_format='csv')
+        default_csv = os.path.join(os.path.dirname(path), stem + '_tables', 'table_1.csv')
+        assert os.path.exists(default_csv)
+        os.remove(default_csv)
+        os.rmdir(os.path.dirname(default_csv))
+    finally:
+        os.remove(path)
+
+
+def test_merged_documents_keep_every_package():
+    """Merging notebooks adds the packages of later documents to the preamble"""
+    rows = ',\n'.join(f'  {{"{i}", "x"}}' for i in range(60))
+    table_path = write_notebook('Notebook[{\nCell[BoxData[\n GridBox[{\n' + rows + '\n }]], "Output"]\n}]\n')
+    text_path = write_notebook('Notebook[{\nCell["Plain text", "Text"]\n}]\n')
+    try:
+        table_latex = mathematica_to_latex.convert_notebook_to_latex(table_path)
+        text_latex = mathematica_to_latex.convert_notebook_to_latex(text_path)
+        assert r'\usepackage{longtable}' not in text_latex
+        
+        merged = mathematica_to_latex.merge_latex_documents([text_latex, table_latex], r'\newpage')
+        preamble, body = merged.split(r'\begin{document}')
+        assert r'\usepackage{longtable}' in preamble and r'\usepackage{siunitx}' in preamble
+        assert preamble.count(r'\usepackage{amsmath}') == 1
+        assert preamble.index(r'\usepackage{longtable}') < preamble.index(r'\lstset')
+        assert body.index('Plain text') < body.index(r'\newpage') < body.index(r'\begin{longtable}')
+        assert merged.count(r'\end{document}') == 1 and merged.endswith(r'\end{document}')
+    finally:
+        os.remove(table_path)
+        os.remove(text_path)
+
+
+def test_numeric_columns_use_siunitx():
+    """All-number columns get S columns with normalized exponents"""
+    table = [
+        ['Trial', 'Mass', 'Note'],
+        ['1', '1.5*^-3', 'ok'],
+        ['2', '2.25\\[Times]10^{4}', ''],
+        ['3', '', '4'],
+    ]
+    assert mathematica_to_latex.infer_column_types(table) == [True, True, False]
+    
+    # A long numeric column ending in text is classified without backtracking
+    start = time.perf_counter()
+    column = [['h']] + [['12345']] * 5000 + [['x']]
+    assert mathematica_to_latex.infer_column_types(column) == [False]
+    assert mathematica_to_latex.infer_column_types(column[:-1]) == [True]
+    assert time.perf_counter() - start < 1.0
+    
+    lines, packages = mathematica_to_latex.render_table(table, 'tabular')
+    latex = '\n'.join(lines)
+    assert 'siunitx' in packages
+    assert r'\begin{tabular}{SSl}' in latex
+    assert r'{Trial} & {Mass} & Note \\' in latex
+    assert r'1 & 1.5e-3 & ok \\' in latex and r'2 & 2.25e4 &  \\' in latex
+
+
+def test_formbox_formulas_are_rendered():
+    """Embedded TraditionalForm formulas become LaTeX math"""
+    boxes = mathematica_to_latex.parse_boxes(
+        'FormBox[RowBox[{UnderoverscriptBox["\\[Sum]", RowBox[{"n", "=", "1"}], "\\[Infinity]"], '
+        'FractionBox["1", SuperscriptBox["n", "2"]], "=", SqrtBox[SubscriptBox["x", "0"]]}], '
+        'TraditionalForm]'
+    )
+    latex = mathematica_to_latex.box_to_latex(boxes[0])
+    assert latex == r'\sum_{n=1}^{\infty }\frac{1}{n^{2}}=\sqrt{x_{0}}'
+    
+    cell = ('Cell[BoxData["\\<\\"E = \\\\!\\\\(\\\\*FormBox[FractionBox[\\\\\\"3\\\\\\", '
+            '\\\\\\"2\\\\\\"], TraditionalForm]\\\\) J\\"\\>"], "Print"]')
+    assert mathematica_to_latex.process_cell_content(cell) == r'E = $\frac{3}{2}$ J'
+
+    # Strings in formulas are escaped for text mode
+    boxes = mathematica_to_latex.parse_boxes(
+        'RowBox[{"x", "+", "\\"cost_1 & 50% {#}\\"", "+", "\\"\\[Alpha]\\""}]')
+    assert mathematica_to_latex.box_to_latex(boxes[0]) == (
+        r'x+\text{cost\_1 \& 50\% \{\#\}}+\text{$\alpha$}')
+
+
+def test_output_cells_render_as_display_math():
+    """Output cells become equation*/align* with repeated boxes rendered once"""
+    integral = 'FractionBox[SuperscriptBox["x", "3"], "3"]'
+    cell = f'Cell[BoxData[{integral}], "Output"]'
+    assert mathematica_to_latex.process_cell_content(cell) == (
+        'OUTPUT', 'equation*', r'\frac{x^{3}}{3}')
+    
+    before = mathematica_to_latex.box_to_latex.cache_info().hits
+    cell = f'Cell[BoxData[RowBox[{{"2", " ", {integral}}}]], "Output"]'
+    assert mathematica_to_latex.process_cell_content(cell)[2] == r'2 \frac{x^{3}}{3}'
+    assert mathematica_to_latex.box_to_latex.cache_info().hits > before
+    
+    cell = ('Cell[BoxData[RowBox[{"{", RowBox[{RowBox[{"x", "\\[Rule]", "1"}], ",", '
+            'RowBox[{"y", "\\[Rule]", "2"}]}], "}"}]], "Output"]')
+    assert mathematica_to_latex.process_cell_content(cell) == (
+        'OUTPUT', 'align*', 'x&\\to 1 \\\\\ny&\\to 2')
+
+    # RowBox holding a string instead of a list of boxes
+    for boxes in ('RowBox["x"]', 'RowBox[{"{", RowBox["x"], "}"}]'):
+        cell = f'Cell[BoxData[{boxes}], "Output"]'
+        assert mathematica_to_latex.process_cell_content(cell)[:2] == ('OUTPUT', 'equation*')
+
+
+def test_cell_styles_map_to_headings_and_text():
+    """Headings, text and display formulas are recognized by cell style"""
+    cells = [
+        'Cell["Harmonic Oscillator", "Title"]',
+        'Cell["Energy Levels", "Section"]',
+        'Cell[TextData[{"The energy is ", Cell[BoxData[FormBox[SqrtBox["k"], '
+        'TraditionalForm]]], " for the equation with \\[Alpha]."}], "Text"]',
+        'Cell[BoxData[FormBox[RowBox[{"E", "=", FractionBox["1", "2"]}], '
+        'TraditionalForm]], "DisplayFormulaNumbered"]',
+    ]
+    assert mathematica_to_latex.cell_style(cells[2]) == 'Text'
+    assert mathematica_to_latex.process_cell_content(cells[1]) == (
+        'HEADING', 'Section', 'Energy Levels')
+    
+    path = write_notebook('Notebook[{\n' + ',\n\n'.join(cells) + '\n}]\n')
+    try:
+        latex = mathematica_to_latex.convert_notebook_to_latex(path)
+    finally:
+        os.remove(path)
+    
+    assert r'\title{Harmonic Oscillator}' in latex
+    assert r'\section*{Energy Levels}' in latex
+    assert r'The energy is $\sqrt{k}$ for the equation with \alpha.' in latex
+    assert '\\begin{equation}\nE=\\frac{1}{2}\n\\end{equation}' in latex
+
+
+GROUPED_NOTEBOOK = """Notebook[{
+Cell[CellGroupData[{
+Cell["Problem 1", "Section"],
+Cell[TextData[{"Inline ", Cell[BoxData["x"]]}], "Text"],
+Cell[CellGroupData[{
+Cell[BoxData[RowBox[{"1", "+", "1"}]], "Input"],
+Cell[BoxData["2"], "Output"]
+}, Closed]]
+}, Open]],
+Cell[CellGroupData[{
+Cell["Problem 3", "Section"],
+Cell["Only this part is needed.", "Text"]
+}, Open]]
+}, WindowSize->{808, 911}]
+"""
+
+
+def test_cell_group_tree_and_section_selection():
+    """Cell groups are parsed into a tree and single sections can be extracted"""
+    text = GROUPED_NOTEBOOK
+    tree = mathematica_to_latex.parse_cell_tree(text)
+    
+    assert [item.is_group for item in tree] == [True, True]
+    styles = [cell.style for cell in mathematica_to_latex.iter_cells(tree)]
+    assert styles == ['Section', 'Text', 'Input', 'Output', 'Section', 'Text']
+    inner = tree[0].cells[2]
+    assert inner.is_group and inner.closed and not tree[0].closed
+    
+    group = mathematica_to_latex.find_section(text, tree, 'problem 3')
+    assert group is tree[1]
+    cells = mathematica_to_latex.extract_cells_from_notebook(text, section='Problem 3')
+    assert cells == [('HEADING', 'Section', 'Problem 3'), ('TEXT', 'Only this part is needed.')]
+
+
+TRUNCATED_NOTEBOOK = ('Notebook[{\nCell["Intro", "Section"],\nCell[TextData[{"abc"}], "Text", '
+                      'CellChangeTimes->{{3.812345678912345*^9, 3.81234567891')
+
+
+def test_truncated_notebooks_convert_in_linear_time():
+    """Cells cut off without closing brackets, quotes or comments do not stall the scan"""
+    for tail in ('', ' abc def' * 5000, ' "open \\\\ string' * 5000, ' (* open comment' * 5000):
+        path = write_notebook(TRUNCATED_NOTEBOOK + tail)
+        try:
+            start = time.perf_counter()
+            latex = mathematica_to_latex.convert_notebook_to_latex(path)
+            converter = MathematicaConverter()
+            converter.content = TRUNCATED_NOTEBOOK + tail
+            converter.convert_to_latex()
+            assert time.perf_counter() - start < 2.0
+            assert r'\section*{Intro}' in latex
+        finally:
+            os.remove(path)
+
+
+def test_skip_closed_groups_and_output_cells():
+    """Closed groups keep only their header; skipped styles are left out"""
+    select = mathematica_to_latex.select_cells
+    styles = [cell.style for cell in select(GROUPED_NOTEBOOK, skip_closed=True)]
+    assert styles == ['Section', 'Text', 'Input', 'Section', 'Text']
+    
+    skip = mathematica_to_latex.SKIP_OUTPUT_STYLES + mathematica_to_latex.SKIP_INPUT_STYLES
+    styles = [cell.style for cell in select(GROUPED_NOTEBOOK, skip_styles=skip)]
+    assert styles == ['Section', 'Text', 'Section', 'Text']
+    
+    path = write_notebook(GROUPED_NOTEBOOK)
+    try:
+        latex = mathematica_to_latex.convert_notebook_to_latex(
+            path, skip_styles=mathematica_to_latex.SKIP_OUTPUT_STYLES)
+    finally:
+        os.remove(path)
+    assert '1 + 1' in latex and 'equation' not in latex
+
+
+def test_load_notebook_converts_cells_lazily():
+    """load_notebook gives typed cells that are only converted when asked"""
+    path = write_notebook(GROUPED_NOTEBOOK)
+    calls = []
+    original = mathematica_to_latex.process_cell_content
+    mathematica_to_latex.process_cell_content = (
+        lambda text, style=None: calls.append(style) or original(text, style))
+    try:
+        notebook = mathematica_to_latex.load_notebook(path)
+        kinds = [cell.kind for cell in notebook]
+        assert kinds == ['heading', 'text', 'input', 'output', 'heading', 'text']
+        
+        code = [cell.code for cell in notebook.code_cells()]
+        assert code == ['1 + 1'] and calls == []
+        
+        cells = notebook.section('Problem 3')
+        assert cells[0].latex == r'\section*{Problem 3}'
+        assert cells[0].latex and calls == ['Section']
+    finally:
+        mathematica_to_latex.process_cell_content = original
+        os.remove(path)
+
+
+def test_math_classification_is_computed_once_per_cell():
+    """Printed text is classified as math with one scan, cached on the cell"""
+    assert mathematica_to_latex.is_math_content(r'E = \hbar \omega')
+    assert mathematica_to_latex.is_math_content('x_{0}')
+    assert not mathematica_to_latex.is_math_content(r'\section done; \etc')
+    
+    path = write_notebook('Notebook[{Cell[BoxData["\\<\\"v = x^2 + 1\\"\\>"], "Print"]}]')
+    calls = []
+    original = mathematica_to_latex.is_math_content
+    mathematica_to_latex.is_math_content = lambda text: calls.append(text) or original(text)
+    try:
+        cell = next(iter(mathematica_to_latex.load_notebook(path)))
+        assert cell.latex == '$v = x^2 + 1$'
+        assert cell.latex == '$v = x^2 + 1$'
+        assert cell.is_math and len(calls) == 1
+    finally:
+        mathematica_to_latex.is_math_content = original
+        os.remove(path)
+
+
+def test_extract_text_streams_plain_cell_text():
+    """extract_text yields unconverted cell text with source offsets"""
+    path = write_notebook(GROUPED_NOTEBOOK)
+    try:
+        cells = list(mathematica_to_latex.extract_text(path))
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+    finally:
+        os.remove(path)
+    assert [style for _, _, style, _ in cells] == [
+        'Section', 'Text', 'Input', 'Output', 'Section', 'Text']
+    start, end, _, text = cells[2]
+    assert text == '1+1' and content[start:end].startswith('Cell[')
+    
+    assert mathematica_to_latex.plain_string(r'E = \[HBar]\[Omega] \[Rule] x') == 'E = ħω → x'
+
+
+def test_ndjson_records_per_cell():
+    """NDJSON output has one record per cell with byte offsets"""
+    notebook = mathematica_to_latex.Notebook('(* \u00e9 *)\n' + GROUPED_NOTEBOOK)
+    out = io.StringIO()
+    mathematica_to_latex.write_ndjson(mathematica_to_latex.iter_cell_records(notebook), out)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r['type'] for r in records] == ['heading', 'text', 'input', 'output', 'heading', 'text']
+    encoded = notebook.text.encode('utf-8')
+    input_record = records[2]
+    assert encoded[input_record['start']:input_record['end']].startswith(b'Cell[')
+    assert input_record['code'] == '1 + 1' and input_record['text'] == '1+1'
+    assert records[3]['latex'].startswith(r'\begin{equation*}')
+
+
+def test_both_formats_parse_the_notebook_once():
+    """LaTeX and Markdown for one upload are rendered from a single parse"""
+    from mathematica_converter import convert_notebook_content
+    calls = []
+    parse_cells = MathematicaConverter.parse_cells
+    MathematicaConverter.parse_cells = lambda self: calls.append(self) or parse_cells(self)
+    try:
+        outputs, counts = convert_notebook_content(GROUPED_NOTEBOOK, 'both')
+    finally:
+        MathematicaConverter.parse_cells = parse_cells
+    assert len(calls) == 1
+    
+    converter = MathematicaConverter()
+    converter.content = GROUPED_NOTEBOOK
+    assert outputs == {'latex': converter.convert_to_latex(),
+                       'markdown': converter.convert_to_markdown()}
+    assert counts == converter.cell_counts and counts['section'] == 2
+
+
+def test_ndjson_offsets_are_file_bytes_for_crlf_notebooks():
+    """Record offsets point into the file even when text mode translated CRLF"""
+    fd, path = tempfile.mkstemp(suffix='.nb')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(('(* \u00e9 *)\n' + GROUPED_NOTEBOOK).replace('\n', '\r\n').encode('utf-8'))
+    try:
+        converter = MathematicaConverter()
+        assert converter.read_notebook(path)
+        records = list(mathematica_to_latex.iter_cell_records(mathematica_to_latex.load_notebook(path)))
+        records += list(converter.iter_records())
+        assert records[0]['text'] == 'Problem 1'
+        with open(path, 'rb') as f:
+            for record in records:
+                f.seek(record['start'])
+                source = f.read(record['end'] - record['start'])
+                assert source.startswith(b'Cell[') and source.endswith(b']')
+    finally:
+        os.remove(path)
+
+
+def test_converter_reads_cell_text_only():
+    """MathematicaConverter emits cell text, not styles, options or payloads"""
+    converter = MathematicaConverter()
+    converter.content = GROUPED_NOTEBOOK.replace(
+        '"Output"]', '"Output"],\nCell[BoxData[GraphicsBox[RasterBox[CompressedData["1:eJzt7Qm0ZVV5"]]]], "Output",\n ImageSize->{360, 200}]')
+    markdown = converter.convert_to_markdown()
+    assert converter.cell_styles == ['Section', 'Text', 'Input', 'Output', 'Section', 'Text']
+    assert '## Problem 1' in markdown and '1+1' in markdown
+    for junk in ('eJzt', 'Output', 'Closed', 'WindowSize', '## Section'):
+        assert junk not in markdown
+
+
+def test_binary_payloads_are_skipped_and_decoded_lazily():
+    """CompressedData payloads are recorded by offset and kept out of conversion"""
+    data = base64.b64encode(zlib.compress(b'raster' * 100)).decode()
+    content = ('Notebook[{\n'
+               'Cell[BoxData[RowBox[{"Plot", "[", "x", "]"}]], "Input"],\n'
+               'Cell[BoxData[GraphicsBox[RasterBox[CompressedData["1:' + data[:20] + '\\\n'
+               + data[20:] + '"]]]], "Output"]\n'
+               '}]\n(* End of Notebook Content *)\n(*NotebookFileOutline\n'
+               'Notebook[{\nCell[42, 1, 2, 3, "Input"]}]\n*)\n')
+    notebook = mathematica_to_latex.Notebook(content)
+    assert [cell.style for cell in notebook] == ['Input', 'Output']
+    
+    (payload,) = notebook.payloads
+    assert payload.kind == 'CompressedData' and payload.decode() == b'raster' * 100
+    output = list(notebook)[1]
+    assert output.payloads == [payload]
+    assert output.result[0] == 'GRAPHIC' and data[:20] not in output.result[1]
+
+
+def build_notebook_with_outline(cells):
+    """Lay out a notebook file the way the front end does, outline included
+    
+    cells is a list of cell source strings, or (closed, [cell sources])
+    for a group.
+    """
+    header = ('(* Content-type: application/vnd.wolfram.mathematica *)\n\n'
+              '(*CacheID: 234*)\n(* Internal cache information:\n'
+              'NotebookFileLineBreakTest\nNotebookFileLineBreakTest\n'
+              'NotebookOutlinePosition[%10d, %10d]\nWindowFrame->Normal*)\n\n'
+              '(* Beginning of Notebook Content *)\nNotebook[{\n')
+    body = []
+    offset = [len(header % (0, 0))]
+    
+    def emit(text):
+        body.append(text)
+        offset[0] += len(text)
+    
+    def lay_out(items):
+        entries = []
+        for item in items:
+            if isinstance(item, tuple):
+                state = 'Closed' if item[0] else 'Open'
+                emit('Cell[CellGroupData[{\n')
+                inner = lay_out(item[1])
+                emit('\n}, %s  ]],\n' % state)
+                entries.append('Cell[CellGroupData[{\n%s\n}, %s  ]]' % (',\n'.join(inner), state))
+            else:
+                style = item.rsplit('"', 2)[1]
+                entries.append('Cell[%d, 1, %d, 1, 20, "%s"]' % (offset[0], len(item), style))
+                emit(item + ',\n')
+        return entries
+    
+    outline_cells = lay_out(cells)
+    emit('}]\n(* End of Notebook Content *)\n\n(* Internal cache information *)\n')
+    outline = ('(*NotebookFileOutline\nNotebook[{\n%s\n}\n]\n*)\n\n'
+               '(* End of internal cache information *)\n' % ',\n'.join(outline_cells))
+    return header % (offset[0], 1) + ''.join(body) + outline
+
+
+def test_notebook_outline_gives_cells_without_scanning():
+    """A valid NotebookFileOutline is used for the cell tree; a stale one is ignored"""
+    content = build_notebook_with_outline([
+        (True, ['Cell["Problem 1", "Section"]',
+                'Cell[BoxData[RowBox[{"1", "+", "1"}]], "Input"]',
+                'Cell[BoxData["2"], "Output"]']),
+        'Cell["Done.", "Text"]',
+    ])
+    tree = mathematica_to_latex.outline_cell_tree(content)
+    assert tree is not None and tree[0].closed
+    styles = [cell.style for cell in mathematica_to_latex.iter_cells(tree)]
+    assert styles == ['Section', 'Input', 'Output', 'Text']
+    walked = mathematica_to_latex.parse_cell_tree(content)
+    assert ([(c.start, c.end, c.content_end) for c in mathematica_to_latex.iter_cells(tree)]
+            == [(c.start, c.end, c.content_end) for c in mathematica_to_latex.iter_cells(walked)])
+    
+    path = write_notebook(content)
+    try:
+        outline = mathematica_to_latex.read_outline(path)
+        last = list(outline.cells())[-1]
+        assert outline.read_cell(last) == 'Cell["Done.", "Text"]'
+        
+        # Edited outside the front end: the outline is stale and not used
+        stale = content.replace('Notebook[{\n', 'Notebook[{\n\n', 1).replace(
+            'Content *)\n\n', 'Content *)\n', 1)
+        assert mathematica_to_latex.outline_cell_tree(stale) is None
+        styles = [cell.style for cell in mathematica_to_latex.select_cells(stale)]
+        assert styles == ['Section', 'Input', 'Output', 'Text']
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(stale)
+        try:
+            mathematica_to_latex.read_outline(path).read_cell(last)
+            assert False, 'stale outline was not detected'
+        except ValueError:
+            pass
+    finally:
+        os.remove(path)
+
+
+def test_parallel_cell_conversion_matches_serial():
+    """Converting cells in worker processes gives the same document"""
+    notebook = GROUPED_NOTEBOOK.replace('"Only this part is needed."',
+                                        '"Only this part\n is needed \u03bc."')
+    path = os.path.join(tempfile.mkdtemp(), 'notebook.nb')
+    minimum = mathematica_to_latex.PARALLEL_MIN_CELLS
+    mathematica_to_latex.PARALLEL_MIN_CELLS = 1
+    documents = []
+    try:
+        for newline in ('\n', '\r\n'):
+            with open(path, 'wb') as f:
+                f.write(notebook.replace('\n', newline).encode('utf-8'))
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+            cells = mathematica_to_latex.select_cells(content)
+            spans = mathematica_to_latex._file_cell_spans(path, content, cells)
+            assert spans is not None and len(spans) == len(cells)
+            
+            serial = mathematica_to_latex.convert_notebook_to_latex(path)
+            parallel = mathematica_to_latex.convert_notebook_to_latex(path, jobs=2)
+            assert parallel == serial
+            documents.append(serial)
+    finally:
+        mathematica_to_latex.PARALLEL_MIN_CELLS = minimum
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    assert documents[0] == documents[1] and '\r' not in documents[1]
+
+
+def test_thread_executor_is_used_without_the_gil():
+    """Without the GIL, cells and batches are converted in worker threads"""
+    import sys
+    path = write_notebook(GROUPED_NOTEBOOK)
+    minimum = mathematica_to_latex.PARALLEL_MIN_CELLS
+    mathematica_to_latex.PARALLEL_MIN_CELLS = 1
+    had_check = hasattr(sys, '_is_gil_enabled')
+    check = getattr(sys, '_is_gil_enabled', None)
+    sys._is_gil_enabled = lambda: False
+    try:
+        assert mathematica_to_latex.executor_kind() == 'thread'
+        serial = mathematica_to_latex.convert_notebook_to_latex(path)
+        threaded = mathematica_to_latex.convert_notebook_to_latex(path, jobs=2)
+        with mathematica_to_latex.make_executor(4) as executor:
+            batch = list(executor.map(mathematica_to_latex.convert_notebook_to_latex, [path] * 8))
+    finally:
+        if had_check:
+            sys._is_gil_enabled = check
+        else:
+            del sys._is_gil_enabled
+        mathematica_to_latex.PARALLEL_MIN_CELLS = minimum
+        os.remove(path)
+    assert threaded == serial
+    assert batch == [serial] * 8
+    assert mathematica_to_latex.executor_kind('process') == 'process'
+
+
+def test_admission_rejects_over_limit_and_releases_slots():
+    """Conversions over the limits get 429 + Retry-After; slots are freed on errors"""
+    import web_gui
+    app = web_gui.create_app({'MAX_CONVERSIONS_IN_FLIGHT': 1, 'MAX_CONVERSIONS_PER_CLIENT': 1,
+                              'MAX_QUEUED_CONVERSIONS': 1, 'ADMISSION_QUEUE_TIMEOUT': 0.05,
+                              'ADMISSION_RETRY_AFTER': 7})
+    admission = app.extensions['admission']
+    
+    # Per-client limit: the client already holds its one conversion
+    assert admission.acquire('127.0.0.1') is None
+    response = app.test_client().post('/convert', data={'format': 'latex'})
+    assert response.status_code == 429 and response.headers['Retry-After'] == '7'
+    
+    # Queue timeout: another client waits for the busy slot and gives up
+    assert admission.acquire('10.0.0.2') == 'queue_timeout'
+    admission.release('127.0.0.1')
+    stats = admission.stats()
+    assert stats['in_flight'] == 0 and stats['queued'] == 0 and stats['active_clients'] == 0
+    assert stats['rejected_total']['client_limit'] == 1
+    assert stats['rejected_total']['queue_timeout'] == 1
+    
+    # A view that raises still gives its slot back
+    @web_gui.limit_conversions
+    def failing_view():
+        raise RuntimeError('conversion crashed')
+    
+    with app.test_request_context('/convert', method='POST'):
+        try:
+            failing_view()
+        except RuntimeError:
+            pass
+    assert admission.stats()['in_flight'] == 0
+    assert admission.acquire('127.0.0.1') is None
+    admission.release('127.0.0.1')
+
+
+def test_metrics_exposition_format_and_bounded_result_cache():
+    """Metrics render in the Prometheus text format; cache hits skip the latency histogram"""
+    import web_gui
+    from web_metrics import MetricsRegistry
+    
+    registry = MetricsRegistry()
+    counter = registry.counter('demo_total', 'Demo count', ('format',))
+    histogram = registry.histogram('demo_seconds', 'Demo latency', (0.1, 1.0), ('format',))
+    counter.inc(format='a"b')
+    counter.inc(2, format='latex')
+    histogram.observe(0.05, format='latex')
+    histogram.observe(0.5, format='latex')
+    assert counter.values() == {('a"b',): 1, ('latex',): 2}
+    assert registry.render().splitlines() == [
+        '# HELP demo_total Demo count',
+        '# TYPE demo_total counter',
+        'demo_total{format="a\\"b"} 1',
+        'demo_total{format="latex"} 2',
+        '# HELP demo_seconds Demo latency',
+        '# TYPE demo_seconds histogram',
+        'demo_seconds_bucket{format="latex",le="0.1"} 1',
+        'demo_seconds_bucket{format="latex",le="1"} 2',
+        'demo_seconds_bucket{format="latex",le="+Inf"} 2',
+        'demo_seconds_sum{format="latex"} 0.55',
+        'demo_seconds_count{format="latex"} 2',
+    ]
+    
+    cache = web_gui.ResultCache(max_entries=10, max_bytes=10)
+    cache.put('a', {'latex': 'x' * 6})
+    cache.put('b', {'latex': 'y' * 6})
+    cache.put('c', {'latex': 'z' * 11})
+    assert cache.get('a') is None and cache.get('b') is not None and cache.get('c') is None
+    assert cache.size_bytes == 6
+    
+    app = web_gui.create_app()
+    client = app.test_client()
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples',
+                           'physics_example.nb'), 'rb') as f:
+        notebook = f.read()
+    for _ in range(2):
+        response = client.post('/convert', data={'format': 'latex',
+                                                  'file': (io.BytesIO(notebook), 'physics.nb')})
+        assert response.get_json()['success']
+    exposition = client.get('/metrics').get_data(as_text=True)
+    assert 'mtl_conversions_total{format="latex",status="success"} 2' in exposition
+    assert 'mtl_conversion_duration_seconds_count{format="latex"} 1' in exposition
+    assert 'mtl_cache_hit_ratio{format="latex"} 0.5' in exposition
+
+
+def test_ndjson_conversion_streams_records():
+    """/convert-ndjson streams one record per cell and holds its slot while streaming"""
+    import web_gui
+    app = web_gui.create_app({'MAX_CONVERSIONS_PER_CLIENT': 1})
+    admission = app.extensions['admission']
+    response = app.test_client().post('/convert-ndjson', data={
+        'file': (io.BytesIO(GROUPED_NOTEBOOK.encode('utf-8')), 'grouped.nb'),
+    })
+    assert response.mimetype == 'application/x-ndjson' and response.is_streamed
+    assert admission.stats()['in_flight'] == 1
+    
+    lines = list(response.response)
+    response.close()
+    assert admission.stats()['in_flight'] == 0
+    records = [json.loads(line) for line in lines]
+    assert len(lines) == len(records) >= 4
+    assert records[0]['text'] == 'Problem 1' and records[0]['type'] == 'section'
+    assert GROUPED_NOTEBOOK.encode('utf-8')[records[0]['start']:].startswith(b'Cell[')
+    
+    metrics = app.extensions['metrics'].render()
+    assert 'mtl_conversions_total{format="ndjson",status="success"} 1' in metrics
+
+
+def test_batch_conversion_streams_zip_and_records_metrics():
+    """/convert-batch returns one ZIP member per output and times pooled conversions"""
+    import web_gui
+    import zipfile
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+    uploads = {}
+    for name in ('physics_example.nb', 'simple_calculus.nb'):
+        with open(os.path.join(examples, name), 'rb') as f:
+            uploads[name] = f.read()
+    member = 'Notebook[{Cell["\u00b5 text", "Text"]}]'.encode('utf-8')
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as bundle:
+        bundle.writestr('course/symbolic_math.nb', member)
+    
+    app = web_gui.create_app({'BATCH_WORKERS': 2, 'BATCH_EXECUTOR': 'process'})
+    client = app.test_client()
+    try:
+        response = client.post('/convert-batch', data={
+            'format': 'both',
+            'files': [(io.BytesIO(data), name) for name, data in uploads.items()]
+                     + [(io.BytesIO(archive.getvalue()), 'course.zip')],
+        })
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.get_data())) as result:
+            names = sorted(result.namelist())
+            assert '\\begin{document}' in result.read('physics_example.tex').decode('utf-8')
+        exposition = client.get('/metrics').get_data(as_text=True)
+    finally:
+        app.extensions['batch_executor'].shutdown()
+    
+    assert names == ['physics_example.md', 'physics_example.tex', 'simple_calculus.md',
+                     'simple_calculus.tex', 'symbolic_math.md', 'symbolic_math.tex']
+    assert 'mtl_conversions_total{format="both",status="success"} 3' in exposition
+    assert 'mtl_conversion_duration_seconds_count{format="both"} 3' in exposition
+    size = sum(len(data) for data in uploads.values()) + len(member)
+    assert f'mtl_input_size_bytes_sum{{format="both"}} {size}' in exposition
+    
+    # Admission comes before unzipping: a rejected client's archive is not
+    # opened, and a batch that fails to unpack gives its slot back
+    app = web_gui.create_app({'MAX_CONVERSIONS_PER_CLIENT': 1, 'BATCH_WORKERS': 0})
+    admission = app.extensions['admission']
+    collected = []
+    collect = web_gui._collect_batch_notebooks
+    web_gui._collect_batch_notebooks = lambda *args: collected.append(args) or collect(*args)
+    try:
+        assert admission.acquire('127.0.0.1') is None
+        response = app.test_client().post('/convert-batch', data={
+            'files': [(io.BytesIO(archive.getvalue()), 'course.zip')]})
+        assert response.status_code == 429 and not collected
+        admission.release('127.0.0.1')
+        
+        response = app.test_client().post('/convert-batch', data={
+            'files': [(io.BytesIO(b'not a zip'), 'broken.zip')]})
+        assert response.get_json()['success'] is False and len(collected) == 1
+        assert admission.stats()['in_flight'] == 0
+    finally:
+        web_gui._collect_batch_notebooks = collect
+
+
+# Startup budget (microseconds, python -X importtime) for importing the
+# converter modules, and optional modules they must only import when used
+IMPORT_TIME_BUDGET_US = 200000
+LAZY_IMPORTS = {'concurrent.futures', 'multiprocessing', 'json', 'mmap', 'zlib',
+                'tkinter', 'flask', 'numpy', 'PIL'}
+
+
+def test_startup_import_time_within_budget():
+    """The CLI modules import quickly and leave optional dependencies unloaded"""
+    for module in ('mathematica_to_latex', 'mathematica_converter'):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        cumulative = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:'):
+                _, total, name = line[len('import time:'):].split('|')
+                if total.strip().isdigit():
+                    cumulative[name.strip()] = int(total)
+        assert not LAZY_IMPORTS & set(cumulative), LAZY_IMPORTS & set(cumulative)
+        assert cumulative[module] < IMPORT_TIME_BUDGET_US, cumulative[module]
+
+
 if __name__ == "__main__":
     import sys
     success = test_converter()
@@ -3,105 +3,712 @@ Mathematica to LaTeX/Markdown Converter - Web GUI
 A web-based user interface for converting Mathematica notebooks
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, send_file
+from collections import OrderedDict
+from concurrent.futures import as_completed
+import functools
+import hashlib
+import json
 import os
 import tempfile
+import threading
+import time
 import shutil
-from mathematica_converter import MathematicaConverter
+import zipfile
+from mathematica_converter import MathematicaConverter, convert_notebook_content
+from mathematica_to_latex import make_executor
+from web_metrics import ConversionMetrics
 from werkzeug.utils import secure_filename
 
-app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+bp = Blueprint('converter', __name__)
 
 ALLOWED_EXTENSIONS = {'nb'}
 
+OUTPUT_FORMATS = ('latex', 'markdown', 'both')
+OUTPUT_EXTENSIONS = {'latex': '.tex', 'markdown': '.md'}
+
+# Converted notebooks kept in memory, keyed by content hash: at most this
+# many entries and this many bytes of output per server process
+DEFAULT_RESULT_CACHE_SIZE = 64
+DEFAULT_RESULT_CACHE_BYTES = 32 * 1024 * 1024
+
+# Batch upload defaults
+DEFAULT_BATCH_CONFIG = {
+    'BATCH_MAX_NOTEBOOKS': 200,                          # notebooks per batch request
+    'BATCH_MAX_UNCOMPRESSED_BYTES': 256 * 1024 * 1024,   # total notebook size after unzipping
+    'BATCH_WORKERS': min(4, os.cpu_count() or 1),        # conversion workers (0 = convert inline)
+    'BATCH_EXECUTOR': 'auto',                            # 'process', 'thread' or 'auto' (see make_executor)
+}
+
+# Admission control defaults (limits apply per server process)
+DEFAULT_ADMISSION_CONFIG = {
+    'MAX_CONVERSIONS_IN_FLIGHT': 4,    # conversions running at once
+    'MAX_CONVERSIONS_PER_CLIENT': 2,   # running + queued conversions per client
+    'MAX_QUEUED_CONVERSIONS': 16,      # requests allowed to wait for a slot
+    'ADMISSION_QUEUE_TIMEOUT': 10.0,   # seconds a request may wait for a slot
+    'ADMISSION_RETRY_AFTER': 5,        # Retry-After seconds sent with 429
+    'TRUSTED_PROXIES': 0,              # reverse proxies whose X-Forwarded-For is trusted
+}
+
+
+class ResultCache:
+    """Thread-safe LRU cache of conversion outputs
+
+    Students often upload the same notebook several times (and a class
+    uploads the same template), so outputs are kept keyed by a hash of the
+    uploaded bytes and the requested format. The cache holds at most
+    ``max_entries`` entries and ``max_bytes`` bytes of output; outputs
+    larger than ``max_bytes`` are not cached.
+    """
+
+    def __init__(self, max_entries, max_bytes=DEFAULT_RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached outputs for key, or None"""
+        with self._lock:
+            outputs = self._entries.get(key)
+            if outputs is not None:
+                self._entries.move_to_end(key)
+            return outputs
+
+    def put(self, key, outputs):
+        """Store outputs, evicting the least recently used entries"""
+        size = sum(len(content.encode('utf-8')) for content in outputs.values())
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = outputs
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        """Bytes of output currently cached"""
+        with self._lock:
+            return self._bytes
+
+
+class AdmissionController:
+    """Bounded admission queue for conversion requests
+
+    At most ``max_in_flight`` conversions run at once. Further requests wait
+    in a queue of at most ``max_queued`` entries for up to ``queue_timeout``
+    seconds. A single client may hold at most ``max_per_client`` running or
+    queued conversions, so one user cannot fill the queue for everyone else.
+    """
+
+    def __init__(self, max_in_flight, max_per_client, max_queued, queue_timeout):
+        self.max_in_flight = max_in_flight
+        self.max_per_client = max_per_client
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        self._per_client = {}
+        self._peak_queued = 0
+        self._admitted = 0
+        self._rejected = {'client_limit': 0, 'queue_full': 0, 'queue_timeout': 0}
+
+    def acquire(self, client):
+        """Wait for a conversion slot
+
+        Returns:
+            None if the request was admitted, otherwise the rejection reason
+            ('client_limit', 'queue_full' or 'queue_timeout')
+        """
+        with self._condition:
+            if self._per_client.get(client, 0) >= self.max_per_client:
+                self._rejected['client_limit'] += 1
+                return 'client_limit'
+
+            if self._in_flight >= self.max_in_flight or self._queued:
+                if self._queued >= self.max_queued:
+                    self._rejected['queue_full'] += 1
+                    return 'queue_full'
+
+                self._per_client[client] = self._per_client.get(client, 0) + 1
+                self._queued += 1
+                self._peak_queued = max(self._peak_queued, self._queued)
+                admitted = self._condition.wait_for(
+                    lambda: self._in_flight < self.max_in_flight,
+                    timeout=self.queue_timeout
+                )
+                self._queued -= 1
+                if not admitted:
+                    self._release_client(client)
+                    self._rejected['queue_timeout'] += 1
+                    return 'queue_timeout'
+            else:
+                self._per_client[client] = self._per_client.get(client, 0) + 1
+
+            self._in_flight += 1
+            self._admitted += 1
+            return None
+
+    def release(self, client):
+        """Give back the slot held by an admitted request"""
+        with self._condition:
+            self._in_flight -= 1
+            self._release_client(client)
+            self._condition.notify()
+
+    def _release_client(self, client):
+        """Drop one running or queued conversion from a client's count"""
+        remaining = self._per_client.get(client, 0) - 1
+        if remaining > 0:
+            self._per_client[client] = remaining
+        else:
+            self._per_client.pop(client, None)
+
+    def stats(self):
+        """Return a snapshot of the queue state and counters"""
+        with self._condition:
+            return {
+                'in_flight': self._in_flight,
+                'queued': self._queued,
+                'peak_queued': self._peak_queued,
+                'active_clients': len(self._per_client),
+                'admitted_total': self._admitted,
+                'rejected_total': dict(self._rejected),
+                'max_in_flight': self.max_in_flight,
+                'max_per_client': self.max_per_client,
+                'max_queued': self.max_queued,
+            }
+
+
+def create_app(config=None):
+    """Create and configure the Flask application
+
+    Args:
+        config: Optional mapping of settings that override the defaults
+
+    Returns:
+        The configured Flask application
+    """
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
+    app.config.update(DEFAULT_ADMISSION_CONFIG)
+    app.config['RESULT_CACHE_SIZE'] = DEFAULT_RESULT_CACHE_SIZE
+    app.config['RESULT_CACHE_BYTES'] = DEFAULT_RESULT_CACHE_BYTES
+    app.config.update(DEFAULT_BATCH_CONFIG)
+    if config:
+        app.config.update(config)
+
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+    app.extensions['admission'] = AdmissionController(
+        max_in_flight=app.config['MAX_CONVERSIONS_IN_FLIGHT'],
+        max_per_client=app.config['MAX_CONVERSIONS_PER_CLIENT'],
+        max_queued=app.config['MAX_QUEUED_CONVERSIONS'],
+        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+    )
+    app.extensions['result_cache'] = ResultCache(app.config['RESULT_CACHE_SIZE'],
+                                                 app.config['RESULT_CACHE_BYTES'])
+    app.extensions['metrics'] = ConversionMetrics(
+        admission=app.extensions['admission'],
+        result_cache=app.extensions['result_cache'],
+    )
+    app.register_blueprint(bp)
+    return app
+
+
+class _ZipStream:
+    """Write-only file object that hands ZipFile output to a streaming response
+
+    ZipFile falls back to data descriptors when the target cannot seek, so
+    each archive member can be sent as soon as it is written.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Return and forget everything written so far"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _unique_name(name, used_names):
+    """Make name unique within a batch by adding a numeric suffix"""
+    base, extension = os.path.splitext(name)
+    candidate = name
+    counter = 2
+    while candidate.lower() in used_names:
+        candidate = f"{base}_{counter}{extension}"
+        counter += 1
+    used_names.add(candidate.lower())
+    return candidate
+
+
+def _collect_batch_notebooks(uploads, max_notebooks, max_bytes):
+    """Gather notebooks from uploaded .nb files and .zip archives
+
+    Args:
+        uploads: Uploaded FileStorage objects
+        max_notebooks: Maximum number of notebooks accepted
+        max_bytes: Maximum total size of the notebooks after unzipping
+
+    Returns:
+        List of (filename, content, size) tuples, size being the notebook's
+        length in bytes
+
+    Raises:
+        ValueError: With a message that is safe to show to the user
+    """
+    notebooks = []
+    used_names = set()
+    remaining = max_bytes
+
+    def add(name, data):
+        nonlocal remaining
+        if len(notebooks) >= max_notebooks:
+            raise ValueError(f'Too many notebooks (maximum {max_notebooks} per batch)')
+        remaining -= len(data)
+        if remaining < 0:
+            raise ValueError('The uploaded notebooks are too large to convert in one batch')
+        safe_name = secure_filename(name) or 'notebook.nb'
+        notebooks.append((_unique_name(safe_name, used_names),
+                          data.decode('utf-8', errors='replace'), len(data)))
+
+    for upload in uploads:
+        filename = upload.filename or ''
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+        if extension == 'nb':
+            add(filename, upload.read())
+        elif extension == 'zip':
+            try:
+                with zipfile.ZipFile(upload.stream) as archive:
+                    for info in archive.infolist():
+                        member_name = os.path.basename(info.filename)
+                        if info.is_dir() or not member_name.lower().endswith('.nb'):
+                            continue
+                        if member_name.startswith('._'):
+                            continue  # macOS resource forks
+                        # Read at most one byte past the budget so zip bombs stop early
+                        with archive.open(info) as member:
+                            add(member_name, member.read(max(remaining, 0) + 1))
+            except zipfile.BadZipFile:
+                raise ValueError(f'{secure_filename(filename)} is not a valid ZIP archive')
+        elif filename:
+            raise ValueError('Invalid file type. Please upload .nb files or a .zip of notebooks')
+
+    return notebooks
+
+
+def _batch_executor():
+    """Return this process's pool for batch conversions, creating it on first use
+
+    Created lazily so a pre-forking server's master never starts worker
+    processes; the 'spawn' start method keeps the pool safe in threaded
+    servers. On a free-threaded interpreter (or with BATCH_EXECUTOR set to
+    'thread') the pool uses threads, so notebooks and outputs are not pickled.
+    """
+    import multiprocessing
+    app = current_app._get_current_object()
+    with _batch_executor_lock:
+        executor = app.extensions.get('batch_executor')
+        if executor is None:
+            executor = make_executor(
+                app.config['BATCH_WORKERS'],
+                app.config['BATCH_EXECUTOR'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            app.extensions['batch_executor'] = executor
+        return executor
+
+
+_batch_executor_lock = threading.Lock()
+
+
+def _timed_conversion(content, output_format):
+    """Run convert_notebook_content and also return how long it took
+
+    Module-level so the batch pool can run it; timing where the conversion
+    runs gives pooled and inline batches the same latency measurement.
+
+    Returns:
+        Tuple of (outputs, cell counts, seconds)
+    """
+    start = time.perf_counter()
+    outputs, cell_counts = convert_notebook_content(content, output_format)
+    return outputs, cell_counts, time.perf_counter() - start
+
+
+def _acquire_conversion_slot():
+    """Ask the admission controller for a conversion slot
+
+    Returns:
+        Tuple of (client, None) when admitted, or (client, response) with a
+        429 response carrying a Retry-After header when rejected
+    """
+    admission = current_app.extensions['admission']
+    client = request.remote_addr or 'unknown'
+
+    reason = admission.acquire(client)
+    if reason is None:
+        return client, None
+
+    if reason == 'client_limit':
+        message = 'You already have conversions in progress. Please wait for them to finish.'
+    else:
+        message = 'The server is busy. Please try again in a few seconds.'
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(current_app.config['ADMISSION_RETRY_AFTER'])
+    return client, response
+
+
+def _slot_releaser(client):
+    """Return a function that gives back client's conversion slot, only once
+
+    Streaming responses release their slot both when the stream ends and
+    when the response is closed, whichever comes first.
+    """
+    admission = current_app.extensions['admission']
+    lock = threading.Lock()
+    released = []
+
+    def release():
+        with lock:
+            if not released:
+                released.append(True)
+                admission.release(client)
+    return release
+
+
+def limit_conversions(view):
+    """Run a view only after the admission controller grants a slot
+
+    Rejected requests get a 429 response with a Retry-After header.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        client, rejection = _acquire_conversion_slot()
+        if rejection is not None:
+            return rejection
+
+        try:
+            return view(*args, **kwargs)
+        finally:
+            current_app.extensions['admission'].release(client)
+    return wrapper
+
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Render the main page"""
     return render_template('index.html')
 
 
-@app.route('/convert', methods=['POST'])
+@bp.route('/status')
+def status():
+    """Report conversion queue depth and admission counters"""
+    return jsonify(current_app.extensions['admission'].stats())
+
+
+@bp.route('/metrics')
+def metrics():
+    """Export conversion metrics in the Prometheus text format"""
+    return current_app.extensions['metrics'].render(), 200, {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'
+    }
+
+
+def _conversion_error(metrics, output_format, reason, message):
+    """Count a failed request and build its JSON response"""
+    metrics.errors.inc(format=output_format, reason=reason)
+    metrics.conversions.inc(format=output_format, status='failure')
+    return jsonify({'success': False, 'error': message})
+
+
+@bp.route('/convert', methods=['POST'])
+@limit_conversions
 def convert():
     """Handle file conversion request"""
+    metrics = current_app.extensions['metrics']
+    # Get output format
+    output_format = request.form.get('format', 'both')
+    if output_format not in OUTPUT_FORMATS:
+        return _conversion_error(metrics, 'invalid', 'invalid_format', 'Invalid output format')
+
     try:
         # Check if file was uploaded
         if 'file' not in request.files:
-            return jsonify({'success': False, 'error': 'No file uploaded'})
+            return _conversion_error(metrics, output_format, 'no_file', 'No file uploaded')
         
         file = request.files['file']
         
         # Check if file was selected
         if file.filename == '':
-            return jsonify({'success': False, 'error': 'No file selected'})
+            return _conversion_error(metrics, output_format, 'no_file', 'No file selected')
         
         # Check file extension
         if not allowed_file(file.filename):
-            return jsonify({'success': False, 'error': 'Invalid file type. Please upload a .nb file'})
+            return _conversion_error(metrics, output_format, 'invalid_type',
+                                     'Invalid file type. Please upload a .nb file')
         
-        # Get output format
-        output_format = request.form.get('format', 'both')
+        start = time.perf_counter()
+        data = file.read()
+        metrics.input_size.observe(len(data), format=output_format)
         
-        # Save uploaded file
         filename = secure_filename(file.filename)
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(input_path)
+        base_name = os.path.splitext(filename)[0]
         
         # Create output directory
-        output_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'output')
+        output_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'output')
         os.makedirs(output_dir, exist_ok=True)
         
-        # Perform conversion
-        converter = MathematicaConverter()
-        success, _ = converter.convert_file(input_path, output_format, output_dir)
+        cache = current_app.extensions['result_cache']
+        cache_key = (hashlib.sha256(data).hexdigest(), output_format)
+        outputs = cache.get(cache_key)
         
-        if success:
-            # Get base filename without extension
-            base_name = os.path.splitext(filename)[0]
+        if outputs is not None:
+            metrics.cache_hits.inc(format=output_format)
             
-            # Prepare file paths
-            files = {}
-            if output_format in ['latex', 'both']:
-                latex_file = os.path.join(output_dir, f"{base_name}.tex")
-                if os.path.exists(latex_file):
-                    with open(latex_file, 'r', encoding='utf-8') as f:
-                        files['latex'] = {
-                            'filename': f"{base_name}.tex",
-                            'content': f.read()
-                        }
+            # Recreate the output files so the download links work
+            for format_type, content in outputs.items():
+                output_file = os.path.join(output_dir, f"{base_name}{OUTPUT_EXTENSIONS[format_type]}")
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    f.write(content)
+        else:
+            metrics.cache_misses.inc(format=output_format)
             
-            if output_format in ['markdown', 'both']:
-                markdown_file = os.path.join(output_dir, f"{base_name}.md")
-                if os.path.exists(markdown_file):
-                    with open(markdown_file, 'r', encoding='utf-8') as f:
-                        files['markdown'] = {
-                            'filename': f"{base_name}.md",
-                            'content': f.read()
-                        }
+            # Save uploaded file
+            input_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            with open(input_path, 'wb') as f:
+                f.write(data)
             
-            # Don't expose internal file paths to users
-            return jsonify({
-                'success': True,
-                'message': 'Conversion successful!',
-                'files': files
-            })
-        else:
-            # Don't expose internal error details to users
-            return jsonify({'success': False, 'error': 'Conversion failed. Please check your file format and try again.'})
+            # Perform conversion
+            converter = MathematicaConverter()
+            success, _ = converter.convert_file(input_path, output_format, output_dir)
+            if not success:
+                # Don't expose internal error details to users
+                return _conversion_error(metrics, output_format, 'conversion_failed',
+                                         'Conversion failed. Please check your file format and try again.')
+            
+            for cell_type, count in converter.cell_counts.items():
+                metrics.cells.inc(count, format=output_format, cell_type=cell_type)
+            
+            outputs = {}
+            for format_type, extension in OUTPUT_EXTENSIONS.items():
+                if output_format in [format_type, 'both']:
+                    output_file = os.path.join(output_dir, f"{base_name}{extension}")
+                    if os.path.exists(output_file):
+                        with open(output_file, 'r', encoding='utf-8') as f:
+                            outputs[format_type] = f.read()
+            cache.put(cache_key, outputs)
+            
+            # Only real conversions go into the latency histogram
+            metrics.latency.observe(time.perf_counter() - start, format=output_format)
+        
+        files = {}
+        for format_type, content in outputs.items():
+            files[format_type] = {
+                'filename': f"{base_name}{OUTPUT_EXTENSIONS[format_type]}",
+                'content': content
+            }
+        
+        metrics.conversions.inc(format=output_format, status='success')
+        
+        # Don't expose internal file paths to users
+        return jsonify({
+            'success': True,
+            'message': 'Conversion successful!',
+            'files': files
+        })
             
     except Exception:
         # Don't expose stack trace details to users
-        return jsonify({'success': False, 'error': 'An error occurred during conversion. Please check your file and try again.'})
+        return _conversion_error(metrics, output_format, 'exception',
+                                 'An error occurred during conversion. Please check your file and try again.')
+
+
+@bp.route('/convert-ndjson', methods=['POST'])
+def convert_ndjson():
+    """Convert one notebook to newline-delimited JSON, streamed per cell
+
+    Each line is one cell's record, sent as soon as the cell is converted,
+    so the output is never held in memory as a whole.
+    """
+    metrics = current_app.extensions['metrics']
+    output_format = 'ndjson'
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return _conversion_error(metrics, output_format, 'no_file', 'No file uploaded')
+    if not allowed_file(file.filename):
+        return _conversion_error(metrics, output_format, 'invalid_type',
+                                 'Invalid file type. Please upload a .nb file')
+
+    # The slot is held for as long as the response streams
+    client, rejection = _acquire_conversion_slot()
+    if rejection is not None:
+        return rejection
+    release = _slot_releaser(client)
+
+    data = file.read()
+    metrics.input_size.observe(len(data), format=output_format)
+    converter = MathematicaConverter()
+    converter.content = data.decode('utf-8', errors='replace')
+    converter.file_size = len(data)
+
+    def generate():
+        start = time.perf_counter()
+        try:
+            yield from converter.iter_ndjson()
+        except Exception:
+            metrics.errors.inc(format=output_format, reason='exception')
+            metrics.conversions.inc(format=output_format, status='failure')
+            # The status line is already sent; end the stream with an error record
+            yield json.dumps({'error': 'An error occurred during conversion.'}) + '\n'
+            return
+        finally:
+            release()
+        metrics.latency.observe(time.perf_counter() - start, format=output_format)
+        metrics.conversions.inc(format=output_format, status='success')
+        for cell_type, count in converter.cell_counts.items():
+            metrics.cells.inc(count, format=output_format, cell_type=cell_type)
+
+    base_name = os.path.splitext(secure_filename(file.filename))[0] or 'notebook'
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename={base_name}.ndjson'
+    response.call_on_close(release)
+    return response
+
+
+@bp.route('/convert-batch', methods=['POST'])
+def convert_batch():
+    """Convert several notebooks (or ZIP archives of notebooks) at once
+
+    Notebooks are converted in parallel and the outputs are streamed back
+    as a ZIP archive, one member at a time as conversions finish.
+    """
+    metrics = current_app.extensions['metrics']
+    output_format = request.form.get('format', 'both')
+    if output_format not in OUTPUT_FORMATS:
+        return _conversion_error(metrics, 'invalid', 'invalid_format', 'Invalid output format')
+
+    uploads = [upload for upload in request.files.getlist('files') if upload.filename]
+    if not uploads:
+        return _conversion_error(metrics, output_format, 'no_file', 'No files uploaded')
+
+    # A batch holds one conversion slot for as long as it streams. The slot
+    # is taken before unzipping, so a rejected client costs no decompression
+    client, rejection = _acquire_conversion_slot()
+    if rejection is not None:
+        return rejection
+    release = _slot_releaser(client)
+
+    try:
+        notebooks = _collect_batch_notebooks(
+            uploads,
+            current_app.config['BATCH_MAX_NOTEBOOKS'],
+            current_app.config['BATCH_MAX_UNCOMPRESSED_BYTES']
+        )
+    except ValueError as e:
+        release()
+        return _conversion_error(metrics, output_format, 'invalid_batch', str(e))
+    except BaseException:
+        release()
+        raise
+    if not notebooks:
+        release()
+        return _conversion_error(metrics, output_format, 'no_file',
+                                 'No .nb files found in the upload')
+
+    use_pool = current_app.config['BATCH_WORKERS'] > 0
+    executor = _batch_executor() if use_pool else None
+
+    for _, _, size in notebooks:
+        metrics.input_size.observe(size, format=output_format)
+
+    def generate():
+        futures = {}
+        stream = _ZipStream()
+        try:
+            if use_pool:
+                futures = {
+                    executor.submit(_timed_conversion, content, output_format): name
+                    for name, content, _ in notebooks
+                }
+                completed = ((futures[future], future) for future in as_completed(futures))
+            else:
+                completed = ((name, content) for name, content, _ in notebooks)
+
+            failures = []
+            with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for name, result in completed:
+                    try:
+                        if use_pool:
+                            outputs, cell_counts, seconds = result.result()
+                        else:
+                            outputs, cell_counts, seconds = _timed_conversion(result, output_format)
+                    except Exception:
+                        failures.append(name)
+                        metrics.errors.inc(format=output_format, reason='exception')
+                        metrics.conversions.inc(format=output_format, status='failure')
+                        continue
+                    metrics.latency.observe(seconds, format=output_format)
+
+                    metrics.conversions.inc(format=output_format, status='success')
+                    for cell_type, count in cell_counts.items():
+                        metrics.cells.inc(count, format=output_format, cell_type=cell_type)
+
+                    base_name = os.path.splitext(name)[0]
+                    for format_type, content in outputs.items():
+                        archive.writestr(f"{base_name}{OUTPUT_EXTENSIONS[format_type]}", content)
+                        yield stream.drain()
 
+                if failures:
+                    archive.writestr('conversion_errors.txt',
+                                     'These notebooks could not be converted:\n' +
+                                     '\n'.join(failures) + '\n')
+            yield stream.drain()
+        finally:
+            # Stop queued conversions if the client went away mid-stream
+            for future in futures:
+                future.cancel()
+            release()
 
-@app.route('/download/<format_type>/<filename>')
+    response = Response(generate(), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=converted_notebooks.zip'
+    response.call_on_close(release)
+    return response
+
+
+@bp.route('/download/<format_type>/<filename>')
 def download(format_type, filename):
     """Download converted file"""
     try:
@@ -114,7 +721,7 @@ def download(format_type, filename):
         if format_type not in ['latex', 'markdown']:
             return "Invalid format type", 400
         
-        output_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'output')
+        output_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'output')
         file_path = os.path.join(output_dir, safe_filename)
         
         # Verify the path is within the output directory (prevent directory traversal)
@@ -131,7 +738,26 @@ def download(format_type, filename):
         return "An error occurred during download", 500
 
 
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    """Create the module's default app on first use of web_gui.app
+
+    Importing web_gui (as wsgi.py and run_gui.py do) then does not build an
+    application, with its upload folder, that may never be used.
+    """
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global app
+    with _app_lock:
+        if 'app' not in globals():
+            app = create_app()
+    return app
+
+
 if __name__ == '__main__':
     print("Starting Mathematica to LaTeX/Markdown Converter Web GUI...")
     print("Open your browser and navigate to: http://localhost:5000")
-    app.run(debug=False, host='127.0.0.1', port=5000)
+    print("(Development server - for production use: gunicorn -c gunicorn.conf.py wsgi:app)")
+    create_app().run(debug=False, host='127.0.0.1', port=5000)
@@ -0,0 +1,263 @@
+"""
+Mathematica to LaTeX/Markdown Converter - Web metrics
+Minimal in-process metrics rendered in the Prometheus text exposition format
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+
+# Conversion latency buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Uploaded notebook size buckets (bytes)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024,
+                4 * 1024 * 1024, 16 * 1024 * 1024)
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    """Escape a label value for the exposition format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Render a {name="value",...} label set"""
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    """Base class for a named metric with an optional fixed set of labels"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Turn a label mapping into the internal storage key"""
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        """Return the exposition lines for this metric"""
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.metric_type}']
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the counter for the given labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """Return a snapshot of the counts, keyed by label-value tuples"""
+        with self._lock:
+            return dict(self._values)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time
+
+    The callback returns a mapping of label-value tuples to numbers (or a
+    plain number for unlabeled gauges).
+    """
+
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable,
+                 labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._callback = callback
+
+    def _samples(self):
+        values = self._callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+
+
+class CounterFunction(Gauge):
+    """Counter whose values are read from a callback at scrape time"""
+
+    metric_type = 'counter'
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed bucket upper bounds"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float],
+                 labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts = {}
+        self._sums = {}
+
+    def observe(self, value: float, **labels):
+        """Record one observation"""
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] += value
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key])
+                           for key, counts in self._counts.items())
+        bucket_labels = self.label_names + ('le',)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                label_str = _format_labels(bucket_labels, key + (_format_value(bound),))
+                yield f'{self.name}_bucket{label_str} {cumulative}'
+            label_str = _format_labels(self.label_names, key)
+            yield f'{self.name}_sum{label_str} {_format_value(total)}'
+            yield f'{self.name}_count{label_str} {cumulative}'
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add a metric to the registry and return it"""
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, callback: Callable,
+              labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, callback, labels))
+
+    def counter_function(self, name: str, documentation: str, callback: Callable,
+                         labels: Sequence[str] = ()) -> CounterFunction:
+        return self.register(CounterFunction(name, documentation, callback, labels))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float],
+                  labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labels))
+
+    def render(self) -> str:
+        """Render every metric in the text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ConversionMetrics:
+    """The web GUI's conversion metrics, labeled by output format"""
+
+    def __init__(self, admission=None, result_cache=None):
+        self.registry = MetricsRegistry()
+        registry = self.registry
+
+        self.conversions = registry.counter(
+            'mtl_conversions_total', 'Conversions handled, by output format and result',
+            ('format', 'status'))
+        self.latency = registry.histogram(
+            'mtl_conversion_duration_seconds', 'Time spent converting a notebook',
+            LATENCY_BUCKETS, ('format',))
+        self.input_size = registry.histogram(
+            'mtl_input_size_bytes', 'Size of uploaded notebooks',
+            SIZE_BUCKETS, ('format',))
+        self.cache_hits = registry.counter(
+            'mtl_cache_hits_total', 'Conversions served from the result cache', ('format',))
+        self.cache_misses = registry.counter(
+            'mtl_cache_misses_total', 'Conversions not found in the result cache', ('format',))
+        registry.gauge(
+            'mtl_cache_hit_ratio', 'Fraction of conversions served from the result cache',
+            self._cache_hit_ratio, ('format',))
+        self.cells = registry.counter(
+            'mtl_cells_total', 'Converted cells, by output format and cell type',
+            ('format', 'cell_type'))
+        self.errors = registry.counter(
+            'mtl_errors_total', 'Failed conversion requests, by output format and reason',
+            ('format', 'reason'))
+
+        if result_cache is not None:
+            registry.gauge(
+                'mtl_cache_entries', 'Conversions currently held in the result cache',
+                lambda: len(result_cache))
+            registry.gauge(
+                'mtl_cache_bytes', 'Bytes of output currently held in the result cache',
+                lambda: result_cache.size_bytes)
+
+        if admission is not None:
+            registry.gauge(
+                'mtl_conversions_in_flight', 'Conversions currently running',
+                lambda: admission.stats()['in_flight'])
+            registry.gauge(
+                'mtl_conversions_queued', 'Conversion requests waiting for a slot (queue depth)',
+                lambda: admission.stats()['queued'])
+            registry.gauge(
+                'mtl_conversions_queued_peak', 'Highest queue depth seen since start',
+                lambda: admission.stats()['peak_queued'])
+            registry.counter_function(
+                'mtl_admission_rejected_total', 'Requests rejected with 429, by reason',
+                lambda: {(reason,): count
+                         for reason, count in admission.stats()['rejected_total'].items()},
+                ('reason',))
+
+    def _cache_hit_ratio(self):
+        """Compute the hit ratio for every format seen so far"""
+        hits = self.cache_hits.values()
+        misses = self.cache_misses.values()
+        ratios = {}
+        for key in set(hits) | set(misses):
+            total = hits.get(key, 0) + misses.get(key, 0)
+            ratios[key] = hits.get(key, 0) / total if total else 0
+        return ratios
+
+    def render(self) -> str:
+        """Render all conversion metrics"""
+        return self.registry.render()
@@ -0,0 +1,31 @@
+"""
+Mathematica to LaTeX/Markdown Converter - Production WSGI entry point
+
+Serve the web GUI with a production WSGI server instead of the Flask
+development server, for example:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    waitress-serve --listen=127.0.0.1:8000 wsgi:app
+
+Importing this module builds the converter state (compiled patterns and
+symbol tables) once. With gunicorn's ``preload_app`` this happens in the
+master process, so forked workers share it copy-on-write.
+"""
+
+import gc
+import os
+
+import mathematica_converter
+from web_gui import create_app
+
+mathematica_converter.warm_up()
+
+# Behind a reverse proxy (or for load tests that simulate many clients),
+# identify clients by the X-Forwarded-For header of this many proxies
+app = create_app({'TRUSTED_PROXIES': int(os.environ.get('MTL_TRUSTED_PROXIES', 0))})
+
+# Move everything allocated so far into the permanent generation, so the
+# garbage collector in forked workers never writes to (and copies) the
+# pages holding the shared converter state
+if hasattr(gc, 'freeze'):
+    gc.freeze()